@@ -1,62 +1,140 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+"""
+Merge per-run dataset artifacts (trainN / valN / pairsN.jsonl, N = 1..artifact_num) into
+train.jsonl / val.jsonl / pairs.jsonl, deduplicating each split.
+
+Streams: every input line is parsed once and written through as-is, in artifact order, so memory
+holds only the dedupe index - a 16-byte digest per unique row, kept in a set or, with
+--disk_dedupe for inputs whose index would not fit, in an SQLite table. Outputs are written to
+*.tmp and renamed once complete. Missing artifacts and unparseable lines are skipped and counted.
+"""
 
 import argparse
-import hashlib
-import json
+import os
+import sqlite3
+import tempfile
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-from synth.utils.json_utils import canonical_json, norm_text
+from typing import Dict, Iterator, Optional, Tuple
+
+from synth.dedupe import dedupe_key
+from synth.utils.json_utils import loads
+
+# split name -> (input key, output key) of the dedupe key
+SPLITS = {
+    "train": ("input", "output"),
+    "val": ("input", "output"),
+    "pairs": ("prompt", "chosen"),
+}
+
+class MemorySeen:
+    """Set of 16-byte digests."""
+    def __init__(self):
+        self._seen = set()
+
+    def add(self, key: bytes) -> bool:
+        """True if `key` was not seen before."""
+        n = len(self._seen)
+        self._seen.add(key)
+        return len(self._seen) != n
+
+    def close(self):
+        self._seen = set()
+
+class DiskSeen:
+    """The same on SQLite, for inputs whose unique rows do not fit in memory."""
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE IF NOT EXISTS seen (key BLOB PRIMARY KEY) WITHOUT ROWID")
+        self._db.execute("BEGIN")
+        self._pending = 0
+
+    def add(self, key: bytes) -> bool:
+        cur = self._db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (key,))
+        self._pending += 1
+        if self._pending >= 50000:
+            self._db.execute("COMMIT")
+            self._db.execute("BEGIN")
+            self._pending = 0
+        return cur.rowcount == 1
+
+    def close(self):
+        self._db.execute("COMMIT")
+        self._db.close()
+        os.unlink(self.path)
+
+def iter_rows(paths, counts: Dict[str, int]) -> Iterator[Tuple[str, dict]]:
+    """(raw line, parsed row) over the artifacts in order; counts missing files and bad lines."""
+    for p in paths:
+        if not p.exists():
+            print(f"missing artifact: {p}")
+            counts["missing_files"] += 1
+            continue
+        with p.open("r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                counts["read"] += 1
+                try:
+                    row = loads(line)
+                except ValueError:
+                    counts["bad"] += 1
+                    continue
+                yield line if line.endswith("\n") else line + "\n", row
 
-def dedupe(pairs: List[Dict[str, Any]], input_kw: str = "input", output_kw: str = "output"):
-    seen, out = set(), []
-    for ex in pairs:
-        key = hashlib.sha256((norm_text(json.loads(ex)[input_kw])+"|"+canonical_json(json.loads(ex)[output_kw])).encode()).hexdigest()
-        if key not in seen:
-            out.append(ex); seen.add(key)
-    return out
+def merge_split(workdir: Path, out_dir: Path, split: str, num_artifacts: int,
+                disk_dir: Optional[str] = None) -> Dict[str, int]:
+    ik, ok = SPLITS[split]
+    counts = {"read": 0, "bad": 0, "missing_fields": 0, "duplicates": 0, "written": 0, "missing_files": 0}
+    paths = [workdir / f"{split}{i + 1}.jsonl" for i in range(num_artifacts)]
+    if disk_dir is not None:
+        fd, db_path = tempfile.mkstemp(prefix=f"unite_{split}_", suffix=".sqlite", dir=disk_dir)
+        os.close(fd)
+        seen = DiskSeen(db_path)
+    else:
+        seen = MemorySeen()
+    out = out_dir / f"{split}.jsonl"
+    tmp = out.with_name(out.name + ".tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            for line, row in iter_rows(paths, counts):
+                if not isinstance(row, dict) or ik not in row or ok not in row:
+                    counts["missing_fields"] += 1
+                    continue
+                if not seen.add(dedupe_key({"input": row[ik], "output": row[ok]})[:16]):
+                    counts["duplicates"] += 1
+                    continue
+                f.write(line)
+                counts["written"] += 1
+        os.replace(tmp, out)
+    finally:
+        seen.close()
+        if tmp.exists():
+            tmp.unlink()
+    return counts
 
 def main():
     ap = argparse.ArgumentParser(description="Aggregate separate train and validation datasets into a single dataset.")
     ap.add_argument("--workdir", required=True, help="Path to dataset directory")
     ap.add_argument("--artifact_num", required=True, help="Artifact quantity to be aggregated")
+    ap.add_argument("--out_dir", default=None, help="Where to write the merged splits (default: --workdir)")
+    ap.add_argument("--disk_dedupe", nargs="?", const="", default=None, metavar="DIR",
+                    help="Keep the dedupe index in SQLite (in DIR, default the system temp dir) instead of memory")
     args = ap.parse_args()
 
     workdir = Path(args.workdir)
+    out_dir = Path(args.out_dir) if args.out_dir else workdir
+    out_dir.mkdir(parents=True, exist_ok=True)
     num_artifacts = int(args.artifact_num)
+    disk_dir = None if args.disk_dedupe is None else (args.disk_dedupe or tempfile.gettempdir())
 
-    train_buffer = []
-    validate_buffer = []
-    pairs_buffer = []
-
-    for i in range(num_artifacts):
-        input_path = workdir / f"train{i+1}.jsonl"
-        with input_path.open("r", encoding="utf-8") as f:
-            dataset_content = list(f)
-            print("train last row:", dataset_content[:-1])
-            train_buffer.extend(dataset_content)
-
-        input_path = workdir / f"val{i+1}.jsonl"
-        with input_path.open("r", encoding="utf-8") as f:
-            dataset_content = list(f)
-            print("val last row:", dataset_content[:-1])
-            validate_buffer.extend(dataset_content)
-
-        input_path = workdir / f"pairs{i+1}.jsonl"
-        with input_path.open("r", encoding="utf-8") as f:
-            dataset_content = list(f)
-            print("pairs last row:", dataset_content[:-1])
-            pairs_buffer.extend(dataset_content)
-
-    print(f"Buffers lens before dedupe: train %s, validate %s, pairs %s", len(train_buffer), len(validate_buffer), len(pairs_buffer))
-    train_buffer = dedupe(train_buffer, input_kw="input", output_kw="output")
-    validate_buffer = dedupe(validate_buffer, input_kw="input", output_kw="output")
-    pairs_buffer = dedupe(pairs_buffer, input_kw="prompt", output_kw="chosen")
-    print("Buffers lens after dedupe: train %s, validate %s, pairs %s", len(train_buffer), len(validate_buffer), len(pairs_buffer))
-
-    (workdir/"train.jsonl").write_text("".join(x for x in train_buffer), encoding="utf-8")
-    (workdir/"val.jsonl").write_text("".join(x for x in validate_buffer), encoding="utf-8")
-    (workdir/"pairs.jsonl").write_text("".join(x for x in pairs_buffer), encoding="utf-8")
+    for split in SPLITS:
+        c = merge_split(workdir, out_dir, split, num_artifacts, disk_dir)
+        print(f"{split}: read {c['read']}, wrote {c['written']}, duplicates {c['duplicates']}, "
+              f"unparseable {c['bad']}, missing fields {c['missing_fields']}, missing files {c['missing_files']}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+import hashlib, json, logging, os, pathlib, time, uuid
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from synth.utils.json_utils import canonical_json
+from synth.utils.debug import JsonlSink
+
+LOG = logging.getLogger("synth.checkpoint")
+
+def seed_key(seed: dict) -> str:
+    return hashlib.sha1(canonical_json(seed).encode("utf-8")).hexdigest()[:16]
+
+def config_digest(cfg: dict) -> str:
+    return hashlib.sha1(canonical_json(cfg).encode("utf-8")).hexdigest()[:12]
+
+def _iter_jsonl(path: pathlib.Path):
+    if not path.exists():
+        return
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # torn last line after a crash
+                LOG.warning("skipping unreadable checkpoint line in %s", path)
+
+class RunCheckpoint:
+    """
+    Run manifest + per-seed checkpoints in the debug dir.
+
+      manifest.json     run_id, config digest, status and counters (rewritten atomically)
+      seeds_done.jsonl  {"run_id","session","seed","ok","fail"} once all of a seed's compiles finished
+
+    ok/fail records are tagged with run_id, session and seed key. On resume only records
+    whose (seed, session) matches a seeds_done entry are replayed, so partial work from
+    a seed interrupted by a crash is ignored and that seed is redone. Restoring reads
+    the JSONL checkpoints once and makes no LLM calls.
+    """
+    def __init__(self, debug_dir: pathlib.Path, cfg: dict, flush_every: int = 50):
+        self.debug_dir = pathlib.Path(debug_dir)
+        self.manifest_path = self.debug_dir / "manifest.json"
+        self.done_path = self.debug_dir / "seeds_done.jsonl"
+        self.ok_path = self.debug_dir / "ok.jsonl"
+        self.fail_path = self.debug_dir / "fail.jsonl"
+        self.config_digest = config_digest(cfg)
+        self.flush_every = flush_every
+        self.session = uuid.uuid4().hex[:8]
+        self.manifest: Dict[str, Any] = {}
+        self.done: Set[str] = set()
+        self._done_sink: Optional[JsonlSink] = None
+
+    @property
+    def run_id(self) -> str:
+        return self.manifest["run_id"]
+
+    def _read_manifest(self) -> Optional[dict]:
+        if not self.manifest_path.exists():
+            return None
+        return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+
+    def write_manifest(self, **fields):
+        self.manifest.update(fields, updated=time.time())
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+    def start(self, resume: bool, seeds_total: int):
+        prev = self._read_manifest() if resume else None
+        if resume and prev is None:
+            LOG.warning("--resume given but no manifest at %s; starting a new run", self.manifest_path)
+        if prev is not None:
+            if prev.get("config_digest") != self.config_digest:
+                LOG.warning("config changed since run %s was started (%s -> %s)",
+                            prev["run_id"], prev.get("config_digest"), self.config_digest)
+            self.manifest = prev
+            self.manifest.setdefault("sessions", []).append(self.session)
+        else:
+            self.manifest = {
+                "run_id": uuid.uuid4().hex[:12],
+                "config_digest": self.config_digest,
+                "created": time.time(),
+                "sessions": [self.session],
+            }
+        self.write_manifest(status="running", seeds_total=seeds_total)
+        self._done_sink = JsonlSink(self.done_path.as_posix(), self.flush_every)
+
+    def restore(self, emit: Callable[[Dict[str, Any]], None]) -> Tuple[int, int]:
+        """Streams restored ok records of this run to `emit`; returns (compile_ok, compile_fail)."""
+        done_sessions: Dict[str, str] = {}
+        for rec in _iter_jsonl(self.done_path):
+            if rec.get("run_id") == self.run_id:
+                done_sessions[rec["seed"]] = rec["session"]
+        self.done = set(done_sessions)
+
+        def ours(rec):
+            return rec.get("run_id") == self.run_id and done_sessions.get(rec.get("seed")) == rec.get("session")
+
+        ok = 0
+        for rec in _iter_jsonl(self.ok_path):
+            if ours(rec):
+                emit(rec)
+                ok += 1
+        fail = sum(1 for rec in _iter_jsonl(self.fail_path) if ours(rec))
+        if self.done:
+            LOG.info("resume: run=%s seeds_done=%d restored ok=%d fail=%d",
+                     self.run_id, len(self.done), ok, fail)
+        return ok, fail
+
+    def tag(self, rec: Dict[str, Any], seed: dict) -> Dict[str, Any]:
+        rec.update(run_id=self.run_id, session=self.session, seed=seed_key(seed))
+        return rec
+
+    def mark_seed_done(self, seed: dict, n_ok: int, n_fail: int, sinks=()):
+        # records of the seed must be durable before the seed counts as done
+        for sink in sinks:
+            sink.flush()
+        key = seed_key(seed)
+        self._done_sink.write({"run_id": self.run_id, "session": self.session, "seed": key,
+                               "ok": n_ok, "fail": n_fail})
+        self._done_sink.flush()
+        self.done.add(key)
+
+    def close(self, status: str, **counters):
+        self.write_manifest(status=status, seeds_done=len(self.done), **counters)
+        if self._done_sink is not None:
+            self._done_sink.close()
@@ -1,12 +1,17 @@
-import copy, logging
+import asyncio, copy, logging
 from datetime import datetime, timezone
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
 
 from synth.prompts import SYSTEM_PLANNER, USER_COMPILE_TMPL, USER_SABOTAGER_TMPL, SYSTEM_CRITIC, SYSTEM_SABOTAGER, USER_CRITIC_TMPL, FEWSHOTS_TEXT
 from synth.utils.json_utils import extract_json_block
 from synth.utils.contracts import schema_summary
 from synth.utils.semantic_validate import semantic_validate_workflow
-from synth.utils.errors import SynthesisError
+from synth.utils.schema_validator import validate_schema
+from synth.utils.errors import SynthesisError, Diagnostic
+from synth.utils.diagnostics import collect_workflow_errors, format_diagnostics
+from synth.utils.stream_guard import StreamAbort, aguarded_chat
+from synth.negatives import NegativeSampler
+from synth.providers.cache import uncached
 
 LOG = logging.getLogger("synth.compile")
 
@@ -30,70 +35,100 @@ def _coerce_aliases_and_normalize(obj: dict) -> dict:
             s0["schedule"] = sch
     return object
 
+NUDGE_SYSTEM = "Return the SAME content as STRICT JSON only, wrapped in <json> and </json>. No prose."
+NUDGE_USER = "Reformat your previous answer."
+
 def build_user_prompt(request: str) -> str:
     return USER_COMPILE_TMPL.format(fewshots=FEWSHOTS_TEXT, request=request)
 
-def compile_once(client, request: str, temperature: float, top_p: float) -> str:
-    user = USER_SABOTAGER_TMPL.format(
+# the template text around {request}, used to recover the request from a stored DPO prompt
+_REQUEST_HEAD = USER_COMPILE_TMPL.split("{request}")[0].split("{fewshots}")[-1]
+_REQUEST_TAIL = USER_COMPILE_TMPL.split("{request}")[1]
+
+def request_from_prompt(prompt: str) -> str:
+    """The request a `build_user_prompt` prompt was built from; other text is returned unchanged."""
+    i = prompt.rfind(_REQUEST_HEAD)
+    if i < 0 or not prompt.endswith(_REQUEST_TAIL):
+        return prompt
+    return prompt[i + len(_REQUEST_HEAD):len(prompt) - len(_REQUEST_TAIL)]
+
+def _sabotage_prompt(request: str) -> str:
+    return USER_SABOTAGER_TMPL.format(
         fewshots=FEWSHOTS_TEXT,
         request=request
     )
-    return client.chat(SYSTEM_SABOTAGER, user, temperature=temperature, top_p=top_p)
+
+def compile_once(client, request: str, temperature: float, top_p: float) -> str:
+    return client.chat(SYSTEM_SABOTAGER, _sabotage_prompt(request), temperature=temperature, top_p=top_p)
+
+async def acompile_once(client, request: str, temperature: float, top_p: float) -> str:
+    return await client.achat(SYSTEM_SABOTAGER, _sabotage_prompt(request), temperature=temperature, top_p=top_p)
+
+def _reject_reason(rejected_raw: str, schema: dict):
+    """Returns (parsed_obj_or_None, reason) if the sabotaged output fails validation, else None."""
+    obj2 = None
+    try:
+        rejected = extract_json_block(rejected_raw)
+        rejected = _coerce_aliases_and_normalize(rejected)
+        obj2 = rejected
+        validate_schema(rejected, schema)
+        semantic_validate_workflow(rejected)
+    except (ValidationError, AssertionError, ValueError) as e:
+        return obj2, str(e)
+    return None
+
+def _validate(raw: str, schema: dict):
+    """
+    (workflow, []) if `raw` holds a valid workflow, else (None, diagnostics): every schema +
+    semantic violation, from the same single validation pass. The first diagnostic is the
+    error first-error validation would report.
+    """
+    try:
+        obj = _coerce_aliases_and_normalize(extract_json_block(raw))
+    except ValueError as e:
+        return None, [Diagnostic("json", "", str(e))]
+    diagnostics = collect_workflow_errors(obj, schema)
+    return (None if diagnostics else obj), diagnostics
+
+def _compile_failed(request: str, raw: str, diagnostics: list, debug_sink=None):
+    err = diagnostics[0].message
+    LOG.warning("compile failed, %d violation(s):\n%s", len(diagnostics), format_diagnostics(diagnostics))
+    diagnostics = [d._asdict() for d in diagnostics]
+    if debug_sink: debug_sink.write({"stage":"compile_fail","request":request,"error":err,
+                                     "diagnostics":diagnostics,"raw_preview":raw[:400]})
+    return SynthesisError(err, raw=raw, diagnostics=diagnostics)
 
 def compile_with_repair(client, request: str, schema: dict, allow_ids: set, temperature: float, top_p: float,
-                        max_repair_attempts: int = 1, debug_sink=None):
+                        max_repair_attempts: int = 1, debug_sink=None, negatives=None):
+    negatives = negatives or NegativeSampler()
     user_prompt = build_user_prompt(request)
     raw = client.chat(SYSTEM_PLANNER, user_prompt, temperature=temperature, top_p=top_p)
     LOG.info("Raw gen: %s", raw)
     if "<json>" not in raw.lower():
     # quick format nudge (no semantic change)
-        nudged = client.chat(
-            "Return the SAME content as STRICT JSON only, wrapped in <json> and </json>. No prose.",
-            "Reformat your previous answer.",
-            temperature=0.0, top_p=1.0
-        )
+        nudged = uncached(client).chat(NUDGE_SYSTEM, NUDGE_USER, temperature=0.0, top_p=1.0)
         if "<json>" in nudged.lower():
             raw = nudged
 
     LOG.info("extracted: %s", raw)
-    try:
-        obj = extract_json_block(raw)
-        obj = _coerce_aliases_and_normalize(obj)
-        obj2 = None
-        reason = None
-        validate(instance=obj, schema=schema)
-        semantic_validate_workflow(obj)
+    obj, diagnostics = _validate(raw, schema)
+    if obj is not None:
         if debug_sink:
             debug_sink.write({"stage":"compile_ok","request":request,"raw_len":len(raw)})
 
-        while True:
-            try:
-                rejected = compile_once(client, request, temperature=0.3, top_p=0.3)
-                rejected = extract_json_block(rejected)
-                rejected = _coerce_aliases_and_normalize(rejected)
-                obj2 = rejected
-                validate(instance=rejected, schema=schema)
-                semantic_validate_workflow(rejected)
-
-            except (ValidationError, AssertionError, ValueError) as e:
-                err = str(e)
-                if debug_sink:
-                    debug_sink.write({"stage":"compile_rejected","request":request})
-                reason = err
-                break
+        neg = negatives.sample(client, request, obj, schema, debug_sink=debug_sink)
 
         dpo_obj = {
             "chosen": obj,
-            "rejected": obj2,
-            "reason": reason,
-            "prompt": user_prompt
+            "rejected": neg["rejected"],
+            "reason": neg["reason"],
+            "prompt": user_prompt,
+            "negative": {k: v for k, v in neg.items() if k not in ("rejected", "reason")}
         }
         return dpo_obj
-    except (ValidationError, AssertionError, ValueError) as e:
-        err = str(e)
-        if debug_sink: debug_sink.write({"stage":"compile_fail","request":request,"error":err,"raw_preview":raw[:400]})
+    else:
         # for attempt in range(max_repair_attempts):
-        #     crit_user = USER_CRITIC_TMPL.format(request=request, candidate=raw, errors=err)
+        #     crit_user = USER_CRITIC_TMPL.format(request=request, candidate=raw, errors=format_diagnostics(diagnostics))
         #     repaired = client.chat(SYSTEM_CRITIC, crit_user, temperature=0.1, top_p=0.9)
         #     try:
         #         obj2 = extract_json_block(repaired)
@@ -112,4 +147,48 @@ def compile_with_repair(client, request: str, schema: dict, allow_ids: set, temp
         #             debug_sink.write({"stage":"repair_fail","request":request,"attempt":attempt+1,
         #                               "error":err, "repaired_preview": repaired[:400]})
         #         raw = repaired
-        raise SynthesisError(err, raw=raw)
+        raise _compile_failed(request, raw, diagnostics, debug_sink)
+
+async def acompile_with_repair(client, request: str, schema: dict, allow_ids: set, temperature: float, top_p: float,
+                               max_repair_attempts: int = 1, debug_sink=None, negatives=None,
+                               stream_guard: bool = False):
+    """
+    Async variant of `compile_with_repair` for clients exposing `achat`.
+    Same prompts, validation and debug events; raises SynthesisError on failure.
+    With `stream_guard`, the planner response is streamed and cancelled as soon as it is certain
+    to fail validation (the SynthesisError is then raised `from` the StreamAbort).
+    """
+    negatives = negatives or NegativeSampler()
+    user_prompt = build_user_prompt(request)
+    if stream_guard:
+        try:
+            raw = await aguarded_chat(client, SYSTEM_PLANNER, user_prompt, temperature=temperature, top_p=top_p)
+        except StreamAbort as e:
+            if debug_sink:
+                debug_sink.write({"stage":"compile_abort","request":request,"rule":e.diagnostic.rule,
+                                  "pointer":e.diagnostic.pointer,"chars":len(e.text)})
+            raise _compile_failed(request, e.text, [e.diagnostic], debug_sink) from e
+    else:
+        raw = await client.achat(SYSTEM_PLANNER, user_prompt, temperature=temperature, top_p=top_p)
+    LOG.info("Raw gen: %s", raw)
+    if "<json>" not in raw.lower():
+        nudged = await uncached(client).achat(NUDGE_SYSTEM, NUDGE_USER, temperature=0.0, top_p=1.0)
+        if "<json>" in nudged.lower():
+            raw = nudged
+
+    # validation is CPU-bound; keep it off the event loop so other requests progress
+    obj, diagnostics = await asyncio.to_thread(_validate, raw, schema)
+    if obj is None:
+        raise _compile_failed(request, raw, diagnostics, debug_sink)
+    if debug_sink:
+        debug_sink.write({"stage":"compile_ok","request":request,"raw_len":len(raw)})
+
+    neg = await negatives.asample(client, request, obj, schema, debug_sink=debug_sink)
+
+    return {
+        "chosen": obj,
+        "rejected": neg["rejected"],
+        "reason": neg["reason"],
+        "prompt": user_prompt,
+        "negative": {k: v for k, v in neg.items() if k not in ("rejected", "reason")}
+    }
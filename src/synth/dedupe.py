@@ -1,11 +1,219 @@
-import hashlib
-from typing import Dict, Any, List
-from synth.utils.json_utils import canonical_json, norm_text
-
-def dedupe(pairs: List[Dict[str, Any]]):
-    seen, out = set(), []
-    for ex in pairs:
-        key = hashlib.sha256((norm_text(ex["input"])+"|"+canonical_json(ex["output"])).encode()).hexdigest()
-        if key not in seen:
-            out.append(ex); seen.add(key)
-    return out
+"""
+Exact and near-duplicate filtering of (input, output) examples.
+
+Deduper drops exact repeats of norm_text(input)|workflow_fingerprint(output), i.e. ignoring
+step ids and stamped schedule dates. NearDeduper then drops an example whose output has the same
+structural shape as an earlier kept one and whose input is a near-paraphrase of it: estimated
+Jaccard similarity of the character-shingle sets at or above `threshold`. Inputs are sketched with one-permutation MinHash (each shingle hashed once,
+empty bins filled by rotation) and candidates are found through LSH banding, so an add costs
+O(len(input) + num_perm) and a run is linear in the number of examples.
+"""
+import hashlib, zlib
+from array import array
+from operator import eq
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from synth.utils.json_utils import canonical_json, norm_text, workflow_fingerprint
+
+def dedupe_key(ex: Dict[str, Any]) -> bytes:
+    return hashlib.sha256(norm_text(ex["input"]).encode() + b"|" + workflow_fingerprint(ex["output"])).digest()
+
+class Deduper:
+    """Streaming exact dedupe; keeps a 16-byte digest per unique example."""
+    def __init__(self):
+        self.seen = set()
+        self.total = 0
+
+    def add(self, ex: Dict[str, Any]) -> bool:
+        """Returns True the first time an example is seen."""
+        self.total += 1
+        key = dedupe_key(ex)[:16]
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+    @property
+    def removed(self) -> int:
+        return self.total - len(self.seen)
+
+_M32 = (1 << 32) - 1
+_EMPTY = 1 << 32
+_MIX = 0x9E3779B1             # multiplicative mix: spreads crc32's low bits over the bins
+_ROTATE = 0x9E3779B97F4A7C15  # odd offset per bin of rotation distance
+
+def _h64(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+def shingles(text: str, k: int = 5) -> Set[str]:
+    """Character k-grams of norm_text(text); a shorter text is its own single shingle."""
+    t = norm_text(text)
+    if len(t) <= k:
+        return {t}
+    return {t[i:i + k] for i in range(len(t) - k + 1)}
+
+def minhash(text: str, num_perm: int = 128, k: int = 5) -> array:
+    """One-permutation MinHash signature (num_perm 32-bit values) of the input's shingles."""
+    sig = [_EMPTY] * num_perm
+    for sh in shingles(text, k):
+        h = (zlib.crc32(sh.encode("utf-8")) * _MIX) & _M32
+        b = h % num_perm
+        v = h // num_perm
+        if v < sig[b]:
+            sig[b] = v
+    # rotation densification: an empty bin borrows the next non-empty bin to its right
+    if _EMPTY in sig:
+        dense = list(sig)
+        nxt = 0
+        for i in range(2 * num_perm - 1, -1, -1):  # two laps right-to-left: wraps around
+            j = i % num_perm
+            if sig[j] != _EMPTY:
+                nxt = j
+            elif i < num_perm:
+                dense[j] = sig[nxt] + _ROTATE * ((nxt - j) % num_perm)
+        sig = dense
+    return array("I", (v & _M32 for v in sig))
+
+def similarity(a: array, b: array) -> float:
+    """Jaccard estimate: fraction of equal signature positions."""
+    return sum(map(eq, a, b)) / len(a)
+
+def lsh_params(threshold: float, num_perm: int, fn_weight: float = 0.9) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands * rows == num_perm minimizing the weighted false-positive and
+    false-negative mass around `threshold`. Candidates are verified against the signature, so a
+    false positive only costs a comparison and misses are weighted higher by default.
+    """
+    def integral(f, lo, hi, n=200):
+        step = (hi - lo) / n
+        return sum(f(lo + (i + 0.5) * step) for i in range(n)) * step
+    best, best_err = (1, num_perm), float("inf")
+    for b in range(1, num_perm + 1):
+        if num_perm % b:
+            continue
+        r = num_perm // b
+        fp = integral(lambda s: 1 - (1 - s ** r) ** b, 0.0, threshold)
+        fn = integral(lambda s: (1 - s ** r) ** b, threshold, 1.0)
+        err = (1 - fn_weight) * fp + fn_weight * fn
+        if err < best_err:
+            best, best_err = (b, r), err
+    return best
+
+def _shape_tokens(steps: List[Any], out: List[str]):
+    for s in steps:
+        if not isinstance(s, dict):
+            out.append("?")
+            continue
+        wst = s.get("workflowStepType")
+        out.append(f"{wst}:{s.get('actionType', s.get('triggerSubType'))}")
+        if wst == 2:
+            out.extend(f"r:{r.get('propertyId')}:{r.get('operator')}" for r in s.get("rules") or () if isinstance(r, dict))
+            out.append("+[")
+            _shape_tokens(s.get("positiveOutcome") or [], out)
+            out.append("]-[")
+            _shape_tokens(s.get("negativeOutcome") or [], out)
+            out.append("]")
+
+def shape_key(wf: Any) -> int:
+    """
+    Hash of a workflow's structure: step kinds, action/trigger types, rule properties and
+    operators and branch nesting, in traversal order. Names, parameters and ids are ignored.
+    """
+    steps = wf.get("workflowSteps", wf.get("Steps")) if isinstance(wf, dict) else None
+    if not isinstance(steps, list):
+        return _h64(canonical_json(wf))
+    out: List[str] = []
+    _shape_tokens(steps, out)
+    return _h64("|".join(out))
+
+class NearDeduper:
+    """
+    Streaming near-duplicate filter (see module docstring). Memory per kept example is one
+    signature plus `bands` bucket entries; buckets stop growing at MAX_BUCKET entries so
+    repetitive inputs cannot make lookups quadratic.
+    """
+    MAX_BUCKET = 32
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle: int = 5, bands: Optional[int] = None):
+        if bands is None:
+            bands = lsh_params(threshold, num_perm)[0]
+        if num_perm % bands:
+            raise ValueError(f"bands={bands} must divide num_perm={num_perm}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets: Dict[int, Any] = {}   # band key -> example index, or list of indices
+        self.sigs: List[array] = []
+        self.shapes = array("Q")
+        self.total = 0
+        self.removed = 0
+
+    @classmethod
+    def from_config(cls, cfg: Optional[dict]) -> Optional["NearDeduper"]:
+        """None unless the config turns near-dedupe on (`near: true`); configs without it keep exact dedupe only."""
+        cfg = cfg or {}
+        if not cfg.get("near", False):
+            return None
+        return cls(threshold=float(cfg.get("threshold", 0.8)), num_perm=int(cfg.get("num_perm", 128)),
+                   shingle=int(cfg.get("shingle", 5)), bands=cfg.get("bands"))
+
+    def _keys(self, shape: int, sig: array) -> List[int]:
+        r = self.rows
+        return [hash((shape, i) + tuple(sig[i * r:(i + 1) * r])) for i in range(self.bands)]
+
+    def find(self, text: str, output: Any) -> Optional[int]:
+        """Index (in add order) of a kept example that (text, output) duplicates, else None."""
+        return self._find(shape_key(output), minhash(text, self.num_perm, self.shingle))[0]
+
+    def _find(self, shape: int, sig: array):
+        keys = self._keys(shape, sig)
+        checked = set()
+        for key in keys:
+            hit = self.buckets.get(key)
+            if hit is None:
+                continue
+            for j in (hit if isinstance(hit, list) else (hit,)):
+                if j in checked:
+                    continue
+                checked.add(j)
+                if self.shapes[j] == shape and similarity(self.sigs[j], sig) >= self.threshold:
+                    return j, keys
+        return None, keys
+
+    def _insert(self, shape: int, sig: array, keys: List[int]) -> int:
+        idx = len(self.sigs)
+        self.sigs.append(sig)
+        self.shapes.append(shape)
+        for key in keys:
+            hit = self.buckets.get(key)
+            if hit is None:
+                self.buckets[key] = idx
+            elif not isinstance(hit, list):
+                self.buckets[key] = [hit, idx]
+            elif len(hit) < self.MAX_BUCKET:
+                hit.append(idx)
+        return idx
+
+    def index(self, text: str, output: Any) -> int:
+        """Indexes (text, output) unconditionally, e.g. every row of a reference split; returns its index."""
+        shape = shape_key(output)
+        sig = minhash(text, self.num_perm, self.shingle)
+        return self._insert(shape, sig, self._keys(shape, sig))
+
+    def add(self, ex: Dict[str, Any]) -> bool:
+        """Returns True (and indexes the example) unless it near-duplicates a kept one."""
+        self.total += 1
+        shape = shape_key(ex["output"])
+        sig = minhash(ex["input"], self.num_perm, self.shingle)
+        dup, keys = self._find(shape, sig)
+        if dup is not None:
+            self.removed += 1
+            return False
+        self._insert(shape, sig, keys)
+        return True
+
+def dedupe(pairs: List[Dict[str, Any]], near: Optional[NearDeduper] = None):
+    d = Deduper()
+    return [ex for ex in pairs if d.add(ex) and (near is None or near.add(ex))]
@@ -0,0 +1,247 @@
+import asyncio, logging, math, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from synth.seeds import verbalize_seed
+from synth.paraphrase import aparaphrases, VIEW_ROLES
+from synth.compile_wfl import acompile_with_repair
+from synth.utils.stream_guard import StreamAbort
+
+LOG = logging.getLogger("synth.engine")
+
+DEFAULT_CONCURRENCY = 4
+
+
+def concurrency_for(cfg: dict) -> int:
+    """
+    Per-provider request concurrency from the `concurrency` config block, e.g.
+        concurrency: {openai: 16, bedrock: 8, default: 4}
+    """
+    conc = cfg.get("concurrency") or {}
+    return max(1, int(conc.get(cfg["provider"], conc.get("default", DEFAULT_CONCURRENCY))))
+
+
+class BoundedClient:
+    """
+    Wraps an LLMClient so that at most `limit` requests are in flight at once.
+    Uses the client's native `achat` when present; otherwise runs the blocking
+    `chat` on a dedicated pool of `limit` threads.
+    """
+    def __init__(self, client, limit: int):
+        self.client = client
+        self.limit = limit
+        self._sem = asyncio.Semaphore(limit)
+        self._native = callable(getattr(client, "achat", None))
+        self._executor = None if self._native else ThreadPoolExecutor(max_workers=limit, thread_name_prefix="llm")
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+
+    def chat(self, system: str, user: str, temperature: float, top_p: float) -> str:
+        return self.client.chat(system, user, temperature=temperature, top_p=top_p)
+
+    async def achat(self, system: str, user: str, temperature: float, top_p: float) -> str:
+        async with self._sem:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                if self._native:
+                    return await self.client.achat(system, user, temperature=temperature, top_p=top_p)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, partial(self.client.chat, system, user, temperature=temperature, top_p=top_p)
+                )
+            finally:
+                self.in_flight -= 1
+
+    async def astream(self, system: str, user: str, temperature: float, top_p: float):
+        """
+        Streams through the wrapped client's `astream`, holding a slot until the stream closes.
+        Clients without `astream` yield their whole `achat`/`chat` answer as one chunk.
+        """
+        if not callable(getattr(self.client, "astream", None)):
+            yield await self.achat(system, user, temperature=temperature, top_p=top_p)
+            return
+        async with self._sem:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            stream = self.client.astream(system, user, temperature=temperature, top_p=top_p)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+                self.in_flight -= 1
+
+    async def aclose(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        # pooled async connections are bound to this event loop
+        if callable(getattr(self.client, "aclose", None)):
+            await self.client.aclose()
+
+
+class SynthEngine:
+    """
+    Concurrent paraphrase -> compile loop.
+
+    `seed_workers` seeds are processed at a time; every teacher call goes through
+    a BoundedClient so the number of concurrent requests never exceeds `concurrency`.
+    A compile only starts if accepted + in-flight compiles < `target_count`; it
+    waits otherwise, and is dropped once the target is reached. Accepted examples
+    therefore never exceed the target, and wasted calls are bounded by in-flight work.
+
+    Callbacks receive plain dicts and are invoked from the event loop thread:
+      on_ok(prompt, dpo_obj, seed)   on_fail(prompt, exc, seed)
+      on_seed_done(seed, n_ok, n_fail)   after every compile of that seed has finished
+    `initial_ok` / `initial_fail` carry counts restored from a checkpoint.
+    """
+    def __init__(self, client, schema: dict, allow: set, *, gen: dict, targets: dict, limits: dict,
+                 concurrency: int = DEFAULT_CONCURRENCY, seed_workers: Optional[int] = None,
+                 debug_sink=None, sample_every: int = 1, negatives=None,
+                 on_ok: Optional[Callable[[str, Dict[str, Any], dict], None]] = None,
+                 on_fail: Optional[Callable[[str, Exception, dict], None]] = None,
+                 on_seed_done: Optional[Callable[[dict, int, int], None]] = None,
+                 initial_ok: int = 0, initial_fail: int = 0):
+        self.client = client
+        self.schema = schema
+        self.allow = allow
+        self.gen = gen
+        self.targets = targets
+        self.limits = limits
+        self.concurrency = concurrency
+        # one seed fans out into k * len(VIEW_ROLES) paraphrase calls; keep roughly
+        # two seeds' worth of work per `concurrency` slots so the pipe stays full
+        fanout = int(targets["max_paraphrases_per_seed"]) * len(VIEW_ROLES)
+        self.seed_workers = seed_workers or max(1, 2 * math.ceil(concurrency / max(fanout, 1)))
+        self.debug_sink = debug_sink
+        self.negatives = negatives
+        self.sample_every = max(1, int(sample_every))
+        self.on_ok = on_ok
+        self.on_fail = on_fail
+        self.on_seed_done = on_seed_done
+
+        self.target_count = int(targets["target_count"])
+        self.paraphrase_total = 0
+        self.compile_ok = initial_ok
+        self.compile_fail = initial_fail
+        self.repair_ok = 0
+        self.repair_fail = 0
+        self.stream_aborts = 0
+        self.dpo_pairs = 0
+        self.negative_calls = 0
+        self.negative_by_strategy: Dict[Optional[str], int] = {}
+        self._pending = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    def negative_stats(self) -> Dict[str, Any]:
+        return {"pairs": self.dpo_pairs, "teacher_calls": self.negative_calls,
+                "calls_per_pair": round(self.negative_calls / max(self.dpo_pairs, 1), 3),
+                "by_strategy": {str(k): v for k, v in self.negative_by_strategy.items()}}
+
+    def done(self) -> bool:
+        return self.compile_ok >= self.target_count
+
+    def _has_slot(self) -> bool:
+        return self.done() or self.compile_ok + self._pending < self.target_count
+
+    async def _wait_slot(self):
+        async with self._cond:
+            await self._cond.wait_for(self._has_slot)
+
+    async def _release_slot(self):
+        self._pending -= 1
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _compile(self, bounded: BoundedClient, pr: str, seed: dict) -> Optional[bool]:
+        """True/False for accepted/failed compiles, None if dropped because the target was reached."""
+        await self._wait_slot()
+        if self.done():
+            return None
+        self._pending += 1
+        try:
+            return await self._compile_reserved(bounded, pr, seed)
+        finally:
+            await self._release_slot()
+
+    async def _compile_reserved(self, bounded: BoundedClient, pr: str, seed: dict) -> bool:
+        try:
+            out = await acompile_with_repair(
+                bounded, pr, self.schema, self.allow,
+                temperature=self.gen["temperature"], top_p=self.gen["top_p"],
+                max_repair_attempts=int(self.limits.get("max_repair_attempts", 1)),
+                debug_sink=self.debug_sink, negatives=self.negatives,
+                stream_guard=bool(self.gen.get("stream_guard", False))
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.compile_fail += 1
+            if isinstance(e.__cause__, StreamAbort):
+                self.stream_aborts += 1
+            # if repair attempts were made inside compile_with_repair, they are already logged to events
+            if "repair succeeded" in str(e):
+                self.repair_ok += 1
+            else:
+                self.repair_fail += 1
+            if self.on_fail:
+                self.on_fail(pr, e, seed)
+            return False
+        self.compile_ok += 1
+        neg = out.get("negative") or {}
+        self.negative_calls += neg.get("teacher_calls", 0)
+        strategy = neg.get("strategy")
+        self.negative_by_strategy[strategy] = self.negative_by_strategy.get(strategy, 0) + 1
+        if out.get("rejected") is not None:
+            self.dpo_pairs += 1 + len(neg.get("extra", ()))
+        if self.on_ok:
+            self.on_ok(pr, out, seed)
+        return True
+
+    async def _seed(self, bounded: BoundedClient, idx: int, n_seeds: int, s: dict):
+        base = verbalize_seed(s)
+        paras = await aparaphrases(bounded, base,
+                                   k=self.targets["max_paraphrases_per_seed"],
+                                   temperature=self.gen["paraphrase_temperature"],
+                                   top_p=self.gen["paraphrase_top_p"])
+        self.paraphrase_total += len(paras)
+        if idx % self.sample_every == 0:
+            LOG.info("seed %d/%d base=%r paras=%d", idx, n_seeds, base['primary_goal'][:80], len(paras))
+        results = await asyncio.gather(*(self._compile(bounded, pr, s) for pr in paras))
+        if self.on_seed_done:
+            self.on_seed_done(s, results.count(True), results.count(False))
+
+    async def run(self, seeds: List[dict]) -> "SynthEngine":
+        bounded = BoundedClient(self.client, self.concurrency)
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(seeds, 1):
+            queue.put_nowait(item)
+
+        self._cond = asyncio.Condition()
+
+        async def worker():
+            while True:
+                await self._wait_slot()
+                if self.done():
+                    return
+                try:
+                    idx, s = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._seed(bounded, idx, len(seeds), s)
+
+        start = time.time()
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.seed_workers, len(seeds)) or 1)))
+        finally:
+            await bounded.aclose()
+        LOG.info("engine: %d requests, peak_in_flight=%d/%d in %.1fs",
+                 bounded.calls, bounded.peak_in_flight, self.concurrency, time.time() - start)
+        return self
+
+    def run_sync(self, seeds: List[dict]) -> "SynthEngine":
+        return asyncio.run(self.run(seeds))
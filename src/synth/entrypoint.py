@@ -4,12 +4,15 @@ from jsonschema import validate
 
 from synth.providers.openai_client import OpenAIClient
 from synth.providers.bedrock_client import BedrockClient
+from synth.providers.cache import ResponseCache, CachedClient
 
 from synth.seeds import load_seed_wfls, verbalize_seed
-from synth.paraphrase import paraphrases
-from synth.compile_wfl import compile_with_repair
+from synth.engine import SynthEngine, concurrency_for
+from synth.checkpoint import RunCheckpoint, seed_key
 from synth.utils.contracts import load_schema, load_catalog
-from synth.dedupe import dedupe
+from synth.split import StreamingSplitWriter
+from synth.dedupe import NearDeduper
+from synth.negatives import NegativeSampler
 from synth.utils.debug import setup_logging, JsonlSink
 
 LOG = logging.getLogger("synth.main")
@@ -21,24 +24,38 @@ def load_config(path: str):
 def make_client(cfg):
     provider = cfg["provider"]
     gen = cfg["generation"]
+    # one pooled connection per allowed in-flight request
+    conns = concurrency_for(cfg)
     if provider == "openai":
         m = cfg["openai"]["model"]; max_tokens = cfg["openai"]["max_tokens"]
-        return OpenAIClient(model=m, max_tokens=max_tokens)
+        return OpenAIClient(model=m, max_tokens=max_tokens, base_url=cfg["openai"].get("base_url"),
+                            max_connections=conns)
     if provider == "bedrock":
         m = cfg["bedrock"]["model"]; reg = cfg["bedrock"]["region"]; max_tokens = cfg["bedrock"]["max_tokens"]
-        return BedrockClient(model=m, region=reg, max_tokens=max_tokens)
+        return BedrockClient(model=m, region=reg, max_tokens=max_tokens, max_connections=conns)
     raise SystemExit("Unsupported provider")
 
+def wrap_cache(client, cfg):
+    cache_cfg = cfg.get("cache") or {}
+    if not cache_cfg.get("enabled", False):
+        return client
+    cache = ResponseCache(cache_cfg.get("path", "datasets/synth_cache/teacher.sqlite"),
+                          max_bytes=int(float(cache_cfg.get("max_mb", 512)) * 1024 * 1024))
+    LOG.info("response cache: %s (%d bytes stored)", cache.path, cache.total_bytes)
+    return CachedClient(client, cache, bypass_sampled=bool(cache_cfg.get("bypass_sampled", False)))
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", default="synth/configs/synth.config.yaml")
     ap.add_argument("--verbose", action="store_true")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue the run recorded in <out_dir_debug>/manifest.json, skipping finished seeds")
     args = ap.parse_args()
 
     cfg = load_config(args.config)
     setup_logging(cfg.get("debug", {}).get("level", "INFO") if not args.verbose else "DEBUG")
 
-    client = make_client(cfg)
+    client = wrap_cache(make_client(cfg), cfg)
     paths = cfg["paths"]; gen = cfg["generation"]; tgt = cfg["targets"]
     debug_cfg = cfg.get("debug", {})
     limits = cfg.get("limits", {})
@@ -50,7 +67,8 @@ def main():
 
     schema = load_schema(paths["schema"])
     allow  = load_catalog(paths["catalog"])
-    seeds  = load_seed_wfls(paths["seed_dir"])
+    seeds  = load_seed_wfls(paths["seed_dir"], cache_path=paths.get("seed_cache"),
+                            strict=bool(cfg.get("seeds_strict", False)))
     if not seeds: raise SystemExit("No seed .wfl found")
     LOG.info("seeds loaded: %d", len(seeds))
 
@@ -58,85 +76,87 @@ def main():
     fail_sink = JsonlSink((debug_dir / "fail.jsonl").as_posix(), flush_every)
     evt_sink  = JsonlSink((debug_dir / "events.jsonl").as_posix(), flush_every)
 
-    pool = []
-    pairs = []
+    # outputs are (re)written from scratch every session; restored examples stream through first
+    writer = StreamingSplitWriter(paths["out_dir"], near=NearDeduper.from_config(cfg.get("dedupe")))
+
+    def emit(pr, chosen, rejected, reason, negative=None):
+        # no pair when the negative sampler ran out of budget
+        pairs = []
+        if rejected is not None:
+            pair = {"prompt": pr, "chosen": chosen, "rejected": rejected, "reason": reason}
+            if negative:
+                pair.update(neg_strategy=negative["strategy"], neg_teacher_calls=negative["teacher_calls"])
+            pairs.append(pair)
+            for extra in (negative or {}).get("extra", ()):
+                pairs.append(dict(pair, rejected=extra["rejected"], reason=extra["reason"], neg_teacher_calls=0))
+        writer.add({"input": pr, "output": chosen}, pairs)
+
+    ckpt = RunCheckpoint(debug_dir, cfg, flush_every)
+    ckpt.start(resume=args.resume, seeds_total=len(seeds))
+    restored_ok, restored_fail = ckpt.restore(
+        lambda rec: emit(rec["input"], rec["output"], rec["rejected"], rec["reason"], rec.get("negative")))
     # 1) seed pairs
     for s in seeds:
         req = verbalize_seed(s)
         # do not inlude seeds to dataset for testing
         # pool.append({"input": req, "output": s})
 
-    # counters
-    paraphrase_total = 0
-    compile_ok = 0
-    compile_fail = 0
-    repair_ok = 0
-    repair_fail = 0
+    # 2) paraphrase + compile (concurrent, bounded per provider)
+    def on_ok(pr, out, seed):
+        emit(pr, out["chosen"], out["rejected"], out["reason"], out.get("negative"))
+        ok_sink.write(ckpt.tag({"input": pr, "output": out["chosen"], "rejected": out["rejected"], "reason": out["reason"],
+                                "negative": out.get("negative")}, seed))
+
+    def on_fail(pr, e, seed):
+        fail_sink.write(ckpt.tag({
+            "input": pr,
+            "error": str(e),
+            "diagnostics": getattr(e, "diagnostics", None)
+        }, seed))
+
+    def on_seed_done(seed, n_ok, n_fail):
+        ckpt.mark_seed_done(seed, n_ok, n_fail, sinks=(ok_sink, fail_sink))
+        ckpt.write_manifest(seeds_done=len(ckpt.done), compile_ok=engine.compile_ok, compile_fail=engine.compile_fail)
+
+    concurrency = concurrency_for(cfg)
+    LOG.info("concurrency: provider=%s limit=%d", cfg["provider"], concurrency)
     start = time.time()
-
-    # 2) paraphrase + compile
-    random.shuffle(seeds)
-    for idx, s in enumerate(seeds, 1):
-        base = verbalize_seed(s)
-        paras = paraphrases(client, base,
-                            k=tgt["max_paraphrases_per_seed"],
-                            temperature=gen["paraphrase_temperature"],
-                            top_p=gen["paraphrase_top_p"])
-        paraphrase_total += len(paras)
-        if idx % sample_every == 0:
-            LOG.info("seed %d/%d base=%r paras=%d", idx, len(seeds), base['primary_goal'][:80], len(paras))
-
-        for pr in paras:
-            try:
-                out = compile_with_repair(
-                    client, pr, schema, allow,
-                    temperature=gen["temperature"], top_p=gen["top_p"],
-                    max_repair_attempts=int(limits.get("max_repair_attempts", 1)),
-                    debug_sink=evt_sink if save_raw else None
-                )
-                pairs.append({"prompt": pr, "chosen": out["chosen"], "rejected": out["rejected"], "reason": out["reason"]})
-                pool.append({"input": pr, "output": out["chosen"]})
-                compile_ok += 1
-                ok_sink.write({"input": pr, "output": out["chosen"], "rejected": out["rejected"], "reason": out["reason"]})
-            except Exception as e:
-                compile_fail += 1
-                raw_prev = getattr(e, "raw", None)
-                fail_sink.write({
-                    "input": pr,
-                    "error": str(e)
-                })
-                # if repair attempts were made inside compile_with_repair, they are already logged to events
-                if "repair succeeded" in str(e):
-                    repair_ok += 1
-                else:
-                    repair_fail += 1
-            if len(pool) >= tgt["target_count"]:
-                break
-        if len(pool) >= tgt["target_count"]:
-            break
-
-    # 3) dedupe
-    before = len(pool)
-    pool = dedupe(pool)
-    after = len(pool)
-    LOG.info("dedupe: %d -> %d (removed %d)", before, after, before - after)
-
-    # 4) split & write
-    out_dir = pathlib.Path(paths["out_dir"]); out_dir.mkdir(parents=True, exist_ok=True)
-    random.shuffle(pool)
-    random.shuffle(pairs)
-    n=len(pool); val_n = max(min(200, n//20), 100)
-    train, val = pool[val_n:], pool[:val_n]
-    (out_dir/"train.jsonl").write_text("\n".join(json.dumps(x, ensure_ascii=False) for x in train), encoding="utf-8")
-    (out_dir/"val.jsonl").write_text("\n".join(json.dumps(x, ensure_ascii=False) for x in val), encoding="utf-8")
-    (out_dir/"pairs.jsonl").write_text("\n".join(json.dumps(x, ensure_ascii=False) for x in pairs), encoding="utf-8")
+    todo = [s for s in seeds if seed_key(s) not in ckpt.done]
+    LOG.info("seeds to process: %d (%d already done)", len(todo), len(seeds) - len(todo))
+    random.shuffle(todo)
+    engine = SynthEngine(
+        client, schema, allow,
+        gen=gen, targets=tgt, limits=limits,
+        concurrency=concurrency,
+        debug_sink=evt_sink if save_raw else None,
+        sample_every=sample_every,
+        negatives=NegativeSampler.from_config(cfg.get("negatives")),
+        on_ok=on_ok, on_fail=on_fail, on_seed_done=on_seed_done,
+        initial_ok=restored_ok, initial_fail=restored_fail,
+    )
+    engine.run_sync(todo)
+    paraphrase_total = engine.paraphrase_total
+    compile_ok, compile_fail = engine.compile_ok, engine.compile_fail
+    repair_ok, repair_fail = engine.repair_ok, engine.repair_fail
+
+    # 3) dedupe + 4) split & write happened while streaming; finalize val
+    split = writer.close()
+    LOG.info("dedupe: %d -> %d (removed %d exact, %d near)", split["unique"] + split["duplicates"] + split["near_duplicates"],
+             split["unique"], split["duplicates"], split["near_duplicates"])
 
     elapsed = time.time() - start
-    LOG.info("DONE wrote %d train / %d val, %d DPO pairs to %s in %.1fs", len(train), len(val), len(pairs), out_dir, elapsed)
+    LOG.info("DONE wrote %d train / %d val, %d / %d DPO pairs to %s in %.1fs",
+             split["train"], split["val"], split["pairs"], split["eval_pairs"], paths["out_dir"], elapsed)
     LOG.info("STATS paraphrases=%d compile_ok=%d compile_fail=%d", paraphrase_total, compile_ok, compile_fail)
-    LOG.info("STATS repair_ok=%d repair_fail=%d", repair_ok, repair_fail)
+    LOG.info("STATS repair_ok=%d repair_fail=%d stream_aborts=%d", repair_ok, repair_fail, engine.stream_aborts)
+    LOG.info("STATS negatives (this session) %s", engine.negative_stats())
+    if isinstance(client, CachedClient):
+        LOG.info("STATS cache %s", client.stats())
+        client.cache.close()
 
     ok_sink.close(); fail_sink.close(); evt_sink.close()
+    ckpt.close("complete", compile_ok=compile_ok, compile_fail=compile_fail,
+               train=split["train"], val=split["val"], pairs=split["pairs"])
 
 if __name__ == "__main__":
     main()
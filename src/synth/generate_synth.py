@@ -2,6 +2,8 @@
 import os, json, re, argparse, pathlib, random, hashlib, time
 from jsonschema import validate, ValidationError
 
+from synth.utils.json_utils import extract_first_json_object, workflow_fingerprint
+
 PROVIDER = os.getenv("PROVIDER", "openai")  # "openai" or "bedrock"
 
 def call_llm(system, user, temperature=0.3, top_p=0.95, max_tokens=1024):
@@ -71,17 +73,7 @@ USER_PARAPHRASE_TMPL = """{seed_text}"""
 
 # ----------------- Utils -----------------
 def extract_json_block(text: str):
-    i = text.find("{")
-    if i < 0: raise ValueError("No JSON start")
-    depth=0; end=None
-    for j,ch in enumerate(text[i:], start=i):
-        if ch=="{": depth+=1
-        elif ch=="}":
-            depth-=1
-            if depth==0:
-                end=j+1; break
-    if end is None: raise ValueError("Unbalanced braces")
-    return json.loads(text[i:end])
+    return extract_first_json_object(text)
 
 def canonical_json(obj):  # for dedup
     return json.dumps(obj, sort_keys=True, separators=(",",":"))
@@ -129,17 +121,11 @@ def generate(seed_dir, schema_path, catalog_path, out_dir, target_count=3000,
     seeds=[]
     for p in pathlib.Path(seed_dir).glob("*.wfl"):
         s = p.read_text(encoding="utf-8", errors="replace")
-        i = s.find("{")
-        if i<0: continue
-        depth=0; end=None
-        for j,ch in enumerate(s[i:], start=i):
-            if ch=="{": depth+=1
-            elif ch=="}":
-                depth-=1
-                if depth==0:
-                    end=j+1; break
-        if end is None: continue
-        seeds.append(json.loads(s[i:end]))
+        try:
+            seeds.append(extract_first_json_object(s))
+        except ValueError as e:
+            print(f"Skipping seed {p}: {e}")
+            continue
     if not seeds:
         raise SystemExit("No seed .wfl found")
 
@@ -191,7 +177,7 @@ def generate(seed_dir, schema_path, catalog_path, out_dir, target_count=3000,
     # 3) de-dup
     seen=set(); dedup=[]
     for ex in pool:
-        key = hashlib.sha256((norm_text(ex["input"])+"|"+canonical_json(ex["output"])).encode()).hexdigest()
+        key = hashlib.sha256(norm_text(ex["input"]).encode()+b"|"+workflow_fingerprint(ex["output"])).hexdigest()
         if key not in seen:
             dedup.append(ex); seen.add(key)
 
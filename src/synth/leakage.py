@@ -0,0 +1,80 @@
+"""
+Cross-split leakage: eval rows (val.jsonl, eval_pairs.jsonl) whose prompt or workflow also
+appears in the training splits (train.jsonl, pairs.jsonl).
+
+LeakageIndex is built over the training rows, then eval rows are checked against it one by one,
+so a check is linear in the total number of rows. A leak is reported under the first key kind
+that matches:
+  prompt    - same normalized request text
+  workflow  - same workflow_fingerprint (ids and stamped dates ignored), whatever the prompt
+  near      - same workflow shape and a near-paraphrased request (NearDeduper)
+SFT rows are {"input", "output"}; DPO rows are {"prompt", "chosen"}, where the prompt is the full
+compile prompt and the request is recovered from it.
+"""
+import hashlib
+from array import array
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from synth.compile_wfl import request_from_prompt
+from synth.dedupe import NearDeduper
+from synth.utils.json_utils import norm_text, workflow_fingerprint
+
+KEY_KINDS = ("prompt", "workflow", "near")
+
+def row_request(row: Dict[str, Any]) -> Optional[str]:
+    if isinstance(row.get("input"), str):
+        return row["input"]
+    if isinstance(row.get("prompt"), str):
+        return request_from_prompt(row["prompt"])
+    return None
+
+def row_workflow(row: Dict[str, Any]) -> Any:
+    return row["output"] if "output" in row else row.get("chosen")
+
+def _prompt_key(text: str) -> bytes:
+    return hashlib.blake2b(norm_text(text).encode("utf-8"), digest_size=16).digest()
+
+class Leak(NamedTuple):
+    kind: str       # one of KEY_KINDS
+    source: int     # index (in add order) of the matching training row
+
+class LeakageIndex:
+    def __init__(self, kinds: Iterable[str] = KEY_KINDS, near: Optional[NearDeduper] = None):
+        self.kinds = tuple(k for k in KEY_KINDS if k in set(kinds))
+        self.prompts: Dict[bytes, int] = {}
+        self.workflows: Dict[bytes, int] = {}
+        self.near = (near or NearDeduper()) if "near" in self.kinds else None
+        self.near_rows = array("I")  # near index position -> row index
+        self.size = 0
+
+    def _keys(self, row: Dict[str, Any]) -> Tuple[Optional[str], Any, Optional[bytes], Optional[bytes]]:
+        text, wf = row_request(row), row_workflow(row)
+        pk = _prompt_key(text) if text is not None and "prompt" in self.kinds else None
+        wk = workflow_fingerprint(wf) if wf is not None and "workflow" in self.kinds else None
+        return text, wf, pk, wk
+
+    def add(self, row: Dict[str, Any]) -> int:
+        """Indexes a training row; returns its index."""
+        idx = self.size
+        self.size += 1
+        text, wf, pk, wk = self._keys(row)
+        if pk is not None:
+            self.prompts.setdefault(pk, idx)
+        if wk is not None:
+            self.workflows.setdefault(wk, idx)
+        if self.near is not None and text is not None and wf is not None:
+            self.near.index(text, wf)
+            self.near_rows.append(idx)
+        return idx
+
+    def check(self, row: Dict[str, Any]) -> Optional[Leak]:
+        text, wf, pk, wk = self._keys(row)
+        if pk is not None and pk in self.prompts:
+            return Leak("prompt", self.prompts[pk])
+        if wk is not None and wk in self.workflows:
+            return Leak("workflow", self.workflows[wk])
+        if self.near is not None and text is not None and wf is not None:
+            j = self.near.find(text, wf)
+            if j is not None:
+                return Leak("near", self.near_rows[j])
+        return None
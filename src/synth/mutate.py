@@ -0,0 +1,244 @@
+"""
+Programmatic corruption of a valid workflow into a known-invalid one.
+Used as a zero-teacher-call source of DPO rejected samples.
+
+Every mutation targets one rule of `semantic_validate_workflow`; RULES maps the rule
+id (recorded as the pair `reason`) to the mutation and to the message fragment the
+validator raises for it. Mutations only add or change steps at positions that cannot
+trip an earlier check, so a mutant of a valid workflow fails exactly the targeted rule.
+"""
+import copy, json, random
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+from synth.utils.contracts import ALLOWED_ACTION_TYPES, SCOPE_MAP
+from synth.utils.semantic_validate import (
+    semantic_validate_workflow, NOT_ALLOWED_RULE_PROPERTY_IDS, _VAR_TYPEMAP,
+)
+from synth.utils import wfl_factory as F
+
+_BAD_ACTION_TYPES = sorted(set(range(1, 40)) - ALLOWED_ACTION_TYPES)
+_BAD_RULE_PROPERTY_IDS = sorted(NOT_ALLOWED_RULE_PROPERTY_IDS)
+_BAD_REBOOT_MINUTES = (0, 60, 75, 90, 120)
+_SCOPES = sorted(SCOPE_MAP)
+
+def _clone(wf: Dict[str, Any]) -> Dict[str, Any]:
+    if orjson is not None:
+        return orjson.loads(orjson.dumps(wf))
+    return json.loads(json.dumps(wf))
+
+def _positions(seq: List[Dict[str, Any]]):
+    """Yields (containing_list, index, step) in execution order, descending into branches."""
+    for i, s in enumerate(seq):
+        yield seq, i, s
+        if s.get("workflowStepType") == 2:
+            for key in ("positiveOutcome", "negativeOutcome"):
+                yield from _positions(s.get(key) or [])
+
+def _produced(s: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    """(variable name, type code) produced by an action, mirroring semantic_validate."""
+    if s.get("workflowStepType") != 0:
+        return None
+    at = s.get("actionType"); p = s.get("parameters") or {}
+    if at in (24,27,36) and p.get("captureOutput") and p.get("outputVariable"):
+        return p["outputVariable"], 2
+    if at == 37 and isinstance(p.get("variableName"), str) and p["variableName"]:
+        return p["variableName"], _VAR_TYPEMAP.get(p.get("variableType"), 2)
+    return None
+
+class _Ctx:
+    """Per-mutant lookups computed once: traversal order, next free id, trigger id."""
+    def __init__(self, wf: Dict[str, Any], rng: random.Random):
+        self.wf = wf
+        self.rng = rng
+        self.steps = wf["workflowSteps"]
+        self.order = list(_positions(self.steps))
+        self.trigger_id = self.steps[0].get("id", 0)
+        ids = []
+        for _, _, s in self.order:
+            try:
+                ids.append(int(s.get("id")))
+            except (TypeError, ValueError):
+                pass
+        self._next = max(ids, default=F.BASE_ID)
+
+    def nid(self) -> int:
+        self._next += 1
+        return self._next
+
+    def var_id(self) -> str:
+        return str(self.rng.randrange(100000, 999999))
+
+    def conditions(self):
+        return [s for _, _, s in self.order if s.get("workflowStepType") == 2]
+
+    def insert_after_trigger(self, *steps: Dict[str, Any]):
+        # index 1 is before any End Workflow of the root sequence, so End-last stays intact
+        self.steps[1:1] = list(steps)
+
+    def fresh_name(self, prefix: str) -> str:
+        taken = {p[0] for _, _, s in self.order if (p := _produced(s))}
+        n = 1
+        while f"{prefix}{n}" in taken:
+            n += 1
+        return f"{prefix}{n}"
+
+    def new_condition(self, rule: Dict[str, Any], positive: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        return F.condition(self.nid(), [rule], positive or [F.write_log(self.nid())], [F.write_log(self.nid())])
+
+def _action_type_not_allowed(c: _Ctx) -> bool:
+    actions = [s for _, _, s in c.order if s.get("workflowStepType") == 0]
+    if actions:
+        c.rng.choice(actions)["actionType"] = c.rng.choice(_BAD_ACTION_TYPES)
+    else:
+        step = F.write_log(c.nid())
+        step["actionType"] = c.rng.choice(_BAD_ACTION_TYPES)
+        c.insert_after_trigger(step)
+    return True
+
+def _var_forward_reference(c: _Ctx) -> bool:
+    """A VarRef to a variable produced later in execution order (or never)."""
+    consumers = [i for i, (_, _, s) in enumerate(c.order)
+                 if s.get("workflowStepType") == 0 and isinstance((s.get("parameters") or {}).get("variables"), list)]
+    if consumers:
+        ci = c.rng.choice(consumers)
+        later = [p[0] for _, _, s in c.order[ci + 1:] if (p := _produced(s))]
+        src = c.rng.choice(later) if later else c.fresh_name("UndefinedVar")
+        step = c.order[ci][2]
+        step["parameters"]["variables"].append(F.var_ref(src, 2, c.trigger_id, c.var_id()))
+    else:
+        later = [p[0] for _, _, s in c.order if (p := _produced(s))]
+        src = c.rng.choice(later) if later else c.fresh_name("UndefinedVar")
+        c.insert_after_trigger(F.write_log(c.nid(), variables=[F.var_ref(src, 2, c.trigger_id, c.var_id())]))
+    return True
+
+def _trigger_in_branch(c: _Ctx) -> bool:
+    trigger = copy.deepcopy(c.steps[0])
+    conditions = c.conditions()
+    if conditions:
+        cond = c.rng.choice(conditions)
+        cond.setdefault(c.rng.choice(("positiveOutcome", "negativeOutcome")), []).insert(0, trigger)
+    else:
+        c.insert_after_trigger(c.new_condition(F.os_type_rule(c.trigger_id), positive=[trigger]))
+    return True
+
+def _end_workflow_not_last(c: _Ctx) -> bool:
+    end = F.end_workflow(c.nid())
+    branches = [br for s in c.conditions() for br in (s.get("positiveOutcome"), s.get("negativeOutcome")) if br]
+    if len(c.steps) > 1 and (not branches or c.rng.random() < 0.5):
+        c.insert_after_trigger(end)
+    elif branches:
+        c.rng.choice(branches).insert(0, end)
+    else:
+        c.steps.extend([end, F.write_log(c.nid())])
+    return True
+
+def _varref_type_mismatch(c: _Ctx) -> bool:
+    producers = [(lst, i, p) for lst, i, s in c.order if (p := _produced(s))]
+    if producers:
+        lst, i, (name, vtype) = c.rng.choice(producers)
+        vid = c.var_id()
+        bad = c.rng.choice([t for t in (0, 1, 2, 3) if t != vtype])
+        # directly after the producer: in scope on this path, before any End Workflow
+        lst.insert(i + 1, F.write_log(c.nid(), f"Value: #{vid}", [F.var_ref(name, bad, c.trigger_id, vid)]))
+    else:
+        name = c.fresh_name("MutVar")
+        vid = c.var_id()
+        producer = F.set_variable(c.nid(), name, variable_type=6)                           # Text
+        consumer = F.write_log(c.nid(), f"Value: #{vid}", [F.var_ref(name, c.rng.choice((0, 1, 3)), c.trigger_id, vid)])
+        c.insert_after_trigger(producer, consumer)
+    return True
+
+def _rule_property_not_allowed(c: _Ctx) -> bool:
+    bad = c.rng.choice(_BAD_RULE_PROPERTY_IDS)
+    rules = [r for s in c.conditions() for r in (s.get("rules") or [])]
+    if rules:
+        c.rng.choice(rules)["propertyId"] = bad
+    else:
+        rule = F.os_type_rule(c.trigger_id)
+        rule["propertyId"] = bad
+        c.insert_after_trigger(c.new_condition(rule))
+    return True
+
+def _scope_id_mismatch(c: _Ctx) -> bool:
+    name = c.rng.choice(_SCOPES)
+    wrong = c.rng.choice([v for v in SCOPE_MAP.values() if v != SCOPE_MAP[name]])
+    rule = {"propertyId": "scope", "operator": 2, "scopeName": name, "scopeId": wrong,
+            "computerIds": [], "workflowStepId": c.trigger_id}
+    conditions = c.conditions()
+    if conditions:
+        c.rng.choice(conditions).setdefault("rules", []).append(rule)
+    else:
+        c.insert_after_trigger(c.new_condition(rule))
+    return True
+
+def _reboot_minutes_out_of_range(c: _Ctx) -> bool:
+    minutes = c.rng.choice(_BAD_REBOOT_MINUTES)
+    reboots = [s for _, _, s in c.order
+               if s.get("workflowStepType") == 0 and s.get("actionType") == 26 and isinstance(s.get("parameters"), dict)]
+    if reboots:
+        p = c.rng.choice(reboots)["parameters"]
+        p["type"] = 1; p["minutes"] = minutes
+    else:
+        c.insert_after_trigger(F.reboot(c.nid(), minutes))
+    return True
+
+class Rule(NamedTuple):
+    mutate: Callable[[_Ctx], bool]
+    expect: Tuple[str, ...]          # fragments of the validator message for this rule
+
+RULES: Dict[str, Rule] = {
+    "action_type_not_allowed":     Rule(_action_type_not_allowed, ("Unknown actionType",)),
+    "var_forward_reference":       Rule(_var_forward_reference, ("not produced yet",)),
+    "trigger_in_branch":           Rule(_trigger_in_branch, ("Trigger cannot appear inside condition branches",)),
+    "end_workflow_not_last":       Rule(_end_workflow_not_last, ("End Workflow must be the last step", "No steps allowed after End Workflow")),
+    "varref_type_mismatch":        Rule(_varref_type_mismatch, ("VarRef.type mismatch",)),
+    "rule_property_not_allowed":   Rule(_rule_property_not_allowed, ("Disallowed rule propertyId",)),
+    "scope_id_mismatch":           Rule(_scope_id_mismatch, ("does not match scopeName",)),
+    "reboot_minutes_out_of_range": Rule(_reboot_minutes_out_of_range, ("Reboot 'minutes'",)),
+}
+
+def apply_rule(wf: Dict[str, Any], rule: str, rng: random.Random) -> Optional[Dict[str, Any]]:
+    """Returns a mutated copy of `wf` violating `rule`, or None if the rule cannot be targeted."""
+    mutant = _clone(wf)
+    if not isinstance(mutant.get("workflowSteps"), list) or not mutant["workflowSteps"]:
+        return None
+    return mutant if RULES[rule].mutate(_Ctx(mutant, rng)) else None
+
+def mutate(wf: Dict[str, Any], rng: random.Random, rules: Optional[List[str]] = None) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    Applies one applicable mutation (random order over `rules`, default all) to a copy of `wf`.
+    Returns (mutant, rule_id) or None if no rule applies.
+    """
+    names = list(rules or RULES)
+    rng.shuffle(names)
+    for name in names:
+        mutant = apply_rule(wf, name, rng)
+        if mutant is not None:
+            return mutant, name
+    return None
+
+def mutate_many(wf: Dict[str, Any], rng: random.Random, n: int, rules: Optional[List[str]] = None) -> List[Tuple[Dict[str, Any], str]]:
+    """Up to `n` mutants, cycling through the rules so each negative breaks a different rule where possible."""
+    names = list(rules or RULES)
+    rng.shuffle(names)
+    out = []
+    for i in range(n):
+        name = names[i % len(names)]
+        mutant = apply_rule(wf, name, rng)
+        if mutant is not None:
+            out.append((mutant, name))
+    return out
+
+def violated_rule_message(mutant: Dict[str, Any], rule: str) -> Optional[str]:
+    """The validator message if `mutant` fails with the error expected for `rule`, else None."""
+    try:
+        semantic_validate_workflow(mutant)
+    except (AssertionError, ValueError, TypeError) as e:
+        msg = str(e)
+        return msg if any(frag in msg for frag in RULES[rule].expect) else None
+    return None
@@ -0,0 +1,112 @@
+import asyncio, logging, random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from synth.mutate import RULES, mutate_many, violated_rule_message
+
+LOG = logging.getLogger("synth.negatives")
+
+STRATEGIES = ("mutate", "sabotage")
+
+class NegativeSampler:
+    """
+    Produces the DPO rejected sample for an accepted workflow, trying `strategies` in order:
+
+      mutate    rule-targeted corruption of the chosen workflow (0 teacher calls); `reason`
+                is the targeted rule id from synth.mutate.RULES and up to
+                `mutants_per_chosen - 1` further mutants are returned under "extra"
+      sabotage  ask the teacher for a workflow until one fails validation,
+                at most `max_teacher_calls` calls per request
+
+    Every result carries {"strategy", "teacher_calls"} so the cost per DPO pair can be
+    reported; when all strategies are exhausted `rejected` is None and no pair is emitted.
+    """
+    def __init__(self, strategies: Sequence[str] = ("sabotage",), max_teacher_calls: int = 3,
+                 mutate_attempts: int = 3, mutation_rules: Optional[Sequence[str]] = None,
+                 mutants_per_chosen: int = 1, seed: Optional[int] = None):
+        unknown = set(strategies) - set(STRATEGIES)
+        if unknown:
+            raise ValueError(f"unknown negative strategies {sorted(unknown)} (allowed: {list(STRATEGIES)})")
+        unknown = set(mutation_rules or ()) - set(RULES)
+        if unknown:
+            raise ValueError(f"unknown mutation rules {sorted(unknown)} (allowed: {list(RULES)})")
+        self.strategies = tuple(strategies)
+        self.max_teacher_calls = max(0, int(max_teacher_calls))
+        self.mutate_attempts = max(1, int(mutate_attempts))
+        self.mutation_rules = list(mutation_rules) if mutation_rules else None
+        self.mutants_per_chosen = max(1, int(mutants_per_chosen))
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def from_config(cls, cfg: Optional[dict]) -> "NegativeSampler":
+        cfg = cfg or {}
+        return cls(strategies=cfg.get("strategies", ("sabotage",)),
+                   max_teacher_calls=cfg.get("max_teacher_calls", 3),
+                   mutate_attempts=cfg.get("mutate_attempts", 3),
+                   mutation_rules=cfg.get("mutation_rules"),
+                   mutants_per_chosen=cfg.get("mutants_per_chosen", 1),
+                   seed=cfg.get("seed"))
+
+    def _mutate(self, chosen: Dict[str, Any]) -> List[Tuple[Dict[str, Any], str]]:
+        """Up to `mutants_per_chosen` (mutant, rule_id) pairs, each confirmed to fail its rule."""
+        out = []
+        for _ in range(self.mutate_attempts):
+            for mutant, rule in mutate_many(chosen, self.rng, self.mutants_per_chosen - len(out), self.mutation_rules):
+                # semantic check only: many mutants (unknown actionType, disallowed propertyId,
+                # trigger in branch, ...) also fail the schema, which is fine for a rejected sample;
+                # `rule` names the semantic rule the mutation targets, not the only one broken
+                if violated_rule_message(mutant, rule) is not None:
+                    out.append((mutant, rule))
+                else:
+                    LOG.debug("mutation %s did not trip its rule; retrying", rule)
+            if len(out) >= self.mutants_per_chosen:
+                break
+        return out
+
+    @staticmethod
+    def _result(rejected, reason, strategy, calls, extra=None) -> Dict[str, Any]:
+        res = {"rejected": rejected, "reason": reason, "strategy": strategy, "teacher_calls": calls}
+        if extra:
+            res["extra"] = [{"rejected": r, "reason": why} for r, why in extra]
+        return res
+
+    def sample(self, client, request: str, chosen: Dict[str, Any], schema: dict, debug_sink=None) -> Dict[str, Any]:
+        from synth.compile_wfl import compile_once, _reject_reason
+        calls = 0
+        for strategy in self.strategies:
+            if strategy == "mutate":
+                out = self._mutate(chosen)
+                if out:
+                    return self._result(out[0][0], out[0][1], strategy, calls, out[1:])
+            elif strategy == "sabotage":
+                while calls < self.max_teacher_calls:
+                    raw = compile_once(client, request, temperature=0.3, top_p=0.3)
+                    calls += 1
+                    rejected = _reject_reason(raw, schema)
+                    if rejected is not None:
+                        if debug_sink:
+                            debug_sink.write({"stage":"compile_rejected","request":request,"teacher_calls":calls})
+                        return self._result(rejected[0], rejected[1], strategy, calls)
+        if debug_sink:
+            debug_sink.write({"stage":"negative_exhausted","request":request,"teacher_calls":calls})
+        return self._result(None, None, None, calls)
+
+    async def asample(self, client, request: str, chosen: Dict[str, Any], schema: dict, debug_sink=None) -> Dict[str, Any]:
+        from synth.compile_wfl import acompile_once, _reject_reason
+        calls = 0
+        for strategy in self.strategies:
+            if strategy == "mutate":
+                out = self._mutate(chosen)
+                if out:
+                    return self._result(out[0][0], out[0][1], strategy, calls, out[1:])
+            elif strategy == "sabotage":
+                while calls < self.max_teacher_calls:
+                    raw = await acompile_once(client, request, temperature=0.3, top_p=0.3)
+                    calls += 1
+                    rejected = await asyncio.to_thread(_reject_reason, raw, schema)
+                    if rejected is not None:
+                        if debug_sink:
+                            debug_sink.write({"stage":"compile_rejected","request":request,"teacher_calls":calls})
+                        return self._result(rejected[0], rejected[1], strategy, calls)
+        if debug_sink:
+            debug_sink.write({"stage":"negative_exhausted","request":request,"teacher_calls":calls})
+        return self._result(None, None, None, calls)
@@ -1,5 +1,5 @@
 from typing import List, Protocol
-import logging
+import asyncio, logging
 
 from synth.prompts import SYSTEM_PARAPHRASE, USER_PARAPHRASE_TMPL
 from synth.utils.json_utils import norm_text
@@ -17,6 +17,11 @@ VIEW_ROLES = ('intent', 'ops', 'policy', 'helpdesk')
 class LLMClient(Protocol):
     def chat(self, system: str, user: str, temperature: float, top_p: float) -> str: ...
 
+class AsyncLLMClient(LLMClient, Protocol):
+    """Clients that can also be awaited; `aclose` releases pooled connections."""
+    async def achat(self, system: str, user: str, temperature: float, top_p: float) -> str: ...
+    async def aclose(self) -> None: ...
+
 
 def key_terms(source: str):
     s = source.lower()
@@ -56,35 +61,65 @@ def bad_length_ratio(src: str, cand: str) -> bool:
     # Too short or too long relative to original
     return ratio < 0.5 or ratio > 10
 
-def paraphrases(client: LLMClient, seed: dict, k: int, temperature: float, top_p: float) -> List[str]:
-    outs, seen = [], set()
-    attempted = 0
+def _paraphrase_prompts(seed: dict, k: int) -> List[str]:
+    prompts = []
     for _ in range(k):
-        for view in enumerate(VIEW_ROLES):
-            role_idx, role_name = view
-            system_prompt = SYSTEM_PARAPHRASE
-            user_prompt = USER_PARAPHRASE_TMPL.format(
+        for role_name in VIEW_ROLES:
+            prompts.append(USER_PARAPHRASE_TMPL.format(
                 input=role_name,
                 goal=seed['primary_goal'],
                 scope=seed['os_scope']
+            ))
+    return prompts
+
+def _keep_paraphrase(seed: dict, resp: str, seen: set, outs: List[str]):
+    LOG.debug("paraphrase response: %s", resp)
+    paraphrased = norm_text(resp)
+    if paraphrased in seen:
+        return
+    if is_bad_paraphrase(seed['primary_goal'], paraphrased):
+        return
+    seen.add(paraphrased)
+    outs.append(paraphrased)
+
+def paraphrases(client: LLMClient, seed: dict, k: int, temperature: float, top_p: float) -> List[str]:
+    outs, seen = [], set()
+    attempted = 0
+    for user_prompt in _paraphrase_prompts(seed, k):
+        try:
+            resp = client.chat(
+                system=SYSTEM_PARAPHRASE,
+                user=user_prompt,
+                temperature=temperature,
+                top_p=top_p
             )
-            try:
-                resp = client.chat(
-                    system=system_prompt,
-                    user=user_prompt,
-                    temperature=temperature,
-                    top_p=top_p
-                )
-                print("Paraphrase response:", resp)
-                attempted += 1
-                paraphrased = norm_text(resp)
-                if paraphrased in seen:
-                    continue
-                if is_bad_paraphrase(seed['primary_goal'], paraphrased):
-                    continue
-                seen.add(paraphrased)
-                outs.append(paraphrased)
-            except Exception as e:
-                LOG.warning("paraphrase generation failed: %s", str(e))
+            attempted += 1
+            _keep_paraphrase(seed, resp, seen, outs)
+        except Exception as e:
+            LOG.warning("paraphrase generation failed: %s", str(e))
+    LOG.info("paraphrase: generated=%d kept=%d", attempted, len(outs))
+    return outs
+
+async def aparaphrases(client: AsyncLLMClient, seed: dict, k: int, temperature: float, top_p: float) -> List[str]:
+    """
+    Async variant of `paraphrases`: all k * len(VIEW_ROLES) requests are issued
+    concurrently (the client is responsible for bounding concurrency), and the
+    responses are filtered in prompt order so results match the serial version.
+    """
+    prompts = _paraphrase_prompts(seed, k)
+    results = await asyncio.gather(
+        *(client.achat(system=SYSTEM_PARAPHRASE, user=u, temperature=temperature, top_p=top_p) for u in prompts),
+        return_exceptions=True,
+    )
+    outs, seen = [], set()
+    attempted = 0
+    for resp in results:
+        if isinstance(resp, asyncio.CancelledError):
+            raise resp
+        if isinstance(resp, Exception):
+            LOG.warning("paraphrase generation failed: %s", str(resp))
+            continue
+        attempted += 1
+        _keep_paraphrase(seed, resp, seen, outs)
     LOG.info("paraphrase: generated=%d kept=%d", attempted, len(outs))
     return outs
@@ -1,25 +1,140 @@
-import os, json, time, random, logging
+import os, json, time, random, asyncio, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Optional
 import boto3
+from botocore.config import Config
+
+try:
+    from aiobotocore.session import get_session as get_aio_session
+except Exception:
+    get_aio_session = None
+
 LOG = logging.getLogger("synth.provider.bedrock")
 
 class BedrockClient:
-    def __init__(self, model: str, region: Optional[str] = None, max_tokens: int = 1200):
-        self.br = boto3.client("bedrock-runtime", region_name=region or os.getenv("AWS_REGION","us-east-1"))
+    """
+    The boto3 client keeps up to `max_connections` pooled keep-alive connections.
+    `achat` uses aiobotocore when installed; otherwise it runs `converse` on a
+    fixed pool of `max_connections` threads that share the same boto3 pool.
+    """
+    def __init__(self, model: str, region: Optional[str] = None, max_tokens: int = 1200,
+                 max_connections: int = 16, endpoint_url: Optional[str] = None):
+        self.region = region or os.getenv("AWS_REGION","us-east-1")
+        self.endpoint_url = endpoint_url
+        self.max_connections = max_connections
+        self._config = Config(max_pool_connections=max_connections, tcp_keepalive=True,
+                              retries={"mode": "adaptive", "max_attempts": 5})
+        self.br = boto3.client("bedrock-runtime", region_name=self.region,
+                               endpoint_url=endpoint_url, config=self._config)
         self.model = model
         self.max_tokens = max_tokens
+        self._aio_ctx = None
+        self._aio_br = None
+        self._aio_lock = asyncio.Lock()
+        self._executor = None
 
-    def chat(self, system: str, user: str, temperature: float, top_p: float) -> str:
-        rsp = self.br.converse(
-            modelId=self.model, 
+    def _request(self, system: str, user: str, temperature: float, top_p: float) -> dict:
+        return dict(
+            modelId=self.model,
             system=[{"text": system}],
             messages=[{"role":"user","content":[{"text":user}]}],
             inferenceConfig={
                 "maxTokens": self.max_tokens,
                 "temperature": temperature,
-                "topP": top_p 
+                "topP": top_p
             }
         )
+
+    def _text(self, rsp: dict) -> str:
         out = rsp["output"]["message"]
-        LOG.debug("bedrock ok len=%s", "".join([c["text"] for c in out["content"]]))
-        return "".join([c["text"] for c in out["content"]])
+        text = "".join([c["text"] for c in out["content"]])
+        LOG.debug("bedrock ok len=%s", text)
+        return text
+
+    def chat(self, system: str, user: str, temperature: float, top_p: float) -> str:
+        rsp = self.br.converse(**self._request(system, user, temperature, top_p))
+        return self._text(rsp)
+
+    async def _aio_client(self):
+        if self._aio_br is None:
+            # concurrent first calls would each open (and all but one leak) a client
+            async with self._aio_lock:
+                if self._aio_br is None:
+                    ctx = get_aio_session().create_client(
+                        "bedrock-runtime", region_name=self.region, endpoint_url=self.endpoint_url,
+                        config=self._config
+                    )
+                    self._aio_br = await ctx.__aenter__()
+                    self._aio_ctx = ctx
+        return self._aio_br
+
+    async def achat(self, system: str, user: str, temperature: float, top_p: float) -> str:
+        req = self._request(system, user, temperature, top_p)
+        if get_aio_session is not None:
+            br = await self._aio_client()
+            return self._text(await br.converse(**req))
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix="bedrock")
+        loop = asyncio.get_running_loop()
+        return self._text(await loop.run_in_executor(self._executor, partial(self.br.converse, **req)))
+
+    async def astream(self, system: str, user: str, temperature: float, top_p: float):
+        """
+        Async generator of text deltas from `converse_stream`. Closing it early closes the
+        event stream, which ends generation.
+        """
+        req = self._request(system, user, temperature, top_p)
+        if get_aio_session is not None:
+            br = await self._aio_client()
+            events = (await br.converse_stream(**req))["stream"]
+            try:
+                async for ev in events:
+                    delta = ev.get("contentBlockDelta")
+                    if delta and delta["delta"].get("text"):
+                        yield delta["delta"]["text"]
+            finally:
+                events.close()
+            return
+        # boto3 only: read the blocking event stream on the executor and hand deltas over
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix="bedrock")
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        def pump():
+            item = None
+            try:
+                events = self.br.converse_stream(**req)["stream"]
+                try:
+                    for ev in events:
+                        if stop.is_set():
+                            break
+                        delta = ev.get("contentBlockDelta")
+                        if delta and delta["delta"].get("text"):
+                            loop.call_soon_threadsafe(queue.put_nowait, delta["delta"]["text"])
+                finally:
+                    events.close()
+            except Exception as e:
+                item = e
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        loop.run_in_executor(self._executor, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    async def aclose(self):
+        if self._aio_ctx is not None:
+            await self._aio_ctx.__aexit__(None, None, None)
+            self._aio_ctx = self._aio_br = None
+            self._aio_lock = asyncio.Lock()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
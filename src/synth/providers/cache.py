@@ -0,0 +1,187 @@
+import asyncio, hashlib, json, logging, pathlib, sqlite3, threading, time
+from collections import Counter
+from typing import Optional
+
+LOG = logging.getLogger("synth.provider.cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key      TEXT PRIMARY KEY,
+    value    TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    created  REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed);
+"""
+
+class ResponseCache:
+    """
+    Content-addressed SQLite store for teacher responses with LRU eviction once
+    the stored payload exceeds `max_bytes` (evicts down to 90% of the budget).
+    Safe to share between threads.
+    """
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path.as_posix(), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.evicted = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses(key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, low_water: int):
+        freed = 0; n = 0
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+            if self.total_bytes - freed <= low_water:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            freed += size; n += 1
+        self.total_bytes -= freed
+        self.evicted += n
+        LOG.info("cache evicted %d entries (%d bytes), now %d bytes", n, freed, self.total_bytes)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedClient:
+    """
+    Puts a ResponseCache in front of an LLMClient (`chat` and `achat`).
+
+    Key = sha256 over (model, max_tokens, system, user, temperature, top_p, n), where
+    `n` counts identical sampled (temperature > 0) requests within this run, so the
+    k-th repeat of a paraphrase prompt replays the k-th cached sample instead of
+    collapsing all repeats into one answer. With `bypass_sampled=True` sampled
+    calls skip the cache entirely and always hit the teacher.
+    """
+    def __init__(self, client, cache: ResponseCache, bypass_sampled: bool = False):
+        self.client = client
+        self.cache = cache
+        self.bypass_sampled = bypass_sampled
+        self.model = getattr(client, "model", None)
+        self.max_tokens = getattr(client, "max_tokens", None)
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._occurrences = Counter()
+        self._lock = threading.Lock()
+
+    def _key(self, system: str, user: str, temperature: float, top_p: float) -> Optional[str]:
+        sampled = temperature > 0
+        if sampled and self.bypass_sampled:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        base = json.dumps([self.model, self.max_tokens, system, user, temperature, top_p], ensure_ascii=False)
+        n = 0
+        if sampled:
+            with self._lock:
+                n = self._occurrences[base]
+                self._occurrences[base] += 1
+        return hashlib.sha256(f"{base}|{n}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        hit = self.cache.get(key)
+        with self._lock:
+            if hit is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return hit
+
+    def chat(self, system: str, user: str, temperature: float, top_p: float) -> str:
+        key = self._key(system, user, temperature, top_p)
+        hit = self._lookup(key)
+        if hit is not None:
+            return hit
+        out = self.client.chat(system, user, temperature=temperature, top_p=top_p)
+        if key is not None and out is not None:
+            self.cache.put(key, out)
+        return out
+
+    async def achat(self, system: str, user: str, temperature: float, top_p: float) -> str:
+        key = self._key(system, user, temperature, top_p)
+        hit = self._lookup(key)
+        if hit is not None:
+            return hit
+        if callable(getattr(self.client, "achat", None)):
+            out = await self.client.achat(system, user, temperature=temperature, top_p=top_p)
+        else:
+            out = await asyncio.to_thread(self.client.chat, system, user, temperature=temperature, top_p=top_p)
+        if key is not None and out is not None:
+            self.cache.put(key, out)
+        return out
+
+    async def astream(self, system: str, user: str, temperature: float, top_p: float):
+        """
+        A hit is replayed as one chunk. A miss streams from the client and is stored only if
+        the stream was read to the end (a response cut short by the caller is not cached).
+        """
+        key = self._key(system, user, temperature, top_p)
+        hit = self._lookup(key)
+        if hit is not None:
+            yield hit
+            return
+        if not callable(getattr(self.client, "astream", None)):
+            if callable(getattr(self.client, "achat", None)):
+                out = await self.client.achat(system, user, temperature=temperature, top_p=top_p)
+            else:
+                out = await asyncio.to_thread(self.client.chat, system, user, temperature=temperature, top_p=top_p)
+            if key is not None and out is not None:
+                self.cache.put(key, out)
+            yield out
+            return
+        parts = []
+        stream = self.client.astream(system, user, temperature=temperature, top_p=top_p)
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+        if key is not None:
+            self.cache.put(key, "".join(parts))
+
+    async def aclose(self):
+        if callable(getattr(self.client, "aclose", None)):
+            await self.client.aclose()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                "evicted": self.cache.evicted, "bytes": self.cache.total_bytes}
+
+def uncached(client):
+    """
+    The client under a CachedClient (any other client as is), for calls whose answer depends on
+    more than the prompt, e.g. the context-free format nudge: cached, its first answer would be
+    replayed for every later request.
+    """
+    return client.client if isinstance(client, CachedClient) else client
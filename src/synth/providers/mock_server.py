@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an OpenAI-compatible `/v1/chat/completions` endpoint.
+
+Serves HTTP/1.1 with keep-alive and a fixed artificial latency per request, and
+counts TCP connections vs requests so connection pooling can be measured
+without network access:
+
+    python -m synth.providers.mock_server --port 8089 --latency 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=x python -m synth.entrypoint ...
+
+`responder(system, user) -> str` decides the completion text (default: echo).
+Requests with `"stream": true` get server-sent events of `stream_chunk_chars` characters,
+with `latency` spread evenly over the chunks; a client that disconnects mid-stream is
+counted in `aborted_streams` and the rest of the completion is never sent.
+"""
+import argparse, asyncio, json, logging, threading, time
+from typing import Callable, Optional
+
+LOG = logging.getLogger("synth.provider.mock")
+
+def echo_responder(system: str, user: str) -> str:
+    return user[-200:]
+
+class MockServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.1,
+                 responder: Optional[Callable[[str, str], str]] = None, stream_chunk_chars: int = 16):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.responder = responder or echo_responder
+        self.stream_chunk_chars = stream_chunk_chars
+        self.connections = 0
+        self.requests = 0
+        self.aborted_streams = 0
+        self.streamed_chars = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for ln in lines[1:]:
+            if ":" in ln:
+                k, v = ln.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+        return method, path, headers, body
+
+    def _prompt(self, req: dict):
+        msgs = req.get("messages") or []
+        system = next((m["content"] for m in msgs if m.get("role") == "system"), "")
+        user = next((m["content"] for m in msgs if m.get("role") == "user"), "")
+        return system, user
+
+    def _completion(self, body: bytes) -> dict:
+        req = json.loads(body or b"{}")
+        system, user = self._prompt(req)
+        text = self.responder(system, user)
+        return {
+            "id": f"mock-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": len(user.split()), "completion_tokens": len(text.split()),
+                      "total_tokens": len(user.split()) + len(text.split())},
+        }
+
+    async def _stream(self, req: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Writes the completion as chunked SSE; False if the client went away mid-stream."""
+        text = self.responder(*self._prompt(req))
+        n = self.stream_chunk_chars
+        pieces = [text[i:i + n] for i in range(0, len(text), n)] or [""]
+        delay = self.latency / len(pieces)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n")
+        def event(delta: dict, finish=None) -> bytes:
+            data = json.dumps({"id": f"mock-{self.requests}", "object": "chat.completion.chunk",
+                               "created": int(time.time()), "model": req.get("model", "mock"),
+                               "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]})
+            return f"data: {data}\n\n".encode()
+        def chunk(b: bytes) -> bytes:
+            return f"{len(b):x}\r\n".encode() + b + b"\r\n"
+        try:
+            writer.write(chunk(event({"role": "assistant", "content": ""})))
+            for piece in pieces:
+                await asyncio.sleep(delay)
+                if reader.at_eof() or writer.is_closing():
+                    self.aborted_streams += 1
+                    return False
+                writer.write(chunk(event({"content": piece})))
+                await writer.drain()
+                self.streamed_chars += len(piece)
+            writer.write(chunk(event({}, "stop")) + chunk(b"data: [DONE]\n\n") + b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            self.aborted_streams += 1
+            return False
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    method, path, headers, body = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+                    return
+                self.requests += 1
+                if path.rstrip("/").endswith("/chat/completions") and method == "POST":
+                    req = json.loads(body or b"{}")
+                    if req.get("stream"):
+                        if not await self._stream(req, reader, writer):
+                            return
+                        continue
+                    await asyncio.sleep(self.latency)
+                    status, payload = "200 OK", self._completion(body)
+                elif path == "/health":
+                    status, payload = "200 OK", {"status": "ok"}
+                else:
+                    status, payload = "404 Not Found", {"error": {"message": f"no route {path}"}}
+                data = json.dumps(payload).encode()
+                close = headers.get("connection", "").lower() == "close"
+                writer.write((f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                              f"Content-Length: {len(data)}\r\n"
+                              f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n").encode() + data)
+                await writer.drain()
+                if close:
+                    return
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        LOG.info("mock server listening on %s latency=%.3fs", self.base_url, self.latency)
+        return self._server
+
+    def start(self) -> "MockServer":
+        """Run in a daemon thread with its own event loop; returns once listening."""
+        ready = threading.Event()
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+        self._thread = threading.Thread(target=run, name="mock-llm", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        async def shutdown():
+            self._server.close()
+            # drop idle keep-alive connections still parked in _handle
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=0.1)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    srv = MockServer(args.host, args.port, args.latency)
+    async def run():
+        server = await srv.serve()
+        async with server:
+            await server.serve_forever()
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
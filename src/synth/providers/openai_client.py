@@ -2,25 +2,96 @@ import os
 from typing import Optional
 
 try:
-    from openai import OpenAI
+    from openai import OpenAI, AsyncOpenAI
 except Exception:
     OpenAI = None
+    AsyncOpenAI = None
+
+try:
+    import httpx
+except Exception:
+    httpx = None
 
 class OpenAIClient:
-    def __init__(self, model: str, max_tokens: int = 1200, api_key: Optional[str] = None):
+    """
+    `chat` and `achat` each use one pooled keep-alive HTTP client (sync / async),
+    sized by `max_connections`. The async client is created lazily on first use so
+    it binds to the running event loop.
+    """
+    def __init__(self, model: str, max_tokens: int = 1200, api_key: Optional[str] = None,
+                 base_url: Optional[str] = None, max_connections: int = 16, timeout: float = 120.0):
         if OpenAI is None:
             raise ImportError("openai package not installed. `pip install openai`")
-        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.max_connections = max_connections
+        self.timeout = timeout
+        http_client = None
+        if httpx is not None:
+            http_client = httpx.Client(limits=self._limits(), timeout=timeout)
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client)
+        self._aclient = None
         self.model = model
         self.max_tokens = max_tokens
 
+    def _limits(self):
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                            keepalive_expiry=60.0)
+
+    def _messages(self, system: str, user: str):
+        return [{"role":"system","content":system},
+                {"role":"user","content":user}]
+
     def chat(self, system: str, user: str, temperature: float, top_p: float) -> str:
         rsp = self.client.chat.completions.create(
             model=self.model,
-            messages=[{"role":"system","content":system},
-                      {"role":"user","content":user}],
+            messages=self._messages(system, user),
             temperature=temperature,
             top_p=top_p,
             max_tokens=self.max_tokens
         )
         return rsp.choices[0].message.content
+
+    def _async_client(self):
+        if self._aclient is None:
+            http_client = None
+            if httpx is not None:
+                http_client = httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+            self._aclient = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client)
+        return self._aclient
+
+    async def achat(self, system: str, user: str, temperature: float, top_p: float) -> str:
+        rsp = await self._async_client().chat.completions.create(
+            model=self.model,
+            messages=self._messages(system, user),
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=self.max_tokens
+        )
+        return rsp.choices[0].message.content
+
+    async def astream(self, system: str, user: str, temperature: float, top_p: float):
+        """
+        Async generator of completion text deltas. Closing it early (`aclose`, or leaving
+        the `async for`) closes the HTTP response, which cancels generation server-side.
+        """
+        stream = await self._async_client().chat.completions.create(
+            model=self.model,
+            messages=self._messages(system, user),
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=self.max_tokens,
+            stream=True
+        )
+        try:
+            async for ev in stream:
+                if ev.choices and ev.choices[0].delta.content:
+                    yield ev.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def aclose(self):
+        if self._aclient is not None:
+            await self._aclient.close()
+            self._aclient = None
@@ -1,21 +1,121 @@
-import json, pathlib
-
-def load_seed_wfls(seed_dir: str):
-    seeds=[]
-    for p in pathlib.Path(seed_dir).glob("*.wfl"):
-        s = p.read_text(encoding="utf-8", errors="replace")
-        i = s.find("{")
-        if i < 0: continue
-        depth=0; end=None
-        for j,ch in enumerate(s[i:], start=i):
-            if ch=="{": depth+=1
-            elif ch=="}":
-                depth-=1
-                if depth==0:
-                    end=j+1; break
-        if end is None: continue
-        seeds.append(json.loads(s[i:end]))
-    return seeds
+"""
+Seed workflow loading.
+
+Every `*.wfl` file in the seed directory is parsed once and the result (workflow or error) is
+kept in a pickled index next to the seeds, keyed by file name, mtime and size. Later runs only
+re-parse files that changed; misses are parsed on a process pool when there are enough of them.
+Files without a valid JSON object are reported (logged, and returned by `load_seeds`).
+"""
+import logging, os, pathlib, pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from synth.utils.json_utils import extract_first_json_object
+
+LOG = logging.getLogger("synth.seeds")
+
+CACHE_NAME = ".seed_cache.pkl"
+_CACHE_VERSION = 1
+_POOL_MIN_FILES = 64  # below this, process start-up costs more than it saves
+
+class SeedError(NamedTuple):
+    path: str
+    message: str
+
+class SeedLoad(NamedTuple):
+    seeds: List[dict]
+    errors: List[SeedError]
+    parsed: int  # files parsed this call (cache misses)
+
+# name -> (mtime_ns, size, workflow or None, error message or None)
+_Entry = Tuple[int, int, Optional[dict], Optional[str]]
+
+def _parse_seed(path: str) -> Tuple[Optional[dict], Optional[str]]:
+    try:
+        s = pathlib.Path(path).read_text(encoding="utf-8", errors="replace")
+        obj = extract_first_json_object(s)
+    except (OSError, ValueError) as e:  # JSONDecodeError is a ValueError
+        return None, str(e) or type(e).__name__
+    if not isinstance(obj, dict):
+        return None, "top-level JSON value is not an object"
+    return obj, None
+
+def _read_cache(path: pathlib.Path) -> Dict[str, _Entry]:
+    try:
+        with path.open("rb") as f:
+            data = pickle.load(f)
+        if data.get("version") == _CACHE_VERSION:
+            return data["entries"]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        LOG.warning("ignoring unreadable seed cache %s: %s", path, e)
+    return {}
+
+def _write_cache(path: pathlib.Path, entries: Dict[str, _Entry]):
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            pickle.dump({"version": _CACHE_VERSION, "entries": entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError as e:
+        LOG.warning("could not write seed cache %s: %s", path, e)
+        tmp.unlink(missing_ok=True)
+
+def load_seeds(seed_dir: str, cache_path: Optional[str] = None, workers: Optional[int] = None,
+               use_cache: bool = True) -> SeedLoad:
+    """
+    Seeds in file-name order plus one SeedError per file that holds no valid workflow.
+    `cache_path` defaults to <seed_dir>/.seed_cache.pkl; `workers` to the CPU count.
+    """
+    root = pathlib.Path(seed_dir)
+    cache_file = pathlib.Path(cache_path) if cache_path else root / CACHE_NAME
+    old = _read_cache(cache_file) if use_cache else {}
+
+    entries: Dict[str, _Entry] = {}
+    stale: List[Tuple[str, int, int]] = []
+    for p in sorted(root.glob("*.wfl")):
+        st = p.stat()
+        hit = old.get(p.name)
+        if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            entries[p.name] = hit
+        else:
+            stale.append((p.name, st.st_mtime_ns, st.st_size))
+
+    if stale:
+        paths = [str(root / name) for name, _, _ in stale]
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(stale) >= _POOL_MIN_FILES:
+            with ProcessPoolExecutor(workers) as pool:
+                results = list(pool.map(_parse_seed, paths, chunksize=max(1, len(paths) // (workers * 4))))
+        else:
+            results = [_parse_seed(p) for p in paths]
+        for (name, mtime, size), (obj, err) in zip(stale, results):
+            entries[name] = (mtime, size, obj, err)
+    if use_cache and (stale or len(entries) != len(old)):
+        _write_cache(cache_file, entries)
+
+    seeds, errors = [], []
+    for name in sorted(entries):
+        obj, err = entries[name][2], entries[name][3]
+        if err is None:
+            seeds.append(obj)
+        else:
+            errors.append(SeedError(str(root / name), err))
+    return SeedLoad(seeds, errors, len(stale))
+
+def load_seed_wfls(seed_dir: str, cache_path: Optional[str] = None, workers: Optional[int] = None,
+                   strict: bool = False) -> List[dict]:
+    """Valid seed workflows; invalid files are logged, or raise ValueError with `strict`."""
+    res = load_seeds(seed_dir, cache_path=cache_path, workers=workers)
+    for e in res.errors:
+        LOG.warning("invalid seed %s: %s", e.path, e.message)
+    if res.errors:
+        LOG.warning("%d of %d seed files are invalid", len(res.errors), len(res.errors) + len(res.seeds))
+        if strict:
+            raise ValueError(f"{len(res.errors)} invalid seed files, first: {res.errors[0].path}: {res.errors[0].message}")
+    LOG.info("seeds: %d files parsed, %d from cache", res.parsed, len(res.seeds) + len(res.errors) - res.parsed)
+    return res.seeds
 
 def verbalize_seed(obj: dict) -> dict:
     name = (obj.get("Name") or "").strip()
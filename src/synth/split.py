@@ -0,0 +1,85 @@
+import hashlib, heapq, json, pathlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from synth.dedupe import Deduper, NearDeduper, dedupe_key
+
+MAX_VAL = 200
+MIN_VAL = 100
+
+def val_size(n: int) -> int:
+    return max(min(MAX_VAL, n//20), MIN_VAL)
+
+class StreamingSplitWriter:
+    """
+    Dedupes and writes train/val JSONL, and the DPO pairs of each example, as examples arrive.
+
+    Split membership is decided by a content hash: val is the `val_size(n)`
+    unique examples with the smallest hashes (a bottom-k sample), so the split
+    is deterministic and reproducible across reruns. Only the MAX_VAL current
+    smallest candidates are held in memory; everything else goes straight to
+    train.jsonl, and leftover candidates are appended to train on close().
+    With `near`, examples that pass exact dedupe are also checked for near-duplicates.
+
+    Pairs follow their example: those of train examples go to pairs.jsonl, those of val
+    examples to eval_pairs.jsonl, and those of a duplicate are dropped with it, so no eval
+    prompt is also trained on through DPO.
+    """
+    def __init__(self, out_dir: str, near: Optional[NearDeduper] = None):
+        self.out_dir = pathlib.Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._train = (self.out_dir/"train.jsonl").open("w", encoding="utf-8")
+        self._pairs = (self.out_dir/"pairs.jsonl").open("w", encoding="utf-8")
+        self.dedupe = Deduper()
+        self.near = near
+        # max-heap of the MAX_VAL smallest hashes: (-hash, line, pair lines)
+        self._cand: List[Tuple[int, str, str]] = []
+        self.n_train = 0
+        self.n_val = 0
+        self.n_pairs = 0
+        self.n_eval_pairs = 0
+
+    @staticmethod
+    def _line(obj: Dict[str, Any]) -> str:
+        return json.dumps(obj, ensure_ascii=False) + "\n"
+
+    def _write_train(self, line: str, pairs: str):
+        self._train.write(line)
+        self.n_train += 1
+        self._pairs.write(pairs)
+        self.n_pairs += pairs.count("\n")
+
+    def add(self, ex: Dict[str, Any], pairs: Sequence[Dict[str, Any]] = ()) -> bool:
+        """Adds `ex` with its DPO `pairs`; False (and nothing written) if `ex` is a duplicate."""
+        if not self.dedupe.add(ex):
+            return False
+        if self.near is not None and not self.near.add(ex):
+            return False
+        h = int.from_bytes(hashlib.blake2b(dedupe_key(ex), digest_size=8).digest(), "big")
+        item = (-h, self._line(ex), "".join(map(self._line, pairs)))
+        if len(self._cand) < MAX_VAL:
+            heapq.heappush(self._cand, item)
+            return True
+        if h < -self._cand[0][0]:
+            item = heapq.heapreplace(self._cand, item)
+        self._write_train(*item[1:])
+        return True
+
+    def close(self) -> Dict[str, int]:
+        near_removed = self.near.removed if self.near is not None else 0
+        n = len(self.dedupe.seen) - near_removed
+        ranked = sorted(self._cand, reverse=True)          # smallest hash first
+        val_n = min(val_size(n), len(ranked))
+        with (self.out_dir/"val.jsonl").open("w", encoding="utf-8") as f, \
+             (self.out_dir/"eval_pairs.jsonl").open("w", encoding="utf-8") as fp:
+            for _, line, pairs in ranked[:val_n]:
+                f.write(line)
+                fp.write(pairs)
+                self.n_eval_pairs += pairs.count("\n")
+        for _, line, pairs in ranked[val_n:]:
+            self._write_train(line, pairs)
+        self.n_val = val_n
+        self._cand = []
+        self._train.close(); self._pairs.close()
+        return {"unique": n, "duplicates": self.dedupe.removed, "near_duplicates": near_removed,
+                "train": self.n_train, "val": self.n_val, "pairs": self.n_pairs,
+                "eval_pairs": self.n_eval_pairs}
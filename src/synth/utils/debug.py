@@ -15,8 +15,11 @@ class JsonlSink:
         self._f.write(json.dumps(obj, ensure_ascii=False) + "\n")
         self._n += 1
         if self._n % self.flush_every == 0:
-            self._f.flush()
-            os.fsync(self._f.fileno())
+            self.flush()
+
+    def flush(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
 
     def close(self):
         try:
@@ -0,0 +1,44 @@
+"""
+Collect-all-errors validation: every schema and semantic violation of a workflow in one pass,
+as structured Diagnostic(rule, pointer, message) records instead of the first exception.
+"""
+from typing import Any, Dict, Iterable, List
+
+from jsonschema.exceptions import best_match
+
+from synth.utils.errors import Diagnostic
+from synth.utils.schema_validator import get_validator
+from synth.utils.semantic_validate import collect_semantic_errors
+
+def json_pointer(path: Iterable[Any]) -> str:
+    """RFC 6901 pointer for a sequence of keys / indices."""
+    return "".join("/" + str(p).replace("~", "~0").replace("/", "~1") for p in path)
+
+def _schema_message(e) -> str:
+    # oneOf/anyOf messages repeat the whole instance; name the closest branch failure instead
+    if e.context:
+        return f"matches none of the allowed shapes ({e.validator}); closest: {best_match(e.context).message}"
+    return e.message
+
+def collect_schema_errors(obj: Any, schema: Dict[str, Any]) -> List[Diagnostic]:
+    v = get_validator(schema)
+    if v.is_valid(obj):  # the compiled accept path; iter_errors only for what it rejects
+        return []
+    return [Diagnostic(f"schema.{e.validator}", json_pointer(e.absolute_path), _schema_message(e))
+            for e in v.iter_errors(obj)]
+
+def collect_workflow_errors(obj: Any, schema: Dict[str, Any]) -> List[Diagnostic]:
+    """
+    Schema violations first, then semantic ones. The semantic layer runs on a schema-invalid
+    workflow too, as far as its structure allows; a crash there is reported as one diagnostic.
+    """
+    out = collect_schema_errors(obj, schema)
+    try:
+        out += collect_semantic_errors(obj)
+    except Exception as e:
+        out.append(Diagnostic("semantic", "", str(e)))
+    return out
+
+def format_diagnostics(diags: List[Diagnostic]) -> str:
+    """One line per violation, e.g. for the `errors` slot of USER_CRITIC_TMPL."""
+    return "\n".join(f"- [{d.rule}] {d.pointer or '/'}: {d.message}" for d in diags)
@@ -1,4 +1,13 @@
+from typing import NamedTuple
+
+class Diagnostic(NamedTuple):
+    """One validation violation: rule id, RFC 6901 JSON pointer into the workflow, message."""
+    rule: str
+    pointer: str
+    message: str
+
 class SynthesisError(Exception):
-    def __init__(self, msg, raw=None):
+    def __init__(self, msg, raw=None, diagnostics=None):
         super().__init__(msg)
         self.raw = raw
+        self.diagnostics = diagnostics
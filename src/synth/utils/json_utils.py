@@ -1,59 +1,122 @@
-import json, re
-
-_fence_re = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL | re.IGNORECASE)
-_tag_re   = re.compile(r"<json>\s*(\{.*?\})\s*</json>", re.DOTALL | re.IGNORECASE)
-
-def _strip_line_comments_outside_strings(s: str) -> str:
-    out, i, in_str, esc = [], 0, False, False
-    while i < len(s):
-        ch = s[i]
-        if in_str:
-            out.append(ch)
-            if esc: esc = False
-            elif ch == "\\": esc = True
-            elif ch == '"': in_str = False
-            i += 1
-        else:
-            if ch == '"':
-                in_str = True
-                out.append(ch); i += 1
-            elif ch == "/" and i+1 < len(s) and s[i+1] == "/":
-                # skip until newline
-                while i < len(s) and s[i] not in "\r\n": i += 1
-            else:
-                out.append(ch); i += 1
-    return "".join(out)
+import hashlib, json, re
 
-def extract_json_block(text: str):
-    # 1) Prefer <json>...</json>
-    m = _tag_re.search(text)
-    if m:
-        cleaned = _strip_line_comments_outside_strings(m.group(1))
-        return json.loads(cleaned)
-    # 2) Then try fenced code ```json ... ```
-    m = _fence_re.search(text)
-    if m:
-        cleaned = _strip_line_comments_outside_strings(m.group(1))
-        return json.loads(cleaned)
-    # 3) Fallback: naive first balanced {...}
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+_tag_open_re   = re.compile(r"<json>", re.IGNORECASE)
+_fence_open_re = re.compile(r"```(?:json)?\s*(?=\{)", re.IGNORECASE)
+# one token per match: a whole string literal (escapes included), a // line comment, or a brace
+_scan_re = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|//[^\r\n]*|[{}]', re.DOTALL)
+
+def loads(s: str):
+    """json.loads, through orjson when installed. Anything orjson rejects (NaN, ints beyond
+    64 bits, invalid JSON) is re-parsed by json so results and error messages match json."""
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s)
+
+def object_span(text: str, start: int):
+    """
+    (start, end, comments) of the balanced {...} opening at text[start], in one pass.
+    Braces inside string literals are ignored; `comments` are the spans of // line comments
+    outside strings.
+    """
+    depth = 0
+    comments = []
+    for m in _scan_re.finditer(text, start):
+        tok = m.group()
+        if tok == "{":
+            depth += 1
+        elif tok == "}":
+            depth -= 1
+            if depth == 0:
+                return start, m.end(), comments
+        elif tok.startswith("//"):
+            comments.append(m.span())
+    raise ValueError("Unbalanced braces")
+
+def parse_object_at(text: str, start: int):
+    i, end, comments = object_span(text, start)
+    if not comments:
+        return loads(text[i:end])
+    parts, pos = [], i
+    for a, b in comments:
+        parts.append(text[pos:a]); pos = b
+    parts.append(text[pos:end])
+    return loads("".join(parts))
+
+def extract_first_json_object(text: str):
+    """The first balanced {...} in text (e.g. the body of a .wfl file), // comments dropped."""
     i = text.find("{")
     if i < 0:
         raise ValueError("No JSON start")
-    depth=0; end=None
-    for j,ch in enumerate(text[i:], start=i):
-        if ch=="{": depth+=1
-        elif ch=="}":
-            depth-=1
-            if depth==0:
-                end=j+1; break
-    if end is None:
-        raise ValueError("Unbalanced braces")
-    cleaned = _strip_line_comments_outside_strings(text[i:end])
-    return json.loads(cleaned)
+    return parse_object_at(text, i)
+
+def extract_json_block(text: str):
+    # 1) Prefer <json>...</json>, 2) then a fenced code block, 3) else the first balanced {...}
+    m = _tag_open_re.search(text)
+    if m:
+        i = text.find("{", m.end())
+        if i >= 0:
+            return parse_object_at(text, i)
+    m = _fence_open_re.search(text)
+    if m:
+        return parse_object_at(text, m.end())
+    return extract_first_json_object(text)
 
 def canonical_json(obj):
     return json.dumps(obj, sort_keys=True, separators=(",",":"))
 
+# step ids and the rule / variable references to them: renumbered in first-seen order
+FINGERPRINT_ID_KEYS = ("id", "workflowStepId")
+# stamped with the current time by normalization: not part of what a workflow does
+FINGERPRINT_VOLATILE_KEYS = ("startDate",)
+# in compact JSON a quote inside a string literal is escaped, so b'"id":' only ever matches a key
+_FP_ID_KEYS = tuple(f'"{k}":'.encode() for k in FINGERPRINT_ID_KEYS)
+_FP_VOLATILE_KEYS = tuple(f'"{k}":'.encode() for k in FINGERPRINT_VOLATILE_KEYS)
+_fp_id_re = re.compile(rb'-?\d+|"[^"\\]*"')
+_fp_value_re = re.compile(rb'"(?:[^"\\]|\\.)*"|[^,}\]]*')
+
+def _sorted_dumps(obj) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+    return json.dumps(obj, sort_keys=True, separators=(",",":"), ensure_ascii=False).encode("utf-8")
+
+def workflow_fingerprint(obj) -> bytes:
+    """
+    16-byte digest of a workflow that ignores step ids and volatile timestamps: the sorted
+    compact JSON with every id / workflowStepId value renumbered in order of appearance and
+    every startDate nulled. Workflows that differ only in ids or stamped dates hash equal.
+    Cheaper than sha256(canonical_json(obj)): orjson serializes, and the rewrite is a few
+    bytes.split calls on the literal keys rather than a scan in Python.
+    """
+    data = _sorted_dumps(obj)
+    ids = {}
+    for key in _FP_ID_KEYS:
+        parts = data.split(key)
+        if len(parts) > 1:
+            for i in range(1, len(parts)):
+                p = parts[i]
+                m = _fp_id_re.match(p)
+                if m:
+                    parts[i] = b"%d" % ids.setdefault(m.group(), len(ids)) + p[m.end():]
+            data = key.join(parts)
+    for key in _FP_VOLATILE_KEYS:
+        parts = data.split(key)
+        if len(parts) > 1:
+            for i in range(1, len(parts)):
+                parts[i] = b"null" + parts[i][_fp_value_re.match(parts[i]).end():]
+            data = key.join(parts)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
 def norm_text(t: str):
     t = t.lower()
     t = re.sub(r"\s+"," ", t)
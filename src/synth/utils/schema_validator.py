@@ -0,0 +1,125 @@
+"""
+JSON Schema validation compiled once per process.
+
+`jsonschema.validate(instance, schema)` re-checks the schema and builds a new validator (and ref
+resolver) on every call. `get_validator(schema)` does that once per schema object and caches the
+result; `validate_schema(obj, schema)` is the drop-in replacement for `jsonschema.validate`.
+
+If `fastjsonschema` is installed, a code-generated validator is used for the accept path. It only
+supports up to draft-07, so the draft 2020-12 keywords this repo's schema uses are rewritten
+first (`$defs`, `prefixItems`; `$recursiveRef`, which 2020-12 ignores, is dropped, and so is
+`default`, which fastjsonschema would write into the instance). Schemas with
+other post-draft-07 keywords keep the jsonschema path. On rejection the jsonschema validator
+re-runs to raise exactly the error `jsonschema.validate` would.
+"""
+import copy, json, logging, pathlib
+from functools import lru_cache
+from typing import Any, Dict, Iterator
+
+from jsonschema.exceptions import ValidationError, best_match
+from jsonschema.validators import validator_for
+
+try:
+    import fastjsonschema
+except Exception:
+    fastjsonschema = None
+
+LOG = logging.getLogger("synth.schema")
+
+# keywords fastjsonschema does not implement and that cannot be rewritten to draft-07
+_NO_FAST_KEYWORDS = {"$dynamicRef", "$dynamicAnchor", "$recursiveAnchor", "unevaluatedProperties",
+                     "unevaluatedItems", "dependentSchemas", "dependentRequired", "minContains", "maxContains"}
+_DRAFT7 = "http://json-schema.org/draft-07/schema#"
+
+def _to_draft7(node: Any) -> Any:
+    """Rewrites a draft 2020-12 schema to the equivalent draft-07 one; ValueError if not possible."""
+    if isinstance(node, list):
+        return [_to_draft7(x) for x in node]
+    if not isinstance(node, dict):
+        return node
+    bad = _NO_FAST_KEYWORDS.intersection(node)
+    if bad:
+        raise ValueError(f"no draft-07 equivalent for {sorted(bad)}")
+    if "$ref" in node and len(node) > 1:
+        # draft-07 ignores keywords next to $ref; 2020-12 applies them
+        rest = {k: v for k, v in node.items() if k != "$ref"}
+        return _to_draft7({"allOf": [{"$ref": node["$ref"]}, rest]})
+    out = {}
+    for k, v in node.items():
+        if k in ("$recursiveRef", "default"):
+            continue  # fastjsonschema would write defaults into the instance
+        if k == "$defs":
+            out["definitions"] = {name: _to_draft7(x) for name, x in v.items()}
+        elif k == "$ref" and isinstance(v, str):
+            out["$ref"] = v.replace("#/$defs/", "#/definitions/")
+        elif k == "prefixItems":
+            out["items"] = _to_draft7(v)
+            if "items" in node:
+                out["additionalItems"] = _to_draft7(node["items"])
+        elif k == "items" and "prefixItems" in node:
+            continue
+        elif k in ("properties", "patternProperties", "definitions"):
+            out[k] = {name: _to_draft7(x) for name, x in v.items()}
+        elif k in ("const", "enum", "examples"):
+            out[k] = copy.deepcopy(v)
+        else:
+            out[k] = _to_draft7(v)
+    return out
+
+def _compile_fast(schema: Dict[str, Any]):
+    if fastjsonschema is None:
+        return None
+    try:
+        s = _to_draft7(schema)
+        if "2020-12" in str(schema.get("$schema", "")):
+            s["$schema"] = _DRAFT7
+        # jsonschema does not assert "format" without a format checker; match that
+        return fastjsonschema.compile(s, use_formats=False)
+    except Exception as e:
+        LOG.info("fastjsonschema unavailable for this schema (%s); using jsonschema only", e)
+        return None
+
+class SchemaValidator:
+    """A schema checked and compiled once; `validate` raises like `jsonschema.validate`."""
+    def __init__(self, schema: Dict[str, Any], fast: bool = True):
+        self.schema = schema
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        self._validator = cls(schema)
+        self._fast = _compile_fast(schema) if fast else None
+
+    def iter_errors(self, obj: Any) -> Iterator[ValidationError]:
+        return self._validator.iter_errors(obj)
+
+    def is_valid(self, obj: Any) -> bool:
+        if self._fast is not None:
+            try:
+                self._fast(obj)
+                return True
+            except fastjsonschema.JsonSchemaException:
+                return False
+        return self._validator.is_valid(obj)
+
+    def validate(self, obj: Any):
+        if self._fast is not None and self.is_valid(obj):
+            return
+        error = best_match(self._validator.iter_errors(obj))
+        if error is not None:
+            raise error
+
+# keyed by id(); the entry keeps the schema alive so the id cannot be reused
+_CACHE: Dict[int, SchemaValidator] = {}
+
+def get_validator(schema: Dict[str, Any]) -> SchemaValidator:
+    v = _CACHE.get(id(schema))
+    if v is None or v.schema is not schema:
+        v = _CACHE[id(schema)] = SchemaValidator(schema)
+    return v
+
+def validate_schema(obj: Any, schema: Dict[str, Any]):
+    """Drop-in for `jsonschema.validate(instance=obj, schema=schema)` with a cached validator."""
+    get_validator(schema).validate(obj)
+
+@lru_cache(maxsize=None)
+def load_validator(path: str) -> SchemaValidator:
+    return get_validator(json.loads(pathlib.Path(path).read_text(encoding="utf-8")))
@@ -1,9 +1,9 @@
-from typing import Dict, Any, List, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime, timezone
-import copy
 import re
 
 from synth.utils.contracts import NOTIFICATION_TYPES, SCOPE_MAP, ALLOWED_ACTION_TYPES
+from synth.utils.errors import Diagnostic
 
 DATE_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z$")
 MAX_INT64 = (1 << 63) - 1
@@ -50,19 +50,6 @@ def _normalize_schedule_dates(step: Dict[str, Any]):
     if not sched.get("timezone"):
         sched["timezone"] = "UTC"
 
-def _validate_trigger_first_only(wf: Dict[str, Any]):
-    steps = wf.get("workflowSteps", [])
-    assert steps and _is_trigger(steps[0]), "First step must be a TRIGGER"
-    for i, s in enumerate(steps):
-        if _is_trigger(s) and i != 0:
-            raise AssertionError("Trigger may appear only once and only as the first step")
-    # triggers are not allowed inside condition branches (enforce strictly)
-    for s in steps[1:]:
-        if _is_condition(s):
-            for x in _walk_sequences([s]):
-                if _is_trigger(x):
-                    raise AssertionError("Trigger cannot appear inside condition branches")
-
 def _validate_trigger(t: Dict[str, Any]):
     ttype = t.get("triggerType")
     sub  = t.get("triggerSubType")
@@ -98,112 +85,6 @@ def _validate_trigger(t: Dict[str, Any]):
     else:
         raise AssertionError("Unknown triggerType")
 
-def _validate_end_is_last(seq: List[Dict[str, Any]]):
-    seen_end = False
-    for idx, s in enumerate(seq):
-        if _is_condition(s):
-            _validate_end_is_last(s.get("positiveOutcome", []) or [])
-            _validate_end_is_last(s.get("negativeOutcome", []) or [])
-            if seen_end:
-                raise AssertionError("No steps allowed after End Workflow in a branch")
-        elif _is_action(s) and s.get("actionType") == 15:
-            # must be literally the last in this seq
-            if idx != len(seq) - 1:
-                raise AssertionError("End Workflow must be the last step in its branch")
-            seen_end = True
-        elif seen_end:
-            raise AssertionError("No steps allowed after End Workflow in a branch")
-
-def _collect_produced_variables(seq: List[Dict[str, Any]]):
-    """
-    Returns dict name->type_code (0=Boolean,1=Number,2=Text,3=DateTime)
-    """
-    vars_map = {}
-    for s in _walk_sequences(seq):
-        if _is_action(s):
-            at = s.get("actionType")
-            p  = s.get("parameters") or {}
-            if at in (24,27,36):
-                if p.get("captureOutput") and p.get("outputVariable"):
-                    vars_map[p["outputVariable"]] = 2  # Text
-            elif at == 37:
-                vname = p.get("variableName")
-                vtype = p.get("variableType")
-                if isinstance(vname, str) and vname:
-                    # map to 0..3 (Boolean,Number,Text,DateTime)
-                    typemap = {
-                        0:0,1:0,2:0,3:0,4:0,5:0,7:0,9:0,16:0,  # Booleans
-                        11:1,                                   # Number
-                        6:2,10:2,12:2,13:2,14:2,15:2,           # Text/various
-                        8:3                                     # DateTime
-                    }
-                    vars_map[vname] = typemap.get(vtype, 2)
-    return vars_map
-
-def _scan_string_placeholders(val) -> List[str]:
-    out=[]
-    if isinstance(val, str):
-        out += re.findall(r"#([0-9]{6,})", val)
-    elif isinstance(val, list):
-        for x in val: out += _scan_string_placeholders(x)
-    elif isinstance(val, dict):
-        for x in val.values(): out += _scan_string_placeholders(x)
-    return out
-
-def _validate_variables_links(seq: List[Dict[str, Any]]):
-    produced = _collect_produced_variables(seq)
-    produced_names = set(produced.keys())
-
-    # uniqueness of variable names
-    if len(produced_names) != len(produced):
-        raise AssertionError("Variable names must be unique within workflow")
-
-    for s in _walk_sequences(seq):
-        if _is_condition(s):
-            for r in (s.get("rules") or []):
-                if r.get("propertyId") == "Variable":
-                    vname = r.get("variablesId")
-                    assert vname in produced_names, f"Rule references unknown variable '{vname}'"
-        if _is_action(s):
-            p = s.get("parameters") or {}
-            # placeholders in strings must have a matching entry in parameters.variables
-            placeholders = set(_scan_string_placeholders(p))
-            vars_arr = p.get("variables") or []
-            ids_in_vars = { v.get("variableId") for v in vars_arr if isinstance(v, dict) }
-            if placeholders and not placeholders.issubset(ids_in_vars):
-                missing = placeholders - ids_in_vars
-                raise AssertionError(f"Missing variable references for ids: {sorted(missing)}")
-            # each VarRef.sourceId must correspond to a produced variable name
-            for v in vars_arr:
-                src = v.get("sourceId"); tp = v.get("type")
-                assert src in produced_names, f"VarRef.sourceId '{src}' not produced earlier"
-                # optional: type compatibility can be checked here using produced[src] vs tp
-
-def _validate_actions(seq: List[Dict[str, Any]]):
-    for s in _walk_sequences(seq):
-        if _is_action(s):
-            at = s.get("actionType")
-            assert at in ALLOWED_ACTION_TYPES, f"Unknown actionType {at}"
-            p = s.get("parameters")
-            if at == 26 and isinstance(p, dict):
-                if p.get("type") == 1:
-                    assert 0 < int(p.get("minutes", -1)) < 60, "Reboot 'minutes' must be 1..59 when type==1"
-
-def _validate_rules_operators(seq: List[Dict[str, Any]]):
-    for s in _walk_sequences(seq):
-        if _is_condition(s):
-            for r in (s.get("rules") or []):
-                pid = r.get("propertyId")
-                op = r.get("operator")
-                assert isinstance(op, int) and 0 <= op <= 12, "operator must be 0..12"
-                if pid == "oSType":
-                    assert r.get("value") in (1,2,3), "oSType value must be 1,2,3"
-                if pid == "scope":
-                    name = r.get("scopeName"); sid = r.get("scopeId")
-                    assert name in SCOPE_MAP, f"Unknown scopeName '{name}'"
-                    if sid is not None:
-                        assert sid == SCOPE_MAP[name], f"scopeId {sid} does not match scopeName '{name}'"
-
 def _get_steps_array(wf: Dict[str, Any]) -> List[Dict[str, Any]]:
     if isinstance(wf.get("workflowSteps"), list):
         return wf["workflowSteps"]
@@ -220,34 +101,6 @@ def _as_int64_id(v, where: str):
         raise AssertionError(f"{where}: id must be within 0..{MAX_INT64}")
     return n
 
-def _validate_ids_castable(seq: List[Dict[str, Any]]):
-    for s in _walk_sequences(seq):
-        # step id
-        if "id" in s:
-            _as_int64_id(s["id"], "step.id")
-        # condition rules ids
-        if _is_condition(s):
-            for r in (s.get("rules") or []):
-                if "workflowStepId" in r:
-                    _as_int64_id(r["workflowStepId"], "rule.workflowStepId")
-        # VarRef workflowStepId + variableId pattern
-        if _is_action(s):
-            p = s.get("parameters") or {}
-            for v in p.get("variables") or []:
-                if "workflowStepId" in v:
-                    _as_int64_id(v["workflowStepId"], "VarRef.workflowStepId")
-                vid = v.get("variableId")
-                if not (isinstance(vid, str) and PLACEHOLDER_RE.fullmatch("#" + vid)):
-                    raise AssertionError("VarRef.variableId must be a digit string of length ≥ 6")
-
-def _validate_disallowed_rule_properties(seq: List[Dict[str, Any]]):
-    for s in _walk_sequences(seq):
-        if _is_condition(s):
-            for r in (s.get("rules") or []):
-                pid = r.get("propertyId")
-                if pid not in ALLOWED_RULE_PROPERTY_IDS:
-                    raise AssertionError(f"Disallowed rule propertyId '{pid}' (allowed: {sorted(ALLOWED_RULE_PROPERTY_IDS)})")
-
 def _scan_placeholders_in(obj) -> Set[str]:
     out = set()
     if isinstance(obj, str):
@@ -258,29 +111,84 @@ def _scan_placeholders_in(obj) -> Set[str]:
         for x in obj.values(): out |= _scan_placeholders_in(x)
     return out
 
-def _produce_vars_from_action(s: Dict[str, Any], seen_types: Dict[str,int]):
-    """Mutates seen_types when an action produces a variable."""
-    if not _is_action(s):
-        return
-    at = s.get("actionType")
-    p  = s.get("parameters") or {}
-    if at in (24,27,36):
-        if p.get("captureOutput") and p.get("outputVariable"):
-            name = p["outputVariable"]
-            if name in seen_types:
-                raise AssertionError(f"Variable '{name}' is produced more than once")
-            seen_types[name] = 2  # Text
-    elif at == 37:
-        vname = p.get("variableName")
-        vtype = p.get("variableType")
-        if isinstance(vname, str) and vname:
-            if vname in seen_types:
-                raise AssertionError(f"Variable '{vname}' is produced more than once")
-            seen_types[vname] = _VAR_TYPEMAP.get(vtype, 2)
+# Check groups of the validator. Errors are reported in this order, and within a group in
+# step pre-order (positive branch before negative), i.e. exactly as the former one-pass-per-check
+# implementation raised them, but all groups are evaluated in a single traversal.
+_P_TRIGGER_FIRST  = 0   # first step is a trigger
+_P_TRIGGER_DUP    = 1   # trigger only as the first step
+_P_TRIGGER_BRANCH = 2   # no trigger inside condition branches
+_P_TRIGGER        = 3   # trigger details
+_P_END_LAST       = 4   # End Workflow last in its branch
+_P_ACTIONS        = 5   # actionType + reboot minutes
+_P_RULE_OPERATORS = 6   # operator / oSType / scope
+_P_RULE_PROPS     = 7   # allowed rule propertyIds
+_P_IDS            = 8   # int64-castable ids, VarRef.variableId
+_P_RULE_ORDER     = 9   # Variable rules after the producer in document order
+_P_PATHWISE       = 10  # VarRefs / Variable rules in scope on their path, unique producers
+
+# rule ids reported in Diagnostic.rule
+RULE_IDS = {
+    _P_TRIGGER_FIRST:  "trigger_first",
+    _P_TRIGGER_DUP:    "trigger_unique",
+    _P_TRIGGER_BRANCH: "trigger_in_branch",
+    _P_TRIGGER:        "trigger",
+    _P_END_LAST:       "end_workflow_last",
+    _P_ACTIONS:        "action",
+    _P_RULE_OPERATORS: "rule_operator",
+    _P_RULE_PROPS:     "rule_property",
+    _P_IDS:            "ids",
+    _P_RULE_ORDER:     "variable_order",
+    _P_PATHWISE:       "variable_scope",
+}
 
-def _validate_action_varrefs_in_scope(s: Dict[str, Any], seen_types: Dict[str,int]):
-    if not _is_action(s):
-        return
+def _check_trigger_first(steps: List[Dict[str, Any]]):
+    assert isinstance(steps, list) and steps and _is_trigger(steps[0]), "First step must be a TRIGGER"
+
+def _check_action(s: Dict[str, Any]):
+    at = s.get("actionType")
+    assert at in ALLOWED_ACTION_TYPES, f"Unknown actionType {at}"
+    p = s.get("parameters")
+    if at == 26 and isinstance(p, dict):
+        if p.get("type") == 1:
+            assert 0 < int(p.get("minutes", -1)) < 60, "Reboot 'minutes' must be 1..59 when type==1"
+
+def _check_rule_operator(r: Dict[str, Any]):
+    pid = r.get("propertyId")
+    op = r.get("operator")
+    assert isinstance(op, int) and 0 <= op <= 12, "operator must be 0..12"
+    if pid == "oSType":
+        assert r.get("value") in (1,2,3), "oSType value must be 1,2,3"
+    if pid == "scope":
+        name = r.get("scopeName"); sid = r.get("scopeId")
+        assert name in SCOPE_MAP, f"Unknown scopeName '{name}'"
+        if sid is not None:
+            assert sid == SCOPE_MAP[name], f"scopeId {sid} does not match scopeName '{name}'"
+
+def _check_rule_property(r: Dict[str, Any]):
+    pid = r.get("propertyId")
+    if pid not in ALLOWED_RULE_PROPERTY_IDS:
+        raise AssertionError(f"Disallowed rule propertyId '{pid}' (allowed: {sorted(ALLOWED_RULE_PROPERTY_IDS)})")
+
+def _check_ids(s: Dict[str, Any]):
+    # step id
+    if "id" in s:
+        _as_int64_id(s["id"], "step.id")
+    # condition rules ids
+    if _is_condition(s):
+        for r in (s.get("rules") or []):
+            if "workflowStepId" in r:
+                _as_int64_id(r["workflowStepId"], "rule.workflowStepId")
+    # VarRef workflowStepId + variableId pattern
+    if _is_action(s):
+        p = s.get("parameters") or {}
+        for v in p.get("variables") or []:
+            if "workflowStepId" in v:
+                _as_int64_id(v["workflowStepId"], "VarRef.workflowStepId")
+            vid = v.get("variableId")
+            if not (isinstance(vid, str) and PLACEHOLDER_RE.fullmatch("#" + vid)):
+                raise AssertionError("VarRef.variableId must be a digit string of length ≥ 6")
+
+def _check_varrefs_in_scope(s: Dict[str, Any], seen_types: Dict[str,int]):
     p = s.get("parameters") or {}
     placeholders = _scan_placeholders_in(p)
     vars_arr = p.get("variables") or []
@@ -296,7 +204,7 @@ def _validate_action_varrefs_in_scope(s: Dict[str, Any], seen_types: Dict[str,in
         src = v.get("sourceId")
         if src not in seen_types:
             raise AssertionError(f"VarRef.sourceId '{src}' not produced yet in this branch")
-        # 3) Optional: type compatibility (0=Bool,1=Num,2=Text,3=DateTime)
+        # 3) type compatibility (0=Bool,1=Num,2=Text,3=DateTime)
         vt_expected = seen_types[src]
         vt_given = v.get("type")
         if vt_given not in (0,1,2,3):
@@ -314,117 +222,196 @@ def _validate_action_varrefs_in_scope(s: Dict[str, Any], seen_types: Dict[str,in
             if seen_types.get(src) != 2:
                 raise AssertionError(f"variableRecipients must reference Text variables; '{src}' is not Text")
 
-def _validate_rules_in_scope(s: Dict[str, Any], seen_types: Dict[str,int]):
-    if not _is_condition(s):
-        return
-    for r in (s.get("rules") or []):
-        pid = r.get("propertyId")
-        op  = r.get("operator")
-        if not (isinstance(op, int) and 0 <= op <= 12):
-            raise AssertionError("operator must be 0..12")
-        if pid == "oSType":
-            if r.get("value") not in (1,2,3):
-                raise AssertionError("oSType value must be 1,2,3")
-        elif pid == "scope":
-            name = r.get("scopeName"); sid = r.get("scopeId")
-            assert name in SCOPE_MAP, f"Unknown scopeName '{name}'"
-            if sid is not None:
-                assert sid == SCOPE_MAP[name], f"scopeId {sid} does not match scopeName '{name}'"
-        elif pid == "Variable":
-            vname = r.get("variablesId")
-            if vname not in seen_types:
-                raise AssertionError(f"Rule references variable '{vname}' before it is produced on this branch")
+def _check_rule_in_scope(r: Dict[str, Any], seen_types: Dict[str,int]):
+    # operator / oSType / scope are already covered by _P_RULE_OPERATORS, which reports first
+    if r.get("propertyId") == "Variable":
+        vname = r.get("variablesId")
+        if vname not in seen_types:
+            raise AssertionError(f"Rule references variable '{vname}' before it is produced on this branch")
 
-def _validate_pathwise(seq: List[Dict[str, Any]], seen_types: Dict[str,int]):
+def _produce_in_scope(s: Dict[str, Any], seen_types: Dict[str,int]) -> Optional[str]:
+    """Records a variable produced by action `s` in seen_types; returns its name."""
+    at = s.get("actionType")
+    p  = s.get("parameters") or {}
+    if at in (24,27,36):
+        if p.get("captureOutput") and p.get("outputVariable"):
+            name = p["outputVariable"]
+            if name in seen_types:
+                raise AssertionError(f"Variable '{name}' is produced more than once")
+            seen_types[name] = 2  # Text
+            return name
+    elif at == 37:
+        vname = p.get("variableName")
+        vtype = p.get("variableType")
+        if isinstance(vname, str) and vname:
+            if vname in seen_types:
+                raise AssertionError(f"Variable '{vname}' is produced more than once")
+            seen_types[vname] = _VAR_TYPEMAP.get(vtype, 2)
+            return vname
+    return None
+
+def _produced_name(s: Dict[str, Any]) -> Optional[str]:
+    """Variable name an action counts as producing for the document-order rule check."""
+    at = s.get("actionType"); p = (s.get("parameters") or {})
+    if at in (24,27,36) and p.get("captureOutput") and p.get("outputVariable"):
+        return p["outputVariable"]
+    if at == 37 and isinstance(p.get("variableName"), str):
+        return p["variableName"]
+    return None
+
+def _raise(e: Exception):
+    raise e
+
+class _SinglePass:
     """
-    Enforce path-ordered semantics:
-      - VarRefs & Variable rules may only use variables produced SO FAR on the same branch.
-      - After each action, newly-produced variables become available downstream.
+    One pre-order traversal evaluating every check group.
+
+    By default keeps the first error of each group and stops evaluating a group once it
+    failed; with `collect=True` every violation is recorded with the JSON pointer of the
+    step or rule it was found at.
+
+    Document-order producers are tracked as pre-order positions (name -> first position,
+    step id -> first position) instead of re-walking from the root for every condition,
+    and the per-path scope is one dict with an undo log instead of a copy per branch.
     """
-    for s in seq:
-        # check usage against current scope
-        _validate_action_varrefs_in_scope(s, seen_types)
-        _validate_rules_in_scope(s, seen_types)
-        # branch recursion with copies of current scope
-        if _is_condition(s):
-            pos = s.get("positiveOutcome", []) or []
-            neg = s.get("negativeOutcome", []) or []
-            _validate_pathwise(pos, copy.deepcopy(seen_types))
-            _validate_pathwise(neg, copy.deepcopy(seen_types))
-        # after validation, record any newly produced variables for subsequent siblings
-        _produce_vars_from_action(s, seen_types)
-
-def _validate_variables_links_pathwise(seq: List[Dict[str, Any]]):
-    # Also keep global uniqueness of *names*
-    all_names: Set[str] = set()
-    def collect_names(s):
-        if _is_action(s):
-            p = s.get("parameters") or {}
-            if s.get("actionType") in (24,27,36):
-                if p.get("captureOutput") and p.get("outputVariable"):
-                    all_names.add(p["outputVariable"])
-            elif s.get("actionType") == 37 and isinstance(p.get("variableName"), str):
-                all_names.add(p["variableName"])
-    for s in _walk_sequences(seq): collect_names(s)
-    if len(all_names) != len(set(all_names)):
-        raise AssertionError("Variable names must be unique within workflow")
-
-    # Now pathwise validation
-    _validate_pathwise(seq, seen_types={})
-
-def _produced_before_along_path(seq, upto_id):
-    produced = set()
-    def walk(branch):
-        nonlocal produced
-        for s in branch:
-            if s.get("id") == upto_id:
-                return True
-            if _is_action(s):
-                at = s.get("actionType"); p = (s.get("parameters") or {})
-                if at in (24,27,36) and p.get("captureOutput") and p.get("outputVariable"):
-                    produced.add(p["outputVariable"])
-                elif at == 37 and isinstance(p.get("variableName"), str):
-                    produced.add(p["variableName"])
-            if _is_condition(s):
-                if walk(p := s.get("positiveOutcome") or []): return True
-                if walk(n := s.get("negativeOutcome") or []): return True
-        return False
-
-    walk(seq)
-    return produced
-
-def _validate_variable_rule_order(seq):
-    for s in _walk_sequences(seq):
-        if _is_condition(s):
-            before = _produced_before_along_path(seq, s.get("id"))
-            for r in (s.get("rules") or []):
-                if r.get("propertyId") == "Variable":
-                    vname = r.get("variablesId")
-                    assert vname in before, f"Condition {s.get('displayName')} uses variable '{vname}' before it is produced in this path"
-
-def _validate_rule_property_ids(seq):
-    for s in _walk_sequences(seq):
-        if _is_condition(s):
-            for r in s.get("rules") or []:
-                pid = r.get("propertyId")
-                assert pid not in NOT_ALLOWED_RULE_PROPERTY_IDS, f"Not allowed rule propertyId '{pid}'"
+    def __init__(self, collect: bool = False):
+        self.collect = collect
+        self.first: Dict[int, Exception] = {}
+        self.errors: List[Tuple[int, str, Exception]] = []
+        self.pos = 0
+        self.produced_at: Dict[Any, int] = {}
+        self.id_at: Dict[Any, int] = {}
+        self.scope: Dict[str, int] = {}
+        self.added: List[str] = []
+        self.unhashable: Optional[Tuple[int, str, TypeError]] = None
+
+    def _fail(self, group: int, ptr: str, e: Exception):
+        self.first.setdefault(group, e)
+        if self.collect:
+            self.errors.append((group, ptr, e))
+
+    def _run(self, group: int, ptr: str, fn, *args):
+        if group in self.first and not self.collect:
+            return None
+        try:
+            return fn(*args)
+        except Exception as e:
+            self._fail(group, ptr, e)
+            return None
+
+    def run(self, wf: Dict[str, Any]):
+        steps = wf.get("workflowSteps", [])
+        if not self.collect:
+            _check_trigger_first(steps)
+        else:
+            self._run(_P_TRIGGER_FIRST, "/workflowSteps/0", _check_trigger_first, steps)
+            if not isinstance(steps, list):
+                return
+        self.visit(steps, "/workflowSteps")
+        if self.unhashable is not None:
+            # the old pathwise check collected every produced name before walking any path,
+            # so an unhashable one fails the group ahead of errors found earlier in pre-order
+            _, ptr, e = self.unhashable
+            self.first[_P_PATHWISE] = e
+            if self.collect:  # _produce_in_scope recorded it in pre-order; list it first instead
+                i = next(i for i, (g, p, x) in enumerate(self.errors)
+                         if g == _P_PATHWISE and p == ptr and str(x) == str(e))
+                self.errors.insert(0, self.errors.pop(i))
+        if _P_TRIGGER_FIRST in self.first:
+            return
+        if not self.collect and (_P_TRIGGER_DUP in self.first or _P_TRIGGER_BRANCH in self.first):
+            return
+        # trigger details (may normalize schedule dates in place)
+        self._run(_P_TRIGGER, "/workflowSteps/0", _validate_trigger, steps[0])
+
+    def visit(self, seq: List[Dict[str, Any]], base: str, top: bool = True):
+        n = len(seq)
+        for idx, s in enumerate(seq):
+            pos = self.pos; self.pos += 1
+            ptr = f"{base}/{idx}"
+            if not isinstance(s, dict):
+                self._run(_P_TRIGGER_DUP if top else _P_TRIGGER_BRANCH, ptr, _is_trigger, s)
+                continue
+            wst = s.get("workflowStepType")
+            if wst == 1:
+                if not top:
+                    self._fail(_P_TRIGGER_BRANCH, ptr, AssertionError("Trigger cannot appear inside condition branches"))
+                elif idx != 0:
+                    self._fail(_P_TRIGGER_DUP, ptr, AssertionError("Trigger may appear only once and only as the first step"))
+            self._run(_P_IDS, ptr, _check_ids, s)
+            try:
+                first_pos = self.id_at.setdefault(s.get("id"), pos)
+            except TypeError:
+                first_pos = pos  # unhashable id, already reported under _P_IDS
+
+            if wst == 0:
+                if s.get("actionType") == 15 and idx != n - 1:
+                    self._fail(_P_END_LAST, ptr, AssertionError("End Workflow must be the last step in its branch"))
+                self._run(_P_ACTIONS, ptr, _check_action, s)
+                self._run(_P_PATHWISE, ptr, _check_varrefs_in_scope, s, self.scope)
+                name = self._run(_P_PATHWISE, ptr, _produce_in_scope, s, self.scope)
+                if name is not None:
+                    self.added.append(name)
+                name = self._run(_P_RULE_ORDER, ptr, _produced_name, s)
+                if name is not None:
+                    try:
+                        self.produced_at.setdefault(name, pos)
+                    except TypeError as e:
+                        if self.unhashable is None:
+                            self.unhashable = (pos, ptr, e)
+            elif wst == 2:
+                # the old order check re-walked from the root up to the condition's id and
+                # failed on any unhashable name it collected on the way
+                if self.unhashable is not None and self.unhashable[0] < first_pos:
+                    self._run(_P_RULE_ORDER, self.unhashable[1], _raise, self.unhashable[2])
+                rules = s.get("rules") or []
+                if not isinstance(rules, list):
+                    rules = self._run(_P_RULE_OPERATORS, f"{ptr}/rules", list, rules) or []
+                for j, r in enumerate(rules):
+                    rptr = f"{ptr}/rules/{j}"
+                    self._run(_P_RULE_OPERATORS, rptr, _check_rule_operator, r)
+                    self._run(_P_RULE_PROPS, rptr, _check_rule_property, r)
+                    self._run(_P_RULE_ORDER, rptr, self._check_rule_order, s, r, first_pos)
+                    self._run(_P_PATHWISE, rptr, _check_rule_in_scope, r, self.scope)
+                self._visit_branch(s.get("positiveOutcome", []) or [], f"{ptr}/positiveOutcome")
+                self._visit_branch(s.get("negativeOutcome", []) or [], f"{ptr}/negativeOutcome")
+
+    def _visit_branch(self, seq: List[Dict[str, Any]], base: str):
+        # variables produced inside a branch go out of scope when it ends; they were not
+        # in scope before (else _produce_in_scope raised), so removing them restores it
+        if not isinstance(seq, list):
+            # iterated like the old trigger check did, which failed on it first
+            seq = self._run(_P_TRIGGER_BRANCH, base, list, seq)
+            if seq is None:
+                return
+        mark = len(self.added)
+        self.visit(seq, base, top=False)
+        for name in self.added[mark:]:
+            del self.scope[name]
+        del self.added[mark:]
+
+    def _check_rule_order(self, s: Dict[str, Any], r: Dict[str, Any], upto: int):
+        if r.get("propertyId") == "Variable":
+            vname = r.get("variablesId")
+            assert self.produced_at.get(vname, upto) < upto, \
+                f"Condition {s.get('displayName')} uses variable '{vname}' before it is produced in this path"
+
+    def diagnostics(self) -> List[Diagnostic]:
+        ordered = sorted(self.errors, key=lambda x: x[0])  # stable: pre-order within a group
+        return [Diagnostic(RULE_IDS[g], ptr, str(e)) for g, ptr, e in ordered]
 
 def semantic_validate_workflow(wf: Dict[str, Any]):
-    steps = wf.get("workflowSteps", [])
-    _validate_trigger_first_only(wf)
-    # trigger details
-    _validate_trigger(steps[0])
-    # End Workflow position
-    _validate_end_is_last(steps)
-    # Actions & rules
-    _validate_actions(steps)
-    _validate_rules_operators(steps)
-
-    _validate_rules_operators(steps)
-    _validate_disallowed_rule_properties(steps)
-
-    _validate_ids_castable(steps)
-    _validate_variable_rule_order(steps)
-
-    # Variables linkages
-    _validate_variables_links_pathwise(steps)
+    sp = _SinglePass()
+    sp.run(wf)
+    if sp.first:
+        raise sp.first[min(sp.first)]
+
+def collect_semantic_errors(wf: Dict[str, Any]) -> List[Diagnostic]:
+    """
+    Every semantic violation of `wf` as Diagnostic(rule, pointer, message), ordered like
+    `semantic_validate_workflow` reports them: the first entry is the error it would raise.
+    Like the validator, may normalize the trigger schedule dates in place.
+    """
+    sp = _SinglePass(collect=True)
+    sp.run(wf)
+    return sp.diagnostics()
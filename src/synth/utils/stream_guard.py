@@ -0,0 +1,197 @@
+"""
+Incremental check of a streamed teacher response, so hopeless compiles can be cancelled
+mid-generation instead of after `max_tokens`.
+
+StreamGuard tokenizes the JSON object that follows the `<json>` tag (the one
+`extract_json_block` would pick) as chunks arrive and reports the first violation that
+`semantic_validate_workflow` is certain to raise:
+  - first step is not a trigger                     (rule trigger_first)
+  - a trigger after the first step / inside a branch (trigger_unique / trigger_in_branch)
+  - an action whose actionType is not allowed        (action)
+Checks run as soon as the step's workflowStepType (and, for actions, actionType) value is
+complete, not when the step closes: that is where most of a bad step's text still lies ahead.
+A step that repeats one of these keys is judged by the value seen so far; json.loads would
+keep the last one, which a model does not write in practice. A missing key is only known
+once the step closes.
+Anything the guard cannot follow (no tag, malformed JSON) just stops checking; the normal
+parse + validate path reports it once the response is complete.
+"""
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from synth.utils.contracts import ALLOWED_ACTION_TYPES
+from synth.utils.errors import Diagnostic
+
+_TAG_RE = re.compile(r"<json>", re.IGNORECASE)
+_TOKEN_RE = re.compile(
+    r'\s+|//[^\r\n]*[\r\n]|"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]:,]'
+    r'|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?=[\s,\]}])|true|false|null'
+)
+_STEP_ARRAYS_ROOT = ("workflowSteps",)  # not the "Steps" alias: a later workflowSteps would win
+_STEP_ARRAYS_BRANCH = ("positiveOutcome", "negativeOutcome")
+_STEP_FIELDS = ("workflowStepType", "actionType")
+_TOKEN_START = set('"/tfn-0123456789')
+_CONTAINER = object()  # a step field whose value is an object/array: never valid
+
+class StreamAbort(Exception):
+    """Raised when a streamed response is cancelled; `text` is what arrived before the cut."""
+    def __init__(self, diagnostic: Diagnostic, text: str):
+        super().__init__(diagnostic.message)
+        self.diagnostic = diagnostic
+        self.text = text
+
+class _Frame:
+    __slots__ = ("kind", "ptr", "key", "expect_key", "index", "step", "top", "fields")
+    def __init__(self, kind: str, ptr: str, step: bool = False, top: bool = False, index: int = -1):
+        self.kind = kind            # "obj" / "arr"
+        self.ptr = ptr              # JSON pointer of this container
+        self.key = None             # object: key of the member being parsed
+        self.expect_key = True      # object: next string is a key
+        self.index = index          # array: index of the current element; step: own index
+        self.step = step            # object that is a workflow step
+        self.top = top              # step of the root step array (else of a branch)
+        self.fields: Dict[str, Any] = {}
+
+class StreamGuard:
+    def __init__(self):
+        self.text = ""
+        self.pos = -1               # scan position in text; -1 until the object start is found
+        self.stack: List[_Frame] = []
+        self.done = False           # root closed, or nothing more the guard can follow
+        self.fatal: Optional[Diagnostic] = None
+
+    def feed(self, chunk: str) -> Optional[Diagnostic]:
+        """Appends `chunk`; returns the first fatal Diagnostic once one is certain."""
+        self.text += chunk
+        if self.fatal is None and not self.done:
+            self._scan()
+        return self.fatal
+
+    def _scan(self):
+        text = self.text
+        if self.pos < 0:
+            m = _TAG_RE.search(text)
+            i = text.find("{", m.end()) if m else -1
+            if i < 0:
+                return
+            self.pos = i
+        while self.pos < len(text):
+            m = _TOKEN_RE.match(text, self.pos)
+            if m is None:
+                # a token cut by the chunk boundary: wait for more; anything else is not JSON
+                if text[self.pos] not in _TOKEN_START:
+                    self.done = True
+                return
+            self.pos = m.end()
+            tok = m.group()
+            if not (tok[0].isspace() or tok.startswith("//")):
+                self._token(tok)
+                if self.fatal is not None or self.done:
+                    return
+
+    def _token(self, tok: str):
+        c = tok[0]
+        top = self.stack[-1] if self.stack else None
+        if c in "{[":
+            self._open("obj" if c == "{" else "arr", top)
+        elif c in "}]":
+            if top is None:
+                self.done = True
+            else:
+                self._close()
+        elif c == ",":
+            if top is not None and top.kind == "obj":
+                top.expect_key = True
+        elif c == ":":
+            pass
+        elif top is None:
+            self.done = True
+        elif top.kind == "arr":
+            top.index += 1
+        elif top.expect_key:
+            top.key = tok[1:-1] if c == '"' else tok
+            top.expect_key = False
+        elif top.key in _STEP_FIELDS:
+            top.fields[top.key] = _literal(tok)  # a repeated key overwrites, as in json.loads
+            if top.step:
+                self._check_step(top)
+
+    def _open(self, kind: str, parent: Optional[_Frame]):
+        if parent is None:
+            self.stack.append(_Frame(kind, ""))
+            return
+        if parent.kind == "arr":
+            parent.index += 1
+            ptr = f"{parent.ptr}/{parent.index}"
+        else:
+            ptr = f"{parent.ptr}/{parent.key}"
+            if parent.key in _STEP_FIELDS:
+                parent.fields[parent.key] = _CONTAINER
+                if parent.step:
+                    self._check_step(parent)
+        step = top = False
+        if kind == "obj" and parent.kind == "arr" and len(self.stack) >= 2:
+            holder = self.stack[-2]
+            if len(self.stack) == 2 and holder.key in _STEP_ARRAYS_ROOT:
+                step = top = True
+            elif holder.step and holder.key in _STEP_ARRAYS_BRANCH:
+                step = True
+        self.stack.append(_Frame(kind, ptr, step, top, parent.index if step else -1))
+
+    def _close(self):
+        f = self.stack.pop()
+        if f.step:
+            self._check_step(f, closed=True)
+        elif f.kind == "arr" and f.index < 0 and len(self.stack) == 1 and self.stack[0].key in _STEP_ARRAYS_ROOT:
+            self._abort("trigger_first", f"{f.ptr}/0", "First step must be a TRIGGER")
+        if not self.stack:
+            self.done = True
+
+    def _check_step(self, f: _Frame, closed: bool = False):
+        if "workflowStepType" not in f.fields and not closed:
+            return
+        wst = f.fields.get("workflowStepType")
+        if f.top and f.index == 0:
+            if wst != 1:
+                self._abort("trigger_first", f.ptr, "First step must be a TRIGGER")
+        elif wst == 1:
+            if f.top:
+                self._abort("trigger_unique", f.ptr, "Trigger may appear only once and only as the first step")
+            else:
+                self._abort("trigger_in_branch", f.ptr, "Trigger cannot appear inside condition branches")
+        elif wst == 0 and ("actionType" in f.fields or closed):
+            at = f.fields.get("actionType")
+            if at is _CONTAINER or at not in ALLOWED_ACTION_TYPES:
+                self._abort("action", f.ptr, f"Unknown actionType {at if at is not _CONTAINER else '<non-scalar>'}")
+
+    def _abort(self, rule: str, ptr: str, message: str):
+        if self.fatal is None:
+            self.fatal = Diagnostic(rule, ptr, message)
+
+def _literal(tok: str):
+    if tok == "true": return True
+    if tok == "false": return False
+    if tok == "null": return None
+    if tok[0] == '"': return tok[1:-1]
+    try:
+        return int(tok)
+    except ValueError:
+        return float(tok)
+
+async def aguarded_chat(client, system: str, user: str, temperature: float, top_p: float) -> str:
+    """
+    `client.achat`, streamed through a StreamGuard when the client has `astream`.
+    Raises StreamAbort (after closing the stream, which cancels generation) on a fatal problem.
+    """
+    if not callable(getattr(client, "astream", None)):
+        return await client.achat(system, user, temperature=temperature, top_p=top_p)
+    guard = StreamGuard()
+    stream: AsyncIterator[str] = client.astream(system, user, temperature=temperature, top_p=top_p)
+    try:
+        async for chunk in stream:
+            fatal = guard.feed(chunk)
+            if fatal is not None:
+                raise StreamAbort(fatal, guard.text)
+    finally:
+        await stream.aclose()
+    return guard.text
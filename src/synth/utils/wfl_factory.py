@@ -0,0 +1,89 @@
+"""
+Builders for schema-valid workflow steps, plus a random valid workflow generator
+used by the mutator and by the validation benchmarks.
+"""
+import random
+from typing import Any, Dict, List, Optional
+
+BASE_ID = 1700000000000
+
+def manual_trigger(step_id: int) -> Dict[str, Any]:
+    return {"workflowStepType": 1, "id": step_id, "displayName": "Ad-hoc", "skipOffline": False,
+            "triggerType": 2, "triggerSubType": "Manual"}
+
+def var_ref(source: str, var_type: int, step_id: int, variable_id: str) -> Dict[str, Any]:
+    return {"variableId": variable_id, "propertyId": "variable", "workflowStepId": step_id,
+            "sourceId": source, "displayName": source, "type": var_type, "workflowStepName": "Variable"}
+
+def write_log(step_id: int, message: str = "Log entry", variables: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    return {"workflowStepType": 0, "id": step_id, "actionType": 22, "displayName": "Write Log",
+            "parameters": {"message": message, "variables": variables or []}}
+
+def set_variable(step_id: int, name: str, variable_type: int = 6) -> Dict[str, Any]:
+    return {"workflowStepType": 0, "id": step_id, "actionType": 37, "displayName": f"Set {name}",
+            "parameters": {"variableName": name, "variableType": variable_type, "variables": []}}
+
+def powershell(step_id: int, output_variable: str, capture: bool = True) -> Dict[str, Any]:
+    return {"workflowStepType": 0, "id": step_id, "actionType": 36, "displayName": "Execute Powershell",
+            "parameters": {"commandLine": "Get-Date", "executeAsSystem": True, "captureOutput": capture,
+                           "outputVariable": output_variable, "variables": []}}
+
+def reboot(step_id: int, minutes: int = 5) -> Dict[str, Any]:
+    return {"workflowStepType": 0, "id": step_id, "actionType": 26, "displayName": "Reboot",
+            "parameters": {"type": 1, "minutes": minutes, "dateTime": None}}
+
+def end_workflow(step_id: int, status: int = 2) -> Dict[str, Any]:
+    return {"workflowStepType": 0, "id": step_id, "actionType": 15, "displayName": "End Workflow",
+            "parameters": {"status": status}}
+
+def os_type_rule(trigger_id: int, value: int = 1) -> Dict[str, Any]:
+    return {"propertyId": "oSType", "operator": 2, "value": value, "workflowStepId": trigger_id}
+
+def variable_rule(trigger_id: int, name: str) -> Dict[str, Any]:
+    return {"propertyId": "Variable", "operator": 0, "variablesId": name, "variablesType": 0,
+            "value": "", "workflowStepId": trigger_id}
+
+def condition(step_id: int, rules: List[Dict[str, Any]], positive: List[Dict[str, Any]],
+              negative: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"workflowStepType": 2, "id": step_id, "displayName": "Condition", "ruleAggregation": 0,
+            "rules": rules, "positiveOutcome": positive, "negativeOutcome": negative}
+
+def random_workflow(rng: random.Random, n_steps: int = 20, max_depth: int = 3, branch_len: int = 3) -> Dict[str, Any]:
+    """
+    A schema- and semantically-valid workflow with roughly `n_steps` top-level steps,
+    nested conditions up to `max_depth`, variable producers and in-scope consumers.
+    """
+    next_id = [BASE_ID]
+    def nid():
+        next_id[0] += 1
+        return next_id[0]
+    trigger = manual_trigger(nid())
+    tid = trigger["id"]
+    counter = [0]
+
+    def seq(length: int, depth: int, scope: List[str]) -> List[Dict[str, Any]]:
+        scope = list(scope)
+        out = []
+        for _ in range(length):
+            r = rng.random()
+            if r < 0.2:
+                counter[0] += 1
+                name = f"Var{counter[0]}"
+                out.append(powershell(nid(), name) if rng.random() < 0.5 else set_variable(nid(), name))
+                scope.append(name)
+            elif r < 0.35 and depth < max_depth:
+                rules = [variable_rule(tid, rng.choice(scope))] if scope and rng.random() < 0.5 else [os_type_rule(tid, rng.choice((1, 2, 3)))]
+                out.append(condition(nid(), rules,
+                                     seq(branch_len, depth + 1, scope) or [write_log(nid())],
+                                     seq(branch_len, depth + 1, scope) or [write_log(nid())]))
+            elif r < 0.5 and scope:
+                src = rng.choice(scope)
+                vid = str(rng.randrange(100000, 999999))
+                out.append(write_log(nid(), f"Value: #{vid}", [var_ref(src, 2, tid, vid)]))
+            elif r < 0.55:
+                out.append(reboot(nid(), rng.randrange(1, 60)))
+            else:
+                out.append(write_log(nid()))
+        return out
+
+    return {"workflowSteps": [trigger] + seq(n_steps, 0, [])}
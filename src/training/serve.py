@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+HTTP inference worker for the SFT / DPO LoRA output (workloads/terraform/inference.tf: port 8000,
+load balancer health check on /health):
+
+    python -m training.serve --model_dir /opt/ml/model --port 8000
+
+--model_dir is a train_sft / train_dpo --output_dir (adapter_config.json, adapter weights and
+tokenizer) or its model.tar.gz; the base model is the one named in the adapter config unless
+--base_model_id is given. A directory without adapter_config.json is served as a plain model.
+
+  POST /generate, /invocations  {"input": "...", "max_new_tokens": 2000, "constrained": false}
+      -> {"ok", "reason", "detail", "workflow", "prompt_tokens", "completion_tokens", "latency_s", "ttft_s"}
+      400 if "input" is not a string, "max_new_tokens" not an integer, "constrained" not a boolean,
+      or constrained decoding is requested from a server started with --allow_constrained false
+  GET  /health, /ping           {"status": "ok"}
+  GET  /metrics                 requests, p50/p99 latency and time to first token, completion tokens/s
+
+Requests are prompted with eval_wfl.render_prompt and decoded greedily until the JSON object or
+</json> closes (JsonStop) or eos, optionally masked to the schema grammar (constrained.py). The
+payload is then checked like eval_pass_rate does: schema first, then semantic_validate_workflow.
+
+Batching is continuous: one engine thread runs a decode step for all active requests at once and
+admits queued ones between steps (their prompts are prefilled together and their KV cache is
+left-padded onto the running batch), so a finished request leaves the batch right away and a new
+one never waits for the batch to drain. At most --max_batch requests decode together.
+"""
+import argparse, json, logging, os, queue, threading, time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import torch
+import torch.nn.functional as F
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, DynamicCache
+from peft import PeftConfig, PeftModel
+from synth.utils.schema_validator import load_validator
+from synth.utils.semantic_validate import semantic_validate_workflow
+from training.dpo.train_dpo import resolve_base_model_path
+from training.sft.constrained import SchemaLogitsProcessor, load_grammar, token_table
+from training.sft.eval_wfl import SCHEMA_PATH, render_prompt
+from training.sft.stopping import JsonStop, json_end
+
+LOG = logging.getLogger("training.serve")
+
+def load_model(model_dir: str, base_model_id: Optional[str] = None, hf_token: Optional[str] = None,
+               bnb_4bit: bool = False):
+    """(model, tokenizer) for a training output dir; the adapter is merged unless the base is 4-bit."""
+    model_dir = resolve_base_model_path(model_dir)
+    adapter = os.path.exists(os.path.join(model_dir, "adapter_config.json"))
+    base_id = base_model_id or (PeftConfig.from_pretrained(model_dir).base_model_name_or_path if adapter else model_dir)
+    # train_sft saves the tokenizer next to the adapter; train_dpo only the adapter
+    tok_src = model_dir if os.path.exists(os.path.join(model_dir, "tokenizer_config.json")) else base_id
+    tok = AutoTokenizer.from_pretrained(tok_src, token=hf_token, trust_remote_code=True)
+    if tok.pad_token is None: tok.pad_token = tok.eos_token
+
+    quant_config = None
+    if bnb_4bit:
+        quant_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_use_double_quant=True,
+            bnb_4bit_compute_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
+        )
+    model = AutoModelForCausalLM.from_pretrained(
+        base_id,
+        token=hf_token,
+        trust_remote_code=True,
+        quantization_config=quant_config,
+        torch_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
+        device_map="auto",
+    )
+    if adapter:
+        model = PeftModel.from_pretrained(model, model_dir)
+        if not bnb_4bit:
+            model = model.merge_and_unload()
+    model.eval()
+    return model, tok
+
+def check_workflow(text: str) -> Dict[str, Any]:
+    """Extract, parse and validate one completion; the failure reasons follow eval_wfl.check_generation."""
+    end = json_end(text)
+    if end == -1:
+        return {"ok": False, "reason": "missing_json_tags", "detail": text[:300], "workflow": None}
+    payload = text[:end].strip()
+    if not payload:
+        return {"ok": False, "reason": "empty_json_block", "detail": text[:300], "workflow": None}
+    try:
+        obj = json.loads(payload)
+    except ValueError as e:
+        return {"ok": False, "reason": "json_parse_error", "detail": repr(e), "workflow": None}
+    try:
+        load_validator(SCHEMA_PATH).validate(obj)
+        semantic_validate_workflow(obj)
+    except Exception as e:
+        return {"ok": False, "reason": "validation_failed", "detail": str(e)[:1000], "workflow": obj}
+    return {"ok": True, "reason": None, "detail": None, "workflow": obj}
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+class _Request:
+    __slots__ = ("prompt", "max_new_tokens", "constrained", "future", "t_submit", "t_first",
+                 "prompt_tokens", "out", "n", "stop", "constraint", "done")
+
+    def __init__(self, prompt: str, max_new_tokens: int, constrained: bool):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.constrained = constrained
+        self.future: Future = Future()
+        self.t_submit = time.perf_counter()
+        self.t_first: Optional[float] = None
+        self.prompt_tokens = 0
+        self.out = torch.empty((1, max_new_tokens), dtype=torch.long)   # generated ids, [:, :n] filled
+        self.n = 0
+        self.stop = None
+        self.constraint = None
+        self.done = False
+
+class Engine:
+    """
+    Continuous-batching greedy decoder over one model. submit() is thread-safe and returns a Future
+    of {"text", "prompt_tokens", "completion_tokens", "latency_s", "ttft_s"}; the model and the
+    tokenizer are only used from the engine thread.
+    `constrained` is the default for requests that do not choose; with `allow_constrained` (implied
+    by `constrained`) the grammar's token table is built here, not on the engine thread by the
+    first constrained request, which would stall every active request while the vocab is decoded.
+    """
+    def __init__(self, model, tok, max_batch: int = 8, max_new_tokens: int = 2000, constrained: bool = False,
+                 allow_constrained: bool = True):
+        self.model = model
+        self.tok = tok
+        self.max_batch = max_batch
+        self.max_new_tokens = max_new_tokens
+        self.constrained = constrained
+        self.allow_constrained = allow_constrained or constrained
+        self.pad_id = tok.pad_token_id if tok.pad_token_id is not None else tok.eos_token_id
+        eos = model.generation_config.eos_token_id
+        self.eos = {t for t in (eos if isinstance(eos, list) else [eos]) + [tok.eos_token_id] if t is not None}
+        self.grammar = load_grammar(SCHEMA_PATH) if self.allow_constrained else None
+        if self.grammar is not None:
+            token_table(self.grammar, tok)   # build before the first request
+        self.queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self.active: List[_Request] = []
+        self.cache: Optional[DynamicCache] = None
+        self.attn: Optional[torch.Tensor] = None    # [batch, cached positions], 0 on left padding
+        self.pos: Optional[torch.Tensor] = None     # [batch] position id of the next input token
+        self.last: Optional[torch.Tensor] = None    # [batch, 1] chosen tokens not yet in the cache
+        self.completed: deque = deque(maxlen=10000)  # (t_submit, t_done, latency, ttft, tokens)
+        self.thread = threading.Thread(target=self._loop, name="serve-engine", daemon=True)
+
+    def start(self) -> "Engine":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def submit(self, prompt: str, max_new_tokens: Optional[int] = None, constrained: Optional[bool] = None) -> Future:
+        """ValueError, raised here and not from the engine thread, for options it cannot honour."""
+        if max_new_tokens is not None and (not isinstance(max_new_tokens, int) or isinstance(max_new_tokens, bool)):
+            raise ValueError('"max_new_tokens" must be an integer')
+        if constrained is not None and not isinstance(constrained, bool):
+            raise ValueError('"constrained" must be true or false')
+        if constrained and not self.allow_constrained:
+            raise ValueError("constrained decoding is not enabled on this server")
+        n = min(max_new_tokens or self.max_new_tokens, self.max_new_tokens)
+        req = _Request(prompt, max(1, n), self.constrained if constrained is None else constrained)
+        self.queue.put(req)
+        return req.future
+
+    def metrics(self) -> Dict[str, Any]:
+        done = list(self.completed)
+        latency = [d[2] for d in done]
+        ttft = [d[3] for d in done]
+        span = max(d[1] for d in done) - min(d[0] for d in done) if done else 0.0
+        return {"requests": len(done), "active": len(self.active), "queued": self.queue.qsize(),
+                "latency_p50_s": _pct(latency, 0.5), "latency_p99_s": _pct(latency, 0.99),
+                "ttft_p50_s": _pct(ttft, 0.5), "ttft_p99_s": _pct(ttft, 0.99),
+                "completion_tokens_per_s": sum(d[4] for d in done) / span if span > 0 else None}
+
+    def _loop(self):
+        while True:
+            pending = []
+            if not self.active:
+                pending.append(self.queue.get())
+            while len(self.active) + len(pending) < self.max_batch:
+                try:
+                    pending.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in pending:
+                for r in self.active + pending:
+                    if r is not None and not r.future.done():
+                        r.future.set_exception(RuntimeError("engine stopped"))
+                return
+            try:
+                if pending:
+                    self._prefill(pending)
+                else:
+                    self._decode()
+                self._retire()
+            except Exception as e:
+                LOG.exception("engine step failed; dropping %d requests", len(self.active) + len(pending))
+                for r in self.active + pending:
+                    if not r.future.done():
+                        r.future.set_exception(e)
+                self.active, self.cache = [], None
+
+    @torch.no_grad()
+    def _prefill(self, reqs: List[_Request]):
+        ids = []
+        for r in reqs:
+            ids.append(self.tok(render_prompt(r.prompt))["input_ids"])
+            r.prompt_tokens = len(ids[-1])
+            r.stop = JsonStop(self.tok, 0)
+            if r.constrained:
+                r.constraint = SchemaLogitsProcessor(self.tok, 0, self.grammar)
+        width = max(len(x) for x in ids)
+        device = self.model.device
+        input_ids = torch.full((len(ids), width), self.pad_id, dtype=torch.long)
+        attn = torch.zeros((len(ids), width), dtype=torch.long)
+        for b, x in enumerate(ids):
+            input_ids[b, width - len(x):] = torch.tensor(x, dtype=torch.long)
+            attn[b, width - len(x):] = 1
+        input_ids, attn = input_ids.to(device), attn.to(device)
+        out = self.model(input_ids=input_ids, attention_mask=attn, position_ids=(attn.cumsum(-1) - 1).clamp(min=0),
+                         past_key_values=DynamicCache(), use_cache=True, logits_to_keep=1)
+        last = self._emit(reqs, out.logits[:, -1, :].float())
+        self._join(reqs, out.past_key_values, attn, attn.sum(-1), last)
+
+    @torch.no_grad()
+    def _decode(self):
+        attn = torch.cat([self.attn, self.attn.new_ones((self.attn.shape[0], 1))], dim=1)
+        out = self.model(input_ids=self.last, attention_mask=self._step_mask(attn), position_ids=self.pos[:, None],
+                         past_key_values=self.cache, use_cache=True)
+        self.cache, self.attn, self.pos = out.past_key_values, attn, self.pos + 1
+        self.last = self._emit(self.active, out.logits[:, -1, :].float())
+
+    def _step_mask(self, attn: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        Attention mask for a one-token step: none without padding, else the padding as an additive 4D
+        mask, which transformers uses as is (from a 2D mask it rebuilds a causal mask every step,
+        ~7 ms on CPU, more than the tiny model's forward).
+        """
+        if bool(attn.all()):
+            return None
+        if self.model.config._attn_implementation not in ("sdpa", "eager"):
+            return attn
+        dtype = self.model.dtype
+        return (1 - attn[:, None, None, :].to(dtype)) * torch.finfo(dtype).min
+
+    def _emit(self, reqs: List[_Request], logits: torch.Tensor) -> torch.Tensor:
+        """Greedy next token per row (after the grammar mask); marks the rows that are finished."""
+        for i, r in enumerate(reqs):
+            if r.constraint is not None:
+                logits[i:i + 1] = r.constraint(r.out[:, :r.n], logits[i:i + 1])
+        nxt = logits.argmax(dim=-1)
+        now = time.perf_counter()
+        for r, t in zip(reqs, nxt.tolist()):
+            r.out[0, r.n] = t
+            r.n += 1
+            if r.t_first is None:
+                r.t_first = now
+            r.done = t in self.eos or r.n >= r.max_new_tokens or bool(r.stop(r.out[:, :r.n], None)[0])
+        return nxt[:, None]
+
+    def _join(self, reqs: List[_Request], cache: DynamicCache, attn: torch.Tensor, pos: torch.Tensor,
+              last: torch.Tensor):
+        """Append prefilled rows to the running batch, left-padding whichever cache is shorter."""
+        if not self.active:
+            self.active, self.cache, self.attn, self.pos, self.last = list(reqs), cache, attn, pos, last
+            return
+        width = max(self.attn.shape[1], attn.shape[1])
+        def pad(x, n):
+            return F.pad(x, (0, 0, n, 0)) if n else x
+        a, b = width - self.attn.shape[1], width - attn.shape[1]
+        self.cache = DynamicCache.from_legacy_cache(tuple(
+            (torch.cat([pad(k0, a), pad(k1, b)]), torch.cat([pad(v0, a), pad(v1, b)]))
+            for (k0, v0), (k1, v1) in zip(self.cache.to_legacy_cache(), cache.to_legacy_cache())))
+        self.attn = torch.cat([F.pad(self.attn, (a, 0)), F.pad(attn, (b, 0))])
+        self.pos = torch.cat([self.pos, pos])
+        self.last = torch.cat([self.last, last])
+        self.active.extend(reqs)
+
+    def _retire(self):
+        keep = [i for i, r in enumerate(self.active) if not r.done]
+        if len(keep) == len(self.active):
+            return
+        now = time.perf_counter()
+        for r in self.active:
+            if r.done:
+                latency, ttft = now - r.t_submit, r.t_first - r.t_submit
+                self.completed.append((r.t_submit, now, latency, ttft, r.n))
+                r.future.set_result({"text": self.tok.decode(r.out[0, :r.n], skip_special_tokens=True),
+                                     "prompt_tokens": r.prompt_tokens, "completion_tokens": r.n,
+                                     "latency_s": latency, "ttft_s": ttft})
+        if not keep:
+            self.active, self.cache = [], None
+            return
+        self.active = [self.active[i] for i in keep]
+        idx = torch.tensor(keep, device=self.attn.device)
+        self.cache.batch_select_indices(idx)
+        self.attn, self.pos, self.last = self.attn[idx], self.pos[idx], self.last[idx]
+        # drop the left-padding columns no remaining row attends to
+        start = int((self.attn.sum(0) == 0).long().cumprod(0).sum())
+        if start:
+            self.cache = DynamicCache.from_legacy_cache(tuple(
+                (k[:, :, start:], v[:, :, start:]) for k, v in self.cache.to_legacy_cache()))
+            self.attn = self.attn[:, start:]
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path in ("/health", "/ping"):
+            self._send(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send(200, self.server.engine.metrics())
+        else:
+            self._send(404, {"error": f"no route {self.path}"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path not in ("/generate", "/invocations"):
+            self._send(404, {"error": f"no route {self.path}"})
+            return
+        try:
+            req = json.loads(body or b"{}")
+            if not isinstance(req, dict) or not isinstance(req.get("input"), str):
+                raise ValueError('"input" must be a string')
+            fut = self.server.engine.submit(req["input"], req.get("max_new_tokens"), req.get("constrained"))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        try:
+            res = fut.result()
+        except Exception as e:
+            self._send(500, {"error": repr(e)})
+            return
+        # validation runs here, in the request's thread, not on the decode loop
+        res.update(check_workflow(res.pop("text")))
+        self._send(200, res)
+
+    def log_message(self, fmt, *args):
+        LOG.debug("%s " + fmt, self.address_string(), *args)
+
+def make_server(engine: Engine, host: str = "0.0.0.0", port: int = 8000) -> ThreadingHTTPServer:
+    srv = ThreadingHTTPServer((host, port), _Handler)
+    srv.daemon_threads = True
+    srv.engine = engine
+    return srv
+
+def get_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--model_dir", type=str, default="/opt/ml/model")
+    p.add_argument("--base_model_id", type=str, default=None, help="default: base_model_name_or_path of the adapter")
+    p.add_argument("--hf_token", type=str, default=None)
+    p.add_argument("--host", type=str, default="0.0.0.0")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--max_batch", type=int, default=8, help="requests decoded together")
+    p.add_argument("--max_new_tokens", type=int, default=2000)
+    p.add_argument("--constrained", type=str, default="false", help="default for requests that do not set it")
+    p.add_argument("--allow_constrained", type=str, default="true",
+                   help="accept constrained requests (the grammar token table is built at start-up)")
+    p.add_argument("--bnb_4bit", type=str, default="false")
+    return p.parse_args()
+
+def main():
+    args = get_args()
+    logging.basicConfig(level=logging.INFO)
+    model, tok = load_model(args.model_dir, args.base_model_id, args.hf_token, args.bnb_4bit.lower() == "true")
+    engine = Engine(model, tok, args.max_batch, args.max_new_tokens, args.constrained.lower() == "true",
+                    args.allow_constrained.lower() == "true").start()
+    srv = make_server(engine, args.host, args.port)
+    LOG.info("serving %s on %s:%d max_batch=%d", args.model_dir, args.host, args.port, args.max_batch)
+    try:
+        srv.serve_forever()
+    finally:
+        srv.server_close()
+        engine.stop()
+
+if __name__ == "__main__":
+    main()
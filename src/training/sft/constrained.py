@@ -0,0 +1,620 @@
+"""
+Schema-constrained decoding of workflow JSON.
+
+WorkflowGrammar compiles data/schema/wfl.schema.json, with the enums of synth.utils.contracts
+substituted in, into a few kinds of value nodes: object with known keys, array, literal set
+(const / enum / small integer ranges), string, quoted digit string, integer, number and union.
+A decoding state is the set of parser stacks consistent with the text so far, so a union
+(oneOf/anyOf, if/then, the step types) is just several stacks until a key or literal tells them
+apart. SchemaLogitsProcessor masks every token whose text would leave that set empty: a sequence
+stays a prefix of a schema-shaped workflow until the top-level object closes, after which
+(and for eos) nothing is constrained, and JsonStop ends it.
+
+TokenTable holds the tokenizer side: token texts, a character trie over them, and the
+state -> allowed tokens and (state, token) -> next state tables, filled the first time a state
+is reached and cached per (grammar, tokenizer). A mask is computed by walking the trie from the
+state, so only prefixes the grammar accepts are visited; inside free strings every token without
+'"', '\\' or '<' is allowed outright and only the others are walked. Strings and free-form keys
+cannot contain </json>, which would end the answer early (JsonStop, check_generation).
+
+The output format is what training serializes: json.dumps with its default ", " / ": "
+separators and ASCII escapes; key order is free. Not enforced (the validators still run):
+string patterns other than the numeric ids, formats, integer bounds wider than a small range
+(only sign and digit count), and the cross-field checks of semantic_validate beyond the
+notification / scope pairs below.
+"""
+import copy, json, weakref
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import LogitsProcessor
+
+from synth.utils.contracts import ALLOWED_ACTION_TYPES, NOTIFICATION_TYPES, SCOPE_MAP
+from training.sft.stopping import CLOSE_TAG
+
+# node kinds; nodes are tuples (kind, ...) in WorkflowGrammar.nodes, frames are (node id, ...)
+_LIT, _STR, _DIG, _INT, _NUM, _OBJ, _ARR, _UNION = range(8)
+
+_ALL_TYPES = ("null", "boolean", "integer", "number", "string", "array", "object")
+_COMBINATORS = ("$ref", "$recursiveRef", "allOf", "oneOf", "anyOf", "not", "if", "then", "else")
+# string patterns compiled to quoted digit strings: (min digits, max digits or 0, no leading zero)
+_DIGIT_PATTERNS = {
+    "^(0|[1-9][0-9]{0,18})$": (1, 19, True),
+    "^[0-9]{6,}$": (6, 0, False),
+}
+_MAX_LITERAL_RANGE = 256   # integer ranges up to this size become literal sets (exact bounds)
+_EXTRA_KEY = "\0"          # key buffer once it no longer matches a declared property (+ tag progress)
+_MASK_CACHE_BYTES = 1 << 28  # per table; a cached mask is len(tokenizer) / 8 bytes
+
+State = FrozenSet[Tuple[tuple, ...]]
+
+def apply_contracts(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of the wfl schema with the contracts enums as the source of truth: allowed action types,
+    notification types (one alternative per type, with triggerSubType equal to it as
+    semantic_validate requires) and the scopeName / scopeId pairs of SCOPE_MAP.
+    """
+    s = copy.deepcopy(schema)
+    defs = s.get("$defs", {})
+    if "ActionBase" in defs:
+        defs["ActionBase"]["properties"]["actionType"]["enum"] = sorted(ALLOWED_ACTION_TYPES)
+    if "TriggerNotification" in defs:
+        defs["TriggerNotification"]["allOf"].append({"oneOf": [
+            {"properties": {"notificationType": {"const": t}, "triggerSubType": {"const": t}}}
+            for t in sorted(NOTIFICATION_TYPES)]})
+    if "RuleScope" in defs:
+        defs["RuleScope"]["anyOf"] = [{"properties": {"scopeName": {"const": name}, "scopeId": {"const": sid}}}
+                                      for name, sid in sorted(SCOPE_MAP.items())]
+    return s
+
+def _tag_step(m: int, ch: str) -> int:
+    """Characters of CLOSE_TAG matched after `ch` when `m` were before; -1 once it is complete."""
+    if ch == CLOSE_TAG[m]:
+        return m + 1 if m + 1 < len(CLOSE_TAG) else -1
+    return 1 if ch == CLOSE_TAG[0] else 0
+
+def _same(x, y) -> bool:
+    return type(x) is type(y) and x == y
+
+def _types(t) -> List[str]:
+    if t is None:
+        return list(_ALL_TYPES)
+    return [t] if isinstance(t, str) else list(t)
+
+def _type_meet(a, b) -> List[str]:
+    ta, tb = _types(a), _types(b)
+    out = [t for t in ta if t in tb or (t == "integer" and "number" in tb)]
+    out += [t for t in tb if t == "integer" and "number" in ta and t not in out]
+    return out
+
+def _merge(a: Dict[str, Any], b: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Conjunction of two flat schemas; None if they cannot both hold."""
+    out = dict(a)
+    for k, v in b.items():
+        if k not in out:
+            out[k] = v
+            continue
+        w = out[k]
+        if k == "type":
+            out[k] = _type_meet(w, v)
+            if not out[k]:
+                return None
+        elif k == "const":
+            if not _same(w, v):
+                return None
+        elif k == "enum":
+            out[k] = [x for x in w if any(_same(x, y) for y in v)]
+        elif k == "properties":
+            props = dict(w)
+            for p, sv in v.items():
+                props[p] = {"allOf": [props[p], sv]} if p in props else sv
+            out[k] = props
+        elif k == "required":
+            out[k] = list(dict.fromkeys(list(w) + list(v)))
+        elif k in ("minimum", "minLength", "minItems"):
+            out[k] = max(w, v)
+        elif k in ("maximum", "maxLength", "maxItems"):
+            out[k] = min(w, v)
+        elif k in ("additionalProperties", "items"):
+            out[k] = False if w is False or v is False else v if w is True else w if v is True else {"allOf": [w, v]}
+        elif k == "prefixItems":
+            out[k] = [{"allOf": [x, y]} for x, y in zip(w, v)] + list(w[len(v):]) + list(v[len(w):])
+    # a closed side (additionalProperties: false) only admits its own properties
+    for side in (a, b):
+        if side.get("additionalProperties") is False and "properties" in out:
+            allowed = side.get("properties", {})
+            out["properties"] = {p: s for p, s in out["properties"].items() if p in allowed}
+    return out
+
+class WorkflowGrammar:
+    """The wfl schema as value nodes plus an incremental parser over them (see module docstring)."""
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.defs = schema.get("$defs", {})
+        self.nodes: List[tuple] = []
+        self._memo: Dict[str, int] = {}
+        self._leaves: Dict[tuple, int] = {}
+        self._compiling = set()
+        root = self._node(schema)
+        self._starts = [tuple(self._start_frame(s) for s in node[1]) if node[0] == _UNION else ()
+                        for node in self.nodes]
+        self.start: State = frozenset((f,) for f in self._starts[root])
+
+    # ---- schema -> nodes ----
+
+    def _resolve(self, s):
+        if s is True:
+            return {}
+        if isinstance(s, dict) and "$ref" in s:
+            target = self.defs[s["$ref"].rsplit("/", 1)[-1]]
+            rest = {k: v for k, v in s.items() if k != "$ref"}
+            return {"allOf": [target, rest]} if rest else self._resolve(target)
+        return s
+
+    def _expand(self, s) -> List[Dict[str, Any]]:
+        """Alternatives of `s` as flat schemas (no $ref / allOf / oneOf / anyOf / if / not at the top)."""
+        s = self._resolve(s)
+        if s is False:
+            return []
+        alts = [{k: v for k, v in s.items() if k not in _COMBINATORS}]
+        parts = list(s.get("allOf", []))
+        for key in ("oneOf", "anyOf"):   # exclusivity of oneOf is not enforced
+            if key in s:
+                parts.append({"anyOf": s[key]})
+        if "if" in s or "not" in s:
+            parts.append({k: s[k] for k in ("if", "then", "else", "not") if k in s})
+        for part in parts:
+            part = self._resolve(part)
+            if "if" in part:
+                alts = [x for a in alts for x in self._if_then(a, part)]
+            elif "not" in part:
+                excluded = self._expand(part["not"])
+                alts = [a for a in alts if not any(self._implies(a, x) for x in excluded)]
+            elif "anyOf" in part and len(part) == 1:
+                alts = [m for a in alts for o in part["anyOf"] for b in self._expand(o)
+                        for m in (_merge(a, b),) if m is not None]
+            else:
+                alts = [m for a in alts for b in self._expand(part) for m in (_merge(a, b),) if m is not None]
+        return alts
+
+    def _values(self, s) -> Optional[list]:
+        """The values `s` admits if it is a const / enum in every alternative, else None."""
+        out = []
+        for a in self._expand(s):
+            if "const" in a:
+                vals = [a["const"]]
+            elif "enum" in a:
+                vals = a["enum"]
+            else:
+                return None
+            out += [v for v in vals if not any(_same(v, x) for x in out)]
+        return out
+
+    def _if_then(self, a: Dict[str, Any], part: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # supported condition: {"properties": {key: {"const": value}}}; `a` is split by the values of key
+        cond = part["if"].get("properties", {})
+        if len(cond) != 1 or "const" not in next(iter(cond.values())):
+            return [a]
+        key, want = next(iter(cond.items()))
+        vals = self._values(a.get("properties", {}).get(key, {}))
+        if vals is None:
+            return [a]
+        out = []
+        for v in vals:
+            b = _merge(a, {"properties": {key: {"const": v}}})
+            branch = part.get("then") if _same(v, want["const"]) else part.get("else")
+            out += [m for x in (self._expand(branch) if branch is not None else [{}])
+                    for m in (_merge(b, x),) if m is not None]
+        return out
+
+    def _implies(self, a: Dict[str, Any], x: Dict[str, Any]) -> bool:
+        # `a` is inside `x` when every property const of x holds in a (enough for `not TriggerStep`)
+        consts = {}
+        for k, s in x.get("properties", {}).items():
+            vals = self._values(s)
+            if vals is not None and len(vals) == 1:
+                consts[k] = vals[0]
+        if not consts:
+            return False
+        props = a.get("properties", {})
+        for k, c in consts.items():
+            vals = self._values(props[k]) if k in props else None
+            if vals is None or len(vals) != 1 or not _same(vals[0], c):
+                return False
+        return True
+
+    def _leaf(self, node: tuple) -> int:
+        key = tuple(tuple(sorted(x.items())) if isinstance(x, dict) else x for x in node)
+        nid = self._leaves.get(key)
+        if nid is None:
+            nid = self._leaves[key] = len(self.nodes)
+            self.nodes.append(node)
+        return nid
+
+    def _literals(self, texts) -> int:
+        lits = frozenset(texts)
+        prefixes = frozenset(t[:i] for t in lits for i in range(len(t) + 1))
+        proper = frozenset(t[:i] for t in lits for i in range(len(t)))
+        return self._leaf((_LIT, lits, prefixes, proper))
+
+    def _node(self, s) -> int:
+        """Union node id for schema `s` (memoized, so recursive $refs terminate)."""
+        key = json.dumps(s, sort_keys=True)
+        if key in self._memo:
+            return self._memo[key]
+        nid = self._memo[key] = len(self.nodes)
+        self.nodes.append((_UNION, ()))   # placeholder while the alternatives compile
+        self._compiling.add(nid)
+        starts = []
+        for a in self._expand(s):
+            for leaf in self._leaves_of(a):
+                if leaf not in starts:
+                    starts.append(leaf)
+        self.nodes[nid] = (_UNION, tuple(starts))
+        self._compiling.discard(nid)
+        return nid
+
+    def _leaves_of(self, a: Dict[str, Any]) -> List[int]:
+        types = _types(a.get("type"))
+        if "const" in a or "enum" in a:
+            vals = [a["const"]] if "const" in a else a["enum"]
+            if "const" in a and "enum" in a:
+                vals = [v for v in vals if any(_same(v, x) for x in a["enum"])]
+            ok = []
+            for v in vals:
+                t = "null" if v is None else "boolean" if isinstance(v, bool) else \
+                    "integer" if isinstance(v, int) else "number" if isinstance(v, float) else \
+                    "string" if isinstance(v, str) else "array" if isinstance(v, list) else "object"
+                if t in types or (t == "integer" and "number" in types):
+                    ok.append(json.dumps(v))
+            return [self._literals(ok)] if ok else []
+        out = []
+        for t in types:
+            if t == "null":
+                out.append(self._literals(["null"]))
+            elif t == "boolean":
+                out.append(self._literals(["true", "false"]))
+            elif t == "integer" and "number" not in types:
+                lo, hi = a.get("minimum"), a.get("maximum")
+                if lo is not None and hi is not None and hi - lo <= _MAX_LITERAL_RANGE:
+                    if lo <= hi:
+                        out.append(self._literals(str(i) for i in range(int(lo), int(hi) + 1)))
+                else:
+                    out.append(self._leaf((_INT, lo is not None and lo >= 0,
+                                           len(str(int(hi))) if hi is not None and hi > 0 else 0)))
+            elif t == "number":
+                out.append(self._leaf((_NUM,)))
+            elif t == "string":
+                digits = _DIGIT_PATTERNS.get(a.get("pattern"))
+                if digits is not None:
+                    out.append(self._leaf((_DIG,) + digits))
+                else:
+                    out.append(self._leaf((_STR, min(int(a.get("minLength", 0)), 1))))
+            elif t == "array":
+                first = a.get("prefixItems", [])
+                item = a.get("items", {})
+                out.append(self._leaf((_ARR, self._node(first[0]) if first else -1,
+                                       self._node(item) if item is not False else -1,
+                                       int(a.get("minItems", 0)))))
+            elif t == "object":
+                props = {}
+                for k, ps in a.get("properties", {}).items():
+                    pid = self._node(ps)
+                    if self.nodes[pid][1] or pid in self._compiling:   # else no value can be written
+                        props[k] = pid
+                extra = a.get("additionalProperties", True)
+                extra = -1 if extra is False else self._node({} if extra is True else extra)
+                required = frozenset(a.get("required", ()))
+                if not required <= set(props):
+                    if extra == -1:
+                        continue   # a required key can never be written
+                    props.update((k, extra) for k in required if k not in props)
+                out.append(self._leaf((_OBJ, props, required, extra, tuple(sorted(props)))))
+        return out
+
+    # ---- parser ----
+
+    def _start_frame(self, nid: int) -> tuple:
+        kind = self.nodes[nid][0]
+        if kind == _LIT:
+            return (nid, "")
+        if kind == _NUM:
+            return (nid, 0)
+        if kind == _OBJ:
+            return (nid, 0, "", frozenset())
+        if kind == _STR:
+            return (nid, 0, 0, 0)
+        return (nid, 0, 0)
+
+    def _push(self, base: tuple, union: int, ch: str) -> list:
+        out = []
+        for f in self._starts[union]:
+            out += self._step(base + (f,), ch)
+        return out
+
+    def _step(self, stack: tuple, ch: str) -> list:
+        """Stacks reachable from `stack` by reading `ch` (empty list: `ch` is not allowed)."""
+        if not stack:
+            return [stack]   # the object is closed; what follows is not constrained
+        frame = stack[-1]
+        node = self.nodes[frame[0]]
+        kind = node[0]
+        up = stack[:-1]
+        if kind == _STR:
+            st, n, m = frame[1], frame[2], frame[3]
+            if st == 1:
+                if ch == '"':
+                    return [up] if n >= node[1] else []
+                if ch == "\\":
+                    return [up + ((frame[0], 2, n, 0),)]
+                m = _tag_step(m, ch)
+                return [up + ((frame[0], 1, 1, m),)] if " " <= ch <= "~" and m >= 0 else []
+            if st == 0:
+                return [up + ((frame[0], 1, 0, 0),)] if ch == '"' else []
+            if st == 2:
+                if ch in '"\\/bfnrt':
+                    return [up + ((frame[0], 1, 1, 0),)]
+                return [up + ((frame[0], 3, n, 0),)] if ch == "u" else []
+            if ch in "0123456789abcdefABCDEF":   # st 3..6: \uXXXX
+                return [up + ((frame[0], st + 1, n, 0) if st < 6 else (frame[0], 1, 1, 0),)]
+            return []
+        if kind == _LIT:
+            buf = frame[1] + ch
+            out = []
+            if buf in node[2]:
+                out.append(up if buf in node[1] and buf not in node[3] else up + ((frame[0], buf),))
+            if frame[1] in node[1] and frame[1] in node[3]:
+                out += self._step(up, ch)   # a complete literal that could also go on
+            return out
+        if kind == _OBJ:
+            return self._step_obj(node, frame, up, ch)
+        if kind == _ARR:
+            return self._step_arr(node, frame, up, ch)
+        if kind == _INT:
+            st, n = frame[1], frame[2]
+            digit = "0" <= ch <= "9"
+            if st == 0 and ch == "-" and not node[1]:
+                return [up + ((frame[0], 1, 0),)]
+            if st in (0, 1) and digit:
+                return [up + ((frame[0], 2, 1) if ch == "0" else (frame[0], 3, 1),)]
+            if st == 3 and digit and (not node[2] or n < node[2]):
+                return [up + ((frame[0], 3, n + 1),)]
+            return self._step(up, ch) if st in (2, 3) else []
+        if kind == _NUM:
+            st = _NUM_NEXT[frame[1]].get("d" if "0" <= ch <= "9" and not (ch == "0" and frame[1] in (0, 1)) else ch)
+            out = [up + ((frame[0], st),)] if st is not None else []
+            return out + self._step(up, ch) if frame[1] in _NUM_FINAL else out
+        # _DIG: quoted digit string
+        st, n = frame[1], frame[2]
+        if st == 0:
+            return [up + ((frame[0], 1, 0),)] if ch == '"' else []
+        if ch == '"':
+            return [up] if n >= node[1] else []
+        if st == 2 or not "0" <= ch <= "9" or (node[2] and n >= node[2]):
+            return []
+        if node[3] and n == 0 and ch == "0":
+            return [up + ((frame[0], 2, 1),)]
+        return [up + ((frame[0], 1, min(n + 1, node[2] or node[1])),)]
+
+    def _step_obj(self, node: tuple, frame: tuple, up: tuple, ch: str) -> list:
+        nid, phase, key, seen = frame
+        props, required, extra = node[1], node[2], node[3]
+        if phase == 0:      # expect {
+            return [up + ((nid, 1, "", seen),)] if ch == "{" else []
+        if phase in (1, 6):  # after { (key or }) / after ", " (key)
+            if ch == '"' and (extra != -1 or len(seen) < len(props)):
+                return [up + ((nid, 2, "", seen),)]
+            if ch == "}" and phase == 1 and required <= seen:
+                return [up]
+            return []
+        if phase == 2:      # inside a key
+            if ch == '"':
+                if key in props and key not in seen or extra != -1 and key not in props:
+                    return [up + ((nid, 3, key, seen),)]
+                return []
+            if ch == "\\" or not " " <= ch <= "~":
+                return []
+            if key[:1] != _EXTRA_KEY:
+                buf = key + ch
+                if any(k.startswith(buf) and k not in seen for k in node[4]):
+                    return [up + ((nid, 2, buf, seen),)]
+                if extra == -1:
+                    return []
+                m = 0
+                for c in buf:
+                    m = _tag_step(m, c) if m >= 0 else m
+            else:
+                m = _tag_step(len(key) - 1, ch)
+            return [up + ((nid, 2, _EXTRA_KEY + CLOSE_TAG[:m], seen),)] if m >= 0 else []
+        if phase == 3:      # expect :
+            return [up + ((nid, 7, key, seen),)] if ch == ":" else []
+        if phase == 7:      # expect the space of ": "
+            return [up + ((nid, 4, key, seen),)] if ch == " " else []
+        if phase == 4:      # value
+            value = props.get(key, extra)
+            seen = seen | {key} if key in props else seen
+            return self._push(up + ((nid, 5, "", seen),), value, ch)
+        if phase == 5:      # after a value: ", " or }
+            if ch == "," and (extra != -1 or len(seen) < len(props)):   # another key can follow
+                return [up + ((nid, 8, "", seen),)]
+            return [up] if ch == "}" and required <= seen else []
+        # phase 8: the space of ", "
+        return [up + ((nid, 6, "", seen),)] if ch == " " else []
+
+    def _step_arr(self, node: tuple, frame: tuple, up: tuple, ch: str) -> list:
+        nid, phase, n = frame
+        first, item, min_items = node[1], node[2], node[3]
+        if phase == 0:
+            return [up + ((nid, 1, 0),)] if ch == "[" else []
+        if phase == 1:      # after [
+            if ch == "]":
+                return [up] if min_items == 0 else []
+            union = first if first != -1 else item
+            return self._push(up + ((nid, 2, min(1, min_items)),), union, ch) if union != -1 else []
+        if phase == 2:      # after an item
+            if ch == "," and item != -1:
+                return [up + ((nid, 3, n),)]
+            return [up] if ch == "]" and n >= min_items else []
+        if phase == 3:
+            return [up + ((nid, 4, n),)] if ch == " " else []
+        return self._push(up + ((nid, 2, min(n + 1, min_items)),), item, ch) if item != -1 else []
+
+    def advance(self, state: State, text: str) -> Optional[State]:
+        """State after reading `text`, None if the text leaves the grammar."""
+        for ch in text:
+            nxt = set()
+            for stack in state:
+                nxt.update(self._step(stack, ch))
+            if not nxt:
+                return None
+            state = frozenset(nxt)
+        return state
+
+    def done(self, state: State) -> bool:
+        return () in state
+
+    def in_string(self, state: State) -> bool:
+        """Every stack is inside a free string, where any printable character but ", \\ and < goes."""
+        for stack in state:
+            if not stack:
+                return False
+            f = stack[-1]
+            if self.nodes[f[0]][0] != _STR or f[1] != 1 or f[3]:
+                return False
+        return True
+
+# JSON number: state -> {char class: next state}; "d" is a digit (1-9 in states 0 and 1)
+_NUM_NEXT = {
+    0: {"-": 1, "0": 2, "d": 3},
+    1: {"0": 2, "d": 3},
+    2: {".": 4, "e": 6, "E": 6},
+    3: {"d": 3, ".": 4, "e": 6, "E": 6},
+    4: {"d": 5},
+    5: {"d": 5, "e": 6, "E": 6},
+    6: {"+": 7, "-": 7, "d": 8},
+    7: {"d": 8},
+    8: {"d": 8},
+}
+_NUM_FINAL = {2, 3, 5, 8}
+
+@lru_cache(maxsize=None)
+def load_grammar(path: str) -> WorkflowGrammar:
+    """Grammar of the schema at `path` with the contracts enums, compiled once per process."""
+    with open(path, encoding="utf-8") as f:
+        return WorkflowGrammar(apply_contracts(json.load(f)))
+
+def _insert(trie: tuple, text: str, token_id: int):
+    for ch in text:
+        trie = trie[0].setdefault(ch, ({}, []))
+    trie[1].append(token_id)
+
+class TokenTable:
+    """
+    Tokenizer side of one grammar: the text of every token, a character trie over the printable
+    ASCII ones (json.dumps output never needs others) and the lazily filled transition tables.
+    """
+    def __init__(self, grammar: WorkflowGrammar, tok):
+        self.grammar = grammar
+        self.size = len(tok)
+        self.pieces = [tok.decode([i], skip_special_tokens=True) for i in range(self.size)]
+        self.trie: tuple = ({}, [])     # (children by character, token ids ending here)
+        self.special: tuple = ({}, [])  # only the tokens with '"', '\\' or '<'
+        self.plain = np.zeros(self.size, dtype=bool)
+        for i, p in enumerate(self.pieces):
+            if not p or not (p.isascii() and p.isprintable()):
+                continue   # special tokens (empty text), newlines, partial UTF-8
+            _insert(self.trie, p, i)
+            if '"' in p or "\\" in p or "<" in p:
+                _insert(self.special, p, i)
+            else:
+                self.plain[i] = True
+        self.masks: Dict[State, Optional[np.ndarray]] = {}   # state -> packed allowed-token bits
+        self.max_states = max(1024, _MASK_CACHE_BYTES // (self.size // 8 + 1))
+        self.next_states: Dict[Tuple[State, int], Optional[State]] = {}
+
+    def _walk(self, state: State, trie: tuple) -> List[int]:
+        ids = []
+        todo = [(trie, state)]
+        while todo:
+            (children, _), st = todo.pop()
+            for ch, child in children.items():
+                nxt = self.grammar.advance(st, ch)
+                if nxt is not None:
+                    ids.extend(child[1])
+                    if child[0]:
+                        todo.append((child, nxt))
+        return ids
+
+    def mask(self, state: State) -> Optional[torch.Tensor]:
+        """Bool mask of the tokens allowed in `state`; None if none is (the row is left alone)."""
+        if state not in self.masks:
+            if len(self.masks) >= self.max_states:
+                self.masks.clear()
+            allowed = np.zeros(self.size, dtype=bool)
+            if self.grammar.in_string(state):
+                allowed |= self.plain
+                allowed[self._walk(state, self.special)] = True
+            else:
+                allowed[self._walk(state, self.trie)] = True
+            self.masks[state] = np.packbits(allowed) if allowed.any() else None
+        packed = self.masks[state]
+        if packed is None:
+            return None
+        return torch.from_numpy(np.unpackbits(packed, count=self.size).view(bool))
+
+    def next(self, state: Optional[State], token_id: int) -> Optional[State]:
+        """State after `token_id`; None once the row left the grammar (it is then unconstrained)."""
+        if state is None:
+            return None
+        key = (state, token_id)
+        if key not in self.next_states:
+            if len(self.next_states) >= 1 << 20:
+                self.next_states.clear()
+            piece = self.pieces[token_id] if token_id < self.size else ""
+            self.next_states[key] = self.grammar.advance(state, piece)
+        return self.next_states[key]
+
+_TABLES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # tokenizer -> grammar -> TokenTable
+
+def token_table(grammar: WorkflowGrammar, tok) -> TokenTable:
+    tables = _TABLES.setdefault(tok, {})
+    if grammar not in tables:
+        tables[grammar] = TokenTable(grammar, tok)
+    return tables[grammar]
+
+class SchemaLogitsProcessor(LogitsProcessor):
+    """
+    Masks, per sequence, the tokens that would leave the grammar after the tokens generated past
+    `prompt_len`; one instance per generate() call, like JsonStop.
+    """
+    def __init__(self, tok, prompt_len: int, grammar: WorkflowGrammar):
+        self.table = token_table(grammar, tok)
+        self.pos = prompt_len
+        self.states: Optional[List[Optional[State]]] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        table = self.table
+        if self.states is None:
+            self.states = [table.grammar.start] * input_ids.shape[0]
+        new = input_ids[:, self.pos:].tolist()
+        self.pos = input_ids.shape[1]
+        rows, masks = [], []
+        for i, ids in enumerate(new):
+            st = self.states[i]
+            for t in ids:
+                st = table.next(st, t)
+            self.states[i] = st
+            if st is not None and not table.grammar.done(st):
+                m = table.mask(st)
+                if m is not None:
+                    rows.append(i)
+                    masks.append(m)
+        if rows:
+            blocked = torch.ones((len(rows), scores.shape[1]), dtype=torch.bool)
+            n = min(table.size, scores.shape[1])
+            blocked[:, :n] = ~torch.stack(masks)[:, :n]
+            rows = torch.tensor(rows, device=scores.device)
+            scores[rows] = scores[rows].masked_fill(blocked.to(scores.device), float("-inf"))
+        return scores
@@ -1,10 +1,17 @@
-import json, logging, subprocess, tempfile, os, textwrap, torch
+import json, logging, multiprocessing, subprocess, tempfile, os, textwrap, torch
 from collections import Counter
-from jsonschema import validate
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
 from synth.utils.semantic_validate import semantic_validate_workflow
-from transformers import TextStreamer
+from synth.utils.schema_validator import load_validator
+from transformers import LogitsProcessorList, StoppingCriteriaList, TextStreamer
+from training.sft.constrained import SchemaLogitsProcessor, load_grammar
+from training.sft.stopping import JsonStop, json_end
+from training.sft.token_cache import tokenize_rows
 LOG = logging.getLogger(__name__)
 
+SCHEMA_PATH = os.getenv("WFL_SCHEMA_PATH", "data/schema/wfl.schema.json")
+
 def render_prompt(inp):
     return (
         "You are an expert Workflow Template generator for an IT management platform (similar to RMM platform). Your goal is to produce valid, standards-compliant workflow templates in JSON format that integrate triggers, conditions, and actions. Return ONE JSON object only between <json> and </json>.\n"
@@ -16,9 +23,9 @@ def is_valid_workflow(obj) -> bool:
     Combined structural + semantic validation for one workflow JSON object.
     Returns True if it passes all checks, False otherwise.
     """
-    # 1) JSON Schema / structural validation
+    # 1) JSON Schema / structural validation (schema compiled once per process)
     try:
-        validate(instance=obj, schema=schema)
+        load_validator(SCHEMA_PATH).validate(obj)
     except Exception as e:
         LOG.debug("schema validation failed: %s", e)
         return False
@@ -41,6 +48,43 @@ def is_valid_workflow(obj) -> bool:
 
     return result is None
 
+def check_generation(text: str):
+    """
+    Classify one generated continuation of render_prompt (which ends inside <json>):
+    returns (None, payload) if it passes, else (failure reason, snippet for the log).
+    The payload ends at </json> or where the JSON object closes (generation stops there).
+    Top-level so it can run in a worker process.
+    """
+    end = json_end(text)
+    if end == -1:
+        return "missing_json_tags", text[:300].replace("\n", " ")
+    payload = text[:end].strip()
+    if not payload:
+        return "empty_json_block", text[:300].replace("\n", " ")
+    try:
+        obj = json.loads(payload)
+    except Exception as e:
+        return "json_parse_error", repr(e)
+    if not is_valid_workflow(obj):
+        return "validation_failed", payload[:300]
+    return None, payload
+
+_POOLS = {}  # workers -> ProcessPoolExecutor, kept for the life of the process
+
+def _validation_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Validation workers, started once per process and reused by every eval_pass_rate call.
+    They come from a forkserver rather than a fork of this process, which holds a CUDA context
+    and torch / tokenizer threads whose locks a fork would copy mid-use. Such a worker re-imports
+    the main script when it starts, so starting them per call would cost seconds every eval.
+    """
+    pool = _POOLS.get(workers)
+    if pool is None or pool._broken:
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])  # torch etc. imported once, in the server
+        pool = _POOLS[workers] = ProcessPoolExecutor(workers, mp_context=ctx)
+    return pool
+
 def eval_pass_rate(
         model,
         tok,
@@ -48,6 +92,9 @@ def eval_pass_rate(
         max_new_tokens: int = 2000,
         log_failures: bool = True,
         max_fail_logs: int = 20,
+        batch_size: int = 8,
+        workers: Optional[int] = None,
+        constrained: bool = False,
 ) -> float:
     """
     Run deterministic generation on val_rows and compute the fraction of
@@ -56,88 +103,67 @@ def eval_pass_rate(
       2) parse as JSON
       3) pass schema + semantic validation.
 
-    Logs reasons for failures (up to max_fail_logs examples).
+    Rows are generated in batches of `batch_size` (sorted by prompt length, left-padded), and each
+    sequence stops once its JSON object or the </json> tag closes (JsonStop). Finished batches are validated in a pool of `workers` processes
+    (default: up to 4; 0 validates inline; the pool is kept for later calls) while the model generates the next one.
+    With `constrained`, decoding is masked to the schema grammar (training/sft/constrained.py).
+    Logs reasons for failures (up to max_fail_logs examples) and tokens generated per example.
     """
     model.eval()
-    ok = 0
     stats = Counter()
-    logged = 0
-
-    for idx, r in enumerate(val_rows):
-        prompt = render_prompt(r["input"])
-
-        # 1) Generate
-        try:
-            ids = tok(prompt, return_tensors="pt").to(model.device)
-            with torch.no_grad():
-                out = model.generate(
-                    **ids,
-                    max_new_tokens=max_new_tokens,
-                    do_sample=False,
-                )
-            text = tok.decode(out[0], skip_special_tokens=True)
-        except Exception as e:
-            stats["generation_error"] += 1
-            if log_failures and logged < max_fail_logs:
-                LOG.warning(
-                    "eval row %d: generation error: %s",
-                    idx,
-                    repr(e),
-                )
-                logged += 1
-            continue
+    gen_tokens = []
+    prompts = [render_prompt(r["input"]) for r in val_rows]
+    order = sorted(range(len(prompts)), key=lambda i: -len(prompts[i]))
+    results = {}  # row -> future or (reason, detail)
+    workers = min(4, os.cpu_count() or 1) if workers is None else workers
+    pool = _validation_pool(workers) if workers > 0 else None  # workers only validate; they never touch the model
+    padding_side, tok.padding_side = tok.padding_side, "left"
+    pad_token_id = tok.pad_token_id if tok.pad_token_id is not None else tok.eos_token_id
+    grammar = load_grammar(SCHEMA_PATH) if constrained else None
 
-        # 2) Extract <json>...</json>
-        start = text.find("<json>")
-        end = text.find("</json>")
-        if start == -1 or end == -1:
-            stats["missing_json_tags"] += 1
-            if log_failures and logged < max_fail_logs:
-                print(
-                    "eval row: missing <json> tags. snippet: ",
-                    text[:300].replace("\n", " "),
-                )
-                logged += 1
-            continue
-
-        payload = text[start + len("<json>") : end].strip()
-        if not payload:
-            stats["empty_json_block"] += 1
-            if log_failures and logged < max_fail_logs:
-                print(
-                    "eval row: empty <json> block. full_text_snippet: ",
-                    text[:300].replace("\n", " "),
-                )
-                logged += 1
-            continue
-
-        # 3) JSON decode
-        try:
-            obj = json.loads(payload)
-        except Exception as e:
-            stats["json_parse_error"] += 1
-            if log_failures and logged < max_fail_logs:
-                print(
-                    "eval row %d: json parse error:",
-                    repr(e)
-                )
-                logged += 1
-            continue
+    try:
+        for s in range(0, len(order), batch_size):
+            rows = order[s:s + batch_size]
+            # 1) Generate
+            try:
+                enc = tok([prompts[i] for i in rows], return_tensors="pt", padding=True).to(model.device)
+                prompt_len = enc["input_ids"].shape[1]
+                processors = LogitsProcessorList([SchemaLogitsProcessor(tok, prompt_len, grammar)] if grammar else [])
+                with torch.no_grad():
+                    out = model.generate(
+                        **enc,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=False,
+                        stopping_criteria=StoppingCriteriaList([JsonStop(tok, prompt_len)]),
+                        logits_processor=processors,
+                        pad_token_id=pad_token_id,
+                    )
+                new = out[:, prompt_len:]
+                texts = tok.batch_decode(new, skip_special_tokens=True)
+                gen_tokens.extend((new != pad_token_id).sum(dim=1).tolist())
+            except Exception as e:
+                for i in rows:
+                    results[i] = ("generation_error", repr(e))
+                continue
+
+            # 2) Extract, parse and validate, off the generation path
+            for i, text in zip(rows, texts):
+                results[i] = pool.submit(check_generation, text) if pool is not None else check_generation(text)
+    finally:
+        tok.padding_side = padding_side
 
-        # 4) Schema + semantic validation
-        if not is_valid_workflow(obj):
-            stats["validation_failed"] += 1
-            if log_failures and logged < max_fail_logs:
-                print(
-                    "eval row: workflow failed validation. json_snippet: ",
-                    payload[:300],
-                )
-                logged += 1
+    logged = 0
+    for idx in range(len(val_rows)):
+        res = results[idx]
+        reason, detail = res.result() if isinstance(res, Future) else res
+        if reason is None:
             continue
+        stats[reason] += 1
+        if log_failures and logged < max_fail_logs:
+            LOG.warning("eval row %d: %s: %s", idx, reason, detail)
+            logged += 1
 
-        # Passed all checks
-        ok += 1
-
+    ok = len(val_rows) - sum(stats.values())
     total = len(val_rows) or 1  # avoid division by zero
     rate = ok / total
 
@@ -151,19 +177,53 @@ def eval_pass_rate(
     )
 
     print("failure stats: ", dict(stats))
+    if gen_tokens:
+        gen_tokens.sort()
+        print(f"eval_gen_tokens_per_example={sum(gen_tokens) / len(gen_tokens):.1f} "
+              f"p50={gen_tokens[len(gen_tokens) // 2]} max={gen_tokens[-1]} cap={max_new_tokens}")
 
     return rate
 
-def eval_ce(model, tok, rows):
-    # teacher-forced: measure logprob of reference outputs
-    losses = []
-    for row in rows:
-        prompt = render_prompt(row["input"])         # same as training
-        target = json.dumps(row["output"])          # reference JSON
-        text = prompt + target
-
-        tokens = tok(text, return_tensors="pt").to(model.device)
+def eval_ce(model, tok, rows, max_batch_tokens: int = 8192, max_length: Optional[int] = None):
+    """
+    Teacher-forced cross-entropy of the reference completion, tokenized and masked exactly as
+    train_sft trains on it (token_cache.tokenize_rows: format_prompt, the workflow JSON, </json>
+    and eos): the same per-token loss as training with completion_only_loss, not render_prompt's
+    generation prompt. Prompt and padding are not scored. Rows are sorted by length and batched
+    up to max_batch_tokens (padded rows x longest row) per forward pass.
+    Returns (mean of the per-example losses, per-example mean token losses in row order).
+    """
+    model.eval()
+    tokens, offsets, completion = tokenize_rows(tok, rows, max_length)  # max_length None: no cut
+    seqs = [(torch.as_tensor(tokens[a:b], dtype=torch.long), torch.as_tensor(completion[a:b], dtype=torch.bool))
+            for a, b in zip(offsets[:-1], offsets[1:])]
+    order = sorted(range(len(seqs)), key=lambda i: -len(seqs[i][0]))
+    pad_id = tok.pad_token_id if tok.pad_token_id is not None else tok.eos_token_id
+    losses = [float("nan")] * len(seqs)
+
+    s = 0
+    while s < len(order):
+        width = len(seqs[order[s]][0])
+        batch = order[s:s + max(1, max_batch_tokens // max(width, 1))]
+        s += len(batch)
+        input_ids = torch.full((len(batch), width), pad_id, dtype=torch.long)
+        labels = torch.full((len(batch), width), -100, dtype=torch.long)
+        for b, i in enumerate(batch):
+            ids, scored = seqs[i]
+            input_ids[b, :len(ids)] = ids
+            labels[b, :len(ids)] = ids.masked_fill(~scored, -100)
+        # padding is on the right, so under the causal mask no scored token can see it; leaving out
+        # the attention_mask keeps attention on the plain causal (fused) path
         with torch.no_grad():
-            out = model(**tokens, labels=tokens["input_ids"])
-        losses.append(out.loss.item())
-    return sum(losses) / len(losses)
+            logits = model(input_ids=input_ids.to(model.device)).logits[:, :-1]
+        labels = labels[:, 1:].to(logits.device)
+        mask = labels != -100
+        tok_loss = torch.zeros(labels.shape, dtype=torch.float32, device=logits.device)
+        tok_loss[mask] = torch.nn.functional.cross_entropy(logits[mask].float(), labels[mask], reduction="none")
+        per_row = tok_loss.sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        for b, i in enumerate(batch):
+            if mask[b].any():
+                losses[i] = per_row[b].item()
+
+    scored = [l for l in losses if l == l]
+    return (sum(scored) / len(scored) if scored else float("nan")), losses
@@ -0,0 +1,118 @@
+"""
+Batching modes for SFT, trading padding for simplicity:
+  none    - one example per row, batches in random order padded to their longest row (the old behaviour)
+  bucket  - one example per row, batches drawn from length-sorted mega-batches (Trainer group_by_length)
+  pack    - examples packed best-fit-decreasing into rows of at most max_length tokens
+
+Rows carry `seq_lengths`, and PackedCollator restarts position_ids at every example and passes no
+attention_mask; transformers (>= 4.54, models built on create_causal_mask) then derives a
+block-diagonal causal mask (sdpa / eager) or varlen boundaries (flash-attention) from them, so a
+packed example never attends to its neighbours. Each example's first token is also dropped from
+the labels, so the last token of one example is not trained to predict the next one.
+"""
+import bisect
+from typing import Dict, List, Sequence
+
+import numpy as np
+import torch
+from transformers.trainer_pt_utils import get_length_grouped_indices
+
+from training.sft.token_cache import TokenCache
+
+PACKING_MODES = ("none", "bucket", "pack")
+
+def pack_bfd(lengths: Sequence[int], max_length: int) -> List[List[int]]:
+    """Best-fit decreasing: example indices per row, every row at most max_length tokens."""
+    rows: List[List[int]] = []
+    free: List[tuple] = []  # sorted (tokens left, row)
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        n = lengths[i]
+        j = bisect.bisect_left(free, (n, -1))
+        if j < len(free):
+            left, r = free.pop(j)
+        else:
+            left, r = max_length, len(rows)
+            rows.append([])
+        rows[r].append(i)
+        if left > n:
+            bisect.insort(free, (left - n, r))
+    return rows
+
+class SFTRows(torch.utils.data.Dataset):
+    """input_ids / seq_lengths / completion_mask rows over a TokenCache; several examples per row only in pack mode."""
+    def __init__(self, cache: TokenCache, mode: str, max_length: int):
+        if mode not in PACKING_MODES:
+            raise ValueError(f"unknown packing mode {mode!r}; choose from {', '.join(PACKING_MODES)}")
+        self.cache = cache
+        self.rows = pack_bfd(cache.lengths().tolist(), max_length) if mode == "pack" else None
+
+    def __len__(self) -> int:
+        return len(self.rows) if self.rows is not None else len(self.cache)
+
+    def __getitem__(self, r: int) -> Dict:
+        if r >= len(self):
+            raise IndexError(r)
+        parts = [self.cache.example(i) for i in (self.rows[r] if self.rows is not None else (r,))]
+        return {"input_ids": np.concatenate([p[0] for p in parts]),
+                "seq_lengths": [len(p[0]) for p in parts],
+                "completion_mask": np.concatenate([p[1] for p in parts])}
+
+    def lengths(self) -> List[int]:
+        lengths = self.cache.lengths().tolist()
+        return lengths if self.rows is None else [sum(lengths[i] for i in row) for row in self.rows]
+
+class PackedCollator:
+    """Right-pads rows to the batch's longest; position_ids restart per example (padding is a segment of its own).
+
+    With completion_only_loss, prompt tokens (completion_mask 0) are left out of the labels too.
+    """
+    def __init__(self, pad_token_id: int, completion_only_loss: bool = False):
+        self.pad_token_id = pad_token_id
+        self.completion_only_loss = completion_only_loss
+
+    def __call__(self, features: List[Dict]) -> Dict[str, torch.Tensor]:
+        width = max(len(f["input_ids"]) for f in features)
+        input_ids = torch.full((len(features), width), self.pad_token_id, dtype=torch.long)
+        position_ids = torch.zeros((len(features), width), dtype=torch.long)
+        labels = torch.full((len(features), width), -100, dtype=torch.long)
+        for b, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[b, :n] = torch.as_tensor(np.asarray(f["input_ids"], dtype=np.int64))
+            labels[b, :n] = input_ids[b, :n]
+            if self.completion_only_loss and "completion_mask" in f:
+                keep = torch.as_tensor(np.asarray(f["completion_mask"], dtype=bool))
+                labels[b, :n][~keep] = -100
+            start = 0
+            for m in list(f["seq_lengths"]) + [width - n]:
+                position_ids[b, start:start + m] = torch.arange(m)
+                if start < n:
+                    labels[b, start] = -100
+                start += m
+        return {"input_ids": input_ids, "position_ids": position_ids, "labels": labels}
+
+def batch_order(lengths: Sequence[int], batch_size: int, group_by_length: bool, seed: int = 0) -> List[List[int]]:
+    """Row indices per batch as the Trainer's sampler would draw them."""
+    g = torch.Generator().manual_seed(seed)
+    if group_by_length:
+        order = get_length_grouped_indices(list(lengths), batch_size, generator=g)
+    else:
+        order = torch.randperm(len(lengths), generator=g).tolist()
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def padding_stats(lengths: Sequence[int], mode: str, max_length: int, batch_size: int, seed: int = 0) -> Dict[str, float]:
+    """Rows, batches, padded token slots and padding ratio (pad slots / all slots) for one mode."""
+    lengths = list(lengths)
+    if mode == "pack":
+        lengths = [sum(lengths[i] for i in row) for row in pack_bfd(lengths, max_length)]
+    batches = batch_order(lengths, batch_size, mode == "bucket", seed)
+    slots = sum(len(b) * max(lengths[i] for i in b) for b in batches)
+    tokens = sum(lengths)
+    return {"rows": len(lengths), "batches": len(batches), "slots": slots,
+            "padding": 1 - tokens / slots if slots else 0.0}
+
+def padding_report(lengths: Sequence[int], max_length: int, batch_size: int) -> str:
+    parts = []
+    for mode in PACKING_MODES:
+        s = padding_stats(lengths, mode, max_length, batch_size)
+        parts.append(f"{mode}: {s['rows']} rows, {s['batches']} batches, padding {s['padding']:.1%}")
+    return " | ".join(parts)
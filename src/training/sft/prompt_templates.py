@@ -6,10 +6,16 @@ SYSTEM = (
     "No comments or extra text."
 )
 
-def format_example(inp: str, out_json: str) -> str:
-    # Input → Output style; output is canonical JSON string (no newlines if you prefer)
+# bump when the layout below or the output serialization changes (invalidates token caches)
+TEMPLATE_VERSION = 1
+
+def format_prompt(inp: str) -> str:
     return (
         f"<system>\n{SYSTEM}\n</system>\n"
         f"<user>\n{inp}\n</user>\n"
-        f"<assistant>\n<json>\n{out_json}\n</json>\n"
+        f"<assistant>\n<json>\n"
     )
+
+def format_example(inp: str, out_json: str) -> str:
+    # Input → Output style; output is canonical JSON string (no newlines if you prefer)
+    return format_prompt(inp) + f"{out_json}\n</json>\n"
@@ -0,0 +1,99 @@
+"""
+Stop JSON generation as soon as the answer is complete: when the top-level JSON object closes
+(brace balance back to zero, ignoring braces inside strings) or the </json> tag is written,
+whichever comes first. Without it every sequence decodes to max_new_tokens unless the model
+happens to emit eos.
+
+JsonBalance tracks one text incrementally; JsonStop is a transformers StoppingCriteria running one
+tracker per sequence over the generated tokens only, with a per-tokenizer cache of token id -> text.
+"""
+import weakref
+from typing import Dict, List, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+CLOSE_TAG = "</json>"
+
+class JsonBalance:
+    """Brace balance of a JSON object fed in pieces; `done` once it closes or the tag appears."""
+    __slots__ = ("depth", "started", "in_string", "escape", "tail", "done", "consumed", "end")
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.tail = ""
+        self.done = False
+        self.consumed = 0     # characters fed so far
+        self.end = -1         # offset just past the closing brace (or tag start), once done
+
+    def feed(self, piece: str) -> bool:
+        if self.done:
+            return True
+        ends = []
+        for i, ch in enumerate(piece):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    ends.append(self.consumed + i + 1)
+                    break
+        tail = self.tail + piece
+        tag = tail.find(CLOSE_TAG)
+        if tag != -1:
+            ends.append(self.consumed - len(self.tail) + tag)
+        self.tail = tail[-(len(CLOSE_TAG) - 1):]
+        self.consumed += len(piece)
+        if ends:
+            self.done = True
+            self.end = min(ends)
+        return self.done
+
+def json_end(text: str) -> int:
+    """Offset just past the first complete top-level JSON object (or where </json> starts), -1 if neither."""
+    b = JsonBalance()
+    b.feed(text)
+    return b.end
+
+_PIECES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # tokenizer -> token id -> decoded text
+
+class JsonStop(StoppingCriteria):
+    """Per-sequence JsonBalance over the tokens generated after `prompt_len`; one instance per generate() call."""
+    def __init__(self, tok, prompt_len: int):
+        self.tok = tok
+        self.prompt_len = prompt_len
+        self.pieces: Dict[int, str] = _PIECES.setdefault(tok, {})
+        self.trackers: Optional[List[JsonBalance]] = None
+        self.pos = prompt_len
+
+    def _piece(self, token_id: int) -> str:
+        s = self.pieces.get(token_id)
+        if s is None:
+            s = self.pieces[token_id] = self.tok.decode([token_id], skip_special_tokens=True)
+        return s
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.trackers is None:
+            self.trackers = [JsonBalance() for _ in range(input_ids.shape[0])]
+        new = input_ids[:, self.pos:].tolist()
+        self.pos = input_ids.shape[1]
+        done = []
+        for tracker, ids in zip(self.trackers, new):
+            for t in ids:
+                if tracker.feed(self._piece(t)):
+                    break
+            done.append(tracker.done)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
@@ -0,0 +1,186 @@
+"""
+Pre-tokenized SFT examples as flat NumPy arrays, memory-mapped when loaded:
+  tokens.npy   int32, the token ids of all examples back to back (eos appended, truncated to max_length)
+  offsets.npy  int64, example i is tokens[offsets[i]:offsets[i + 1]]
+  mask.npy     uint8 per token, 1 on the completion (workflow JSON and closing tag), 0 on the prompt
+  meta.json    what the entry was built from
+
+Entries live in <cache_dir>/<key>/, where the key hashes the tokenizer, the prompt template, max_length
+and the content of the JSONL files, so changing any of them builds a new entry rather than reusing a
+stale one. A loaded cache costs no parsing or tokenization and its pages are shared by dataloader
+workers. Build offline with
+  PYTHONPATH=src python -m training.sft.token_cache --tokenizer <id> --data train.jsonl --cache_dir DIR
+or let train_sft.py --token_cache DIR build missing entries on first use.
+"""
+import argparse, hashlib, json, os, shutil, tempfile, time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from training.sft.prompt_templates import TEMPLATE_VERSION, format_example, format_prompt
+
+CACHE_VERSION = 1
+_CHUNK = 1024
+
+def jsonl_files(path: str) -> List[str]:
+    """A JSONL file, or the *.jsonl files of a directory in name order."""
+    if os.path.isdir(path):
+        return [os.path.join(path, n) for n in sorted(os.listdir(path)) if n.endswith(".jsonl")]
+    return [path]
+
+def example_text(row: Dict) -> str:
+    return format_example(row["input"], json.dumps(row["output"], sort_keys=True))
+
+def template_hash() -> str:
+    probe = example_text({"input": "\x00", "output": {"\x01": 1}})
+    return hashlib.blake2b(f"{TEMPLATE_VERSION}|{probe}".encode("utf-8"), digest_size=8).hexdigest()
+
+def tokenizer_hash(tok) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    h.update(type(tok).__name__.encode())
+    h.update(f"|{tok.bos_token}|{tok.eos_token}|".encode())  # not pad: train_sft may set it after loading
+    if getattr(tok, "is_fast", False):
+        h.update(tok.backend_tokenizer.to_str().encode("utf-8"))
+    else:
+        h.update(json.dumps(sorted(tok.get_vocab().items())).encode("utf-8"))
+    return h.hexdigest()
+
+def data_hash(files: Iterable[str]) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    for p in files:
+        h.update(os.path.basename(p).encode() + b"\0")
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+def cache_key(tok, files: Sequence[str], max_length: int) -> str:
+    parts = f"{CACHE_VERSION}|{tokenizer_hash(tok)}|{template_hash()}|{max_length}|{data_hash(files)}"
+    return hashlib.blake2b(parts.encode(), digest_size=12).hexdigest()
+
+def tokenize_rows(tok, rows: Sequence[Dict], max_length: int):
+    """(tokens, offsets, mask) arrays for SFT rows; mask marks tokens ending inside the completion."""
+    eos = tok.eos_token_id
+    tokens, mask, offsets = [], [], [0]
+    for s in range(0, len(rows), _CHUNK):
+        chunk = rows[s:s + _CHUNK]
+        texts = [example_text(r) for r in chunk]
+        starts = [len(format_prompt(r["input"])) for r in chunk]
+        if getattr(tok, "is_fast", False):
+            enc = tok(texts, return_offsets_mapping=True)
+            spans = [[end > start for _, end in offs] for offs, start in zip(enc["offset_mapping"], starts)]
+        else:
+            enc = tok(texts)
+            n_prompt = [len(tok(format_prompt(r["input"]))["input_ids"]) for r in chunk]
+            spans = [[i >= n for i in range(len(ids))] for ids, n in zip(enc["input_ids"], n_prompt)]
+        for ids, m in zip(enc["input_ids"], spans):
+            if eos is not None and (not ids or ids[-1] != eos):
+                ids, m = ids + [eos], m + [True]
+            ids, m = ids[:max_length], m[:max_length]
+            tokens.extend(ids)
+            mask.extend(m)
+            offsets.append(offsets[-1] + len(ids))
+    return (np.asarray(tokens, dtype=np.int32), np.asarray(offsets, dtype=np.int64),
+            np.asarray(mask, dtype=np.uint8))
+
+class TokenCache:
+    """Tokenized examples; arrays are memory-mapped when loaded from disk."""
+    def __init__(self, tokens: np.ndarray, offsets: np.ndarray, mask: np.ndarray, meta: Optional[Dict] = None):
+        self.tokens, self.offsets, self.mask = tokens, offsets, mask
+        self.meta = meta or {}
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def example(self, i: int):
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.tokens[a:b], self.mask[a:b]
+
+    @classmethod
+    def load(cls, path: str) -> "TokenCache":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{n}.npy"), mmap_mode="r") for n in ("tokens", "offsets", "mask")]
+        return cls(*arrays, meta=meta)
+
+    def save(self, path: str):
+        """Writes into a temp dir next to `path` and renames it into place."""
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp_", dir=parent)
+        try:
+            for n in ("tokens", "offsets", "mask"):
+                np.save(os.path.join(tmp, f"{n}.npy"), getattr(self, n))
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(self.meta, f, indent=2)
+            os.replace(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.exists(os.path.join(path, "meta.json")):  # else a concurrent build won
+                raise
+
+def build(tok, rows: Sequence[Dict], max_length: int, meta: Optional[Dict] = None) -> TokenCache:
+    tokens, offsets, mask = tokenize_rows(tok, rows, max_length)
+    meta = dict(meta or {}, examples=len(offsets) - 1, tokens=int(len(tokens)), max_length=max_length,
+                tokenizer=tokenizer_hash(tok), template=template_hash(), template_version=TEMPLATE_VERSION)
+    return TokenCache(tokens, offsets, mask, meta)
+
+def load_or_build(tok, path: str, max_length: int, load_rows: Callable[[], List[Dict]],
+                  cache_dir: Optional[str] = None) -> TokenCache:
+    """The cache entry for `path` (JSONL file or dir); built from load_rows() on a miss.
+
+    Without cache_dir the examples are tokenized in memory every time. A cache_dir that cannot be
+    written (e.g. a read-only input channel) only costs the reuse.
+    """
+    if cache_dir is None:
+        return build(tok, load_rows(), max_length)
+    files = jsonl_files(path)
+    key = cache_key(tok, files, max_length)
+    entry = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(entry, "meta.json")):
+        cache = TokenCache.load(entry)
+        print(f"[token_cache] hit {entry}: {len(cache)} examples, {cache.meta.get('tokens')} tokens")
+        return cache
+    t = time.perf_counter()
+    cache = build(tok, load_rows(), max_length, meta={"files": [os.path.basename(p) for p in files]})
+    try:
+        cache.save(entry)
+        cache = TokenCache.load(entry)
+        print(f"[token_cache] built {entry} in {time.perf_counter() - t:.1f}s")
+    except OSError as e:
+        print(f"[token_cache] could not write {entry} ({e}); using in-memory tokens")
+    return cache
+
+def read_jsonl(files: Sequence[str]) -> List[Dict]:
+    """Rows of the files; unparseable lines are skipped, as train_sft.load_jsonl_dir does."""
+    rows = []
+    for p in files:
+        with open(p, "r", encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    print(f"[token_cache] JSON error in {p}:{lineno}: {e}")
+    return rows
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pre-tokenize SFT JSONL into a token cache entry.")
+    ap.add_argument("--tokenizer", required=True, help="tokenizer id or path (the training --base_model_id)")
+    ap.add_argument("--hf_token", default=None)
+    ap.add_argument("--data", nargs="+", required=True, help="JSONL files or directories, one entry each")
+    ap.add_argument("--cache_dir", required=True)
+    ap.add_argument("--max_seq_length", type=int, default=2048)
+    args = ap.parse_args(argv)
+
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(args.tokenizer, token=args.hf_token, trust_remote_code=True)
+    for path in args.data:
+        load_or_build(tok, path, args.max_seq_length, lambda: read_jsonl(jsonl_files(path)), args.cache_dir)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,10 @@
 import os, json, argparse, math, transformers, trl
-from datasets import Dataset
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, TrainingArguments, DataCollatorForLanguageModeling
 from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
 from trl import SFTTrainer, SFTConfig
-from training.sft.dataset_sft import SFTJsonl
-from training.sft.prompt_templates import format_example
+from training.sft.packing import PACKING_MODES, PackedCollator, SFTRows, padding_report
+from training.sft.token_cache import jsonl_files, load_or_build
 
 def get_args():
     p = argparse.ArgumentParser()
@@ -16,9 +15,18 @@ def get_args():
     p.add_argument("--output_dir", type=str, default="/opt/ml/model")
     p.add_argument("--per_device_train_batch_size", type=int, default=4)
     p.add_argument("--per_device_eval_batch_size", type=int, default=4)
+    p.add_argument("--gen_batch_size", type=int, default=8, help="rows per generate() call in eval_pass_rate")
+    p.add_argument("--constrained_eval", type=str, default="false",
+                   help="also report eval_pass_rate with schema-constrained decoding")
     p.add_argument("--num_train_epochs", type=int, default=2)
     p.add_argument("--learning_rate", type=float, default=2e-4)
     p.add_argument("--max_seq_length", type=int, default=2048)
+    p.add_argument("--packing", type=str, default="none", choices=PACKING_MODES,
+                   help="none: one example per row; bucket: length-grouped batches; "
+                        "pack: examples packed into max_seq_length rows (fewer, fuller batches)")
+    p.add_argument("--token_cache", type=str, default=None,
+                   help="dir of pre-tokenized datasets (training/sft/token_cache.py); missing entries are built")
+    p.add_argument("--completion_only_loss", type=str, default="false", help="train on the workflow JSON only")
     p.add_argument("--lora_r", type=int, default=16)
     p.add_argument("--lora_alpha", type=int, default=32)
     p.add_argument("--lora_dropout", type=float, default=0.05)
@@ -31,12 +39,7 @@ def get_args():
 
 def load_jsonl_dir(path):
     # SageMaker mounts single file; support either dir or file
-    files = []
-    if os.path.isdir(path):
-        for n in os.listdir(path):
-            if n.endswith(".jsonl"): files.append(os.path.join(path, n))
-    else:
-        files = [path]
+    files = jsonl_files(path)
     rows = []
     for fname in files:
         print(f"[load_jsonl_dir] Reading {fname}")
@@ -58,11 +61,10 @@ def load_jsonl_dir(path):
     print(f"[load_jsonl_dir] Loaded {len(rows)} rows total")
     return rows
 
-def mk_dataset(rows):
-    exs = []
-    for r in rows:
-        exs.append({"text": format_example(r["input"], json.dumps(r["output"], sort_keys=True))})
-    return Dataset.from_list(exs)
+def mk_dataset(path, tok, args, rows=None):
+    cache = load_or_build(tok, path, args.max_seq_length,
+                          lambda: rows if rows is not None else load_jsonl_dir(path), args.token_cache)
+    return SFTRows(cache, args.packing, args.max_seq_length), cache
 
 def main():
     args = get_args()
@@ -71,13 +73,19 @@ def main():
     print("Transformers version:", transformers.__version__)
     print("TRL version:", trl.__version__)
 
-    train_rows = load_jsonl_dir(args.train_path)
     val_rows   = load_jsonl_dir(args.val_path)
 
     tok = AutoTokenizer.from_pretrained(args.base_model_id, token=args.hf_token, trust_remote_code=True)
     if tok.pad_token is None: tok.pad_token = tok.eos_token
     tok.padding_side = "right"
 
+    # token ids come from the token cache when it has an entry; the training rows are only parsed to build one
+    train_ds, train_cache = mk_dataset(args.train_path, tok, args)
+    val_ds, _ = mk_dataset(args.val_path, tok, args, rows=val_rows)
+    print(f"[packing] mode={args.packing} examples={len(train_cache)} "
+          f"{padding_report(train_cache.lengths().tolist(), args.max_seq_length, args.per_device_train_batch_size)}")
+    collator = PackedCollator(tok.pad_token_id, completion_only_loss=args.completion_only_loss.lower() == "true")
+
     quant_config = None
     if use_4bit:
         quant_config = BitsAndBytesConfig(
@@ -97,7 +105,7 @@ def main():
 
     # --- Baseline CE on the base model (quantized, no LoRA) ---
     from training.sft.eval_wfl import eval_pass_rate, eval_ce
-    ce_base = eval_ce(model, tok, val_rows)
+    ce_base, _ = eval_ce(model, tok, val_rows, max_length=args.max_seq_length)
     print(f"cross_entropy_base={ce_base:.4f}")
 
     if use_4bit:
@@ -109,9 +117,6 @@ def main():
     )
     model = get_peft_model(model, peft_cfg)
 
-    train_ds = mk_dataset(train_rows)
-    val_ds   = mk_dataset(val_rows)
-
     if torch.cuda.is_available():
         torch.backends.cuda.matmul.allow_tf32 = True
         print("Enabled TF32 matmul on CUDA")
@@ -124,13 +129,8 @@ def main():
 
     ex = train_ds[0]
     print(type(ex), ex.keys())
-    enc = tok(
-        ex["text"],
-        return_tensors="pt",
-        padding=True,
-        truncation=True,
-    )
-    print("input_ids dtype:", enc["input_ids"].dtype)
+    enc = collator([ex])
+    print("input_ids dtype:", enc["input_ids"].dtype, "examples in first row:", len(ex["seq_lengths"]))
 
     model.config.use_cache = False
 
@@ -149,8 +149,10 @@ def main():
         save_steps=args.save_steps,
         gradient_checkpointing=True,
         max_length=args.max_seq_length,
-        packing=False,  # JSON outputs benefit from un-packed sequences
-        dataset_text_field="text",
+        # rows are tokenized (and packed, in pack mode) above; PackedCollator keeps examples apart
+        packing=False,
+        group_by_length=args.packing == "bucket",
+        dataset_kwargs={"skip_prepare_dataset": True},
         report_to=["tensorboard"]
     )
 
@@ -159,6 +161,7 @@ def main():
         train_dataset=train_ds,
         eval_dataset=val_ds,
         processing_class=tok,
+        data_collator=collator,
         args=sft_config
     )
 
@@ -166,10 +169,13 @@ def main():
     trainer.save_model(args.output_dir)
 
     # quick eval: percentage of model generations that pass validator
-    rate = eval_pass_rate(model, tok, val_rows)
+    rate = eval_pass_rate(model, tok, val_rows, batch_size=args.gen_batch_size)
     print(f"eval_pass_rate={rate:.4f}")
+    if args.constrained_eval.lower() == "true":
+        rate = eval_pass_rate(model, tok, val_rows, batch_size=args.gen_batch_size, constrained=True)
+        print(f"eval_pass_rate_constrained={rate:.4f}")
 
-    ce_sft  = eval_ce(model, tok, val_rows)
+    ce_sft, _ = eval_ce(model, tok, val_rows, max_length=args.max_seq_length)
 
     print(f"cross_entropy_sft={ce_sft:.4f}")
     print(f"delta={(ce_base - ce_sft):.4f}")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Schema-constrained decoding (training/sft/constrained.py) on CPU:
+  compile  - grammar from the schema + contracts, token table for a small byte-level BPE
+  grammar  - random workflows (sorted and unsorted keys) must be accepted; synth.mutate mutants,
+             per rule, show which violations the grammar already rules out
+  mask     - teacher-forced walk over tokenized workflows: every reference token must be allowed,
+             cost per token with a cold and a warm table
+  generate - a tiny Llama fitted on synthetic rows (see bench_eval_pass_rate.py) continues the
+             training prompt, greedy and sampled, with and without SchemaLogitsProcessor;
+             check_generation outcomes, tokens per row and wall time. Sampling stands in for a
+             model that is less sure of the format than a tiny one on its own training data.
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_constrained.py --rows 32 --fit-steps 600
+"""
+import argparse, json, os, random, time
+from collections import Counter
+
+import torch
+from transformers import LogitsProcessorList, StoppingCriteriaList
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("WFL_SCHEMA_PATH", os.path.join(ROOT, "data", "schema", "wfl.schema.json"))
+
+from bench_eval_pass_rate import fit
+from bench_sft_packing import synthetic_rows, tiny_model, train_tokenizer
+from synth.mutate import mutate
+from synth.utils.wfl_factory import random_workflow
+from training.sft.constrained import (SchemaLogitsProcessor, WorkflowGrammar, apply_contracts, load_grammar,
+                                      token_table)
+from training.sft.eval_wfl import SCHEMA_PATH, check_generation
+from training.sft.prompt_templates import format_prompt
+from training.sft.stopping import JsonStop
+from training.sft.token_cache import example_text
+
+def accepts(grammar, text: str) -> bool:
+    st = grammar.advance(grammar.start, text)
+    return st is not None and grammar.done(st)
+
+def teacher_forced(grammar, table, tok, workflows) -> tuple:
+    tokens, blocked = 0, 0
+    t = time.perf_counter()
+    for wf in workflows:
+        st = grammar.start
+        for x in tok(json.dumps(wf, sort_keys=True))["input_ids"]:
+            if not table.mask(st)[x]:
+                blocked += 1
+                break
+            st = table.next(st, x)
+            tokens += 1
+    return (time.perf_counter() - t) / tokens, tokens, blocked
+
+@torch.no_grad()
+def generate(model, tok, rows, grammar, temperature: float, batch_size: int, max_new_tokens: int):
+    torch.manual_seed(0)
+    tok.padding_side = "left"
+    stats, tokens = Counter(), 0
+    t = time.perf_counter()
+    for s in range(0, len(rows), batch_size):
+        enc = tok([format_prompt(r["input"]) for r in rows[s:s + batch_size]], return_tensors="pt", padding=True)
+        n = enc["input_ids"].shape[1]
+        sampling = {"do_sample": True, "temperature": temperature, "top_k": 0} if temperature else {"do_sample": False}
+        out = model.generate(**enc, max_new_tokens=max_new_tokens, pad_token_id=tok.pad_token_id, **sampling,
+                             stopping_criteria=StoppingCriteriaList([JsonStop(tok, n)]),
+                             logits_processor=LogitsProcessorList([SchemaLogitsProcessor(tok, n, grammar)] if grammar else []))
+        tokens += (out[:, n:] != tok.pad_token_id).sum().item()
+        for text in tok.batch_decode(out[:, n:], skip_special_tokens=True):
+            stats[check_generation(text)[0] or "ok"] += 1
+    tok.padding_side = "right"
+    return time.perf_counter() - t, tokens / len(rows), stats
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=32)
+    ap.add_argument("--workflows", type=int, default=200)
+    ap.add_argument("--max-new-tokens", type=int, default=768)
+    ap.add_argument("--batch-size", type=int, default=8)
+    ap.add_argument("--fit-steps", type=int, default=600)
+    ap.add_argument("--hidden", type=int, default=128)
+    ap.add_argument("--temperatures", default="0,1.0,1.5", help="0 is greedy")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    train = synthetic_rows(400, args.seed)
+    tok = train_tokenizer([example_text(r) for r in train], 4096)
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        schema = json.load(f)
+    t = time.perf_counter()
+    WorkflowGrammar(apply_contracts(schema))
+    t_grammar = time.perf_counter() - t
+    grammar = load_grammar(SCHEMA_PATH)
+    t = time.perf_counter()
+    table = token_table(grammar, tok)
+    print(f" compile: grammar {t_grammar:.2f}s ({len(grammar.nodes)} nodes), "
+          f"token table {time.perf_counter() - t:.2f}s ({table.size} tokens)")
+
+    rng = random.Random(args.seed)
+    workflows = [random_workflow(rng, n_steps=rng.randrange(1, 13)) for _ in range(args.workflows)]
+    ok = sum(accepts(grammar, json.dumps(w, sort_keys=s)) for w in workflows for s in (True, False))
+    print(f" grammar: {ok}/{2 * len(workflows)} valid serializations accepted")
+    seen, rejected = Counter(), Counter()
+    for w in workflows:
+        m = mutate(w, rng)
+        if m is not None:
+            seen[m[1]] += 1
+            rejected[m[1]] += not accepts(grammar, json.dumps(m[0], sort_keys=True))
+    for rule in sorted(seen):
+        print(f"          {rule:<30} {rejected[rule]:>4}/{seen[rule]} mutants rejected")
+
+    for name in ("cold", "warm"):
+        per_token, tokens, blocked = teacher_forced(grammar, table, tok, workflows)
+        print(f"    mask: {name} {per_token * 1e6:7.1f} us/token over {tokens} tokens, "
+              f"{blocked} reference tokens blocked, {len(table.masks)} states cached")
+
+    model = tiny_model(tok, 4096, "sdpa", hidden=args.hidden)
+    if args.fit_steps:
+        fit(model, tok, train, args.fit_steps, 1024)
+    model.eval()
+    rows = synthetic_rows(args.rows, args.seed + 1)
+    for temperature in (float(x) for x in args.temperatures.split(",")):
+        for constrained in (False, True):
+            dt, per_row, stats = generate(model, tok, rows, grammar if constrained else None, temperature,
+                                          args.batch_size, args.max_new_tokens)
+            print(f"generate: T={temperature:<4} constrained={constrained!s:<5} {dt:6.1f}s {per_row:6.0f} tokens/row  "
+                  f"{dict(sorted(stats.items()))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+eval_ce cost on CPU with a small random Llama:
+  per-row  - the previous loop: one forward per row, loss over prompt + target
+  batched  - eval_ce: length-sorted batches up to --max-batch-tokens, only target tokens scored
+The batched per-example losses are also compared with eval_ce run one row per batch (must agree up
+to float noise, i.e. padding does not leak into the scores).
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_eval_ce.py --rows 200
+"""
+import argparse, json, time
+
+import torch
+
+from bench_sft_packing import synthetic_rows, tiny_model, train_tokenizer
+from training.sft.eval_wfl import eval_ce, render_prompt
+from training.sft.token_cache import example_text
+
+@torch.no_grad()
+def per_row(model, tok, rows):
+    losses = []
+    for row in rows:
+        tokens = tok(render_prompt(row["input"]) + json.dumps(row["output"]), return_tensors="pt")
+        losses.append(model(**tokens, labels=tokens["input_ids"]).loss.item())
+    return sum(losses) / len(losses)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200)
+    ap.add_argument("--max-batch-tokens", type=int, default=8192)
+    ap.add_argument("--hidden", type=int, default=512, help="tiny model width; small widths are attention-bound")
+    ap.add_argument("--layers", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rows = synthetic_rows(args.rows, args.seed)
+    tok = train_tokenizer([example_text(r) for r in rows], 4096)
+    model = tiny_model(tok, 8192, "sdpa", hidden=args.hidden, layers=args.layers).eval()
+
+    t = time.perf_counter()
+    old = per_row(model, tok, rows)
+    t_old = time.perf_counter() - t
+    t = time.perf_counter()
+    mean, losses = eval_ce(model, tok, rows, max_batch_tokens=args.max_batch_tokens)
+    t_new = time.perf_counter() - t
+    _, single = eval_ce(model, tok, rows, max_batch_tokens=1)
+    diff = max(abs(a - b) for a, b in zip(losses, single))
+    print(f" per-row: {t_old:6.2f}s  mean CE {old:.4f} (prompt + target)")
+    print(f" batched: {t_new:6.2f}s  mean CE {mean:.4f} (target only), {t_old / t_new:.1f}x; "
+          f"max |batched - single-row| per-example {diff:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+eval_pass_rate wall time on CPU with a tiny Llama:
+  serial   - the previous loop: one generate() per row, decoding to max_new_tokens
+  batch=N  - eval_pass_rate: length-sorted left-padded batches, JsonStop, validation in a pool
+
+With --fit-steps the tiny model is first trained on synthetic rows (packed, see
+training/sft/packing.py) so that it emits workflow JSON and eos, and rows finish at different
+lengths; untrained, every row runs to max_new_tokens and only the batching shows.
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_eval_pass_rate.py --rows 32 --fit-steps 150
+"""
+import argparse, time
+
+import torch
+
+from bench_sft_packing import synthetic_rows, tiny_model, train_tokenizer
+from training.sft.eval_wfl import _validation_pool, check_generation, eval_pass_rate, render_prompt
+from training.sft.packing import PackedCollator, SFTRows, batch_order
+from training.sft.token_cache import build, example_text
+
+def fit(model, tok, rows, steps: int, max_length: int):
+    ds = SFTRows(build(tok, rows, max_length), "pack", max_length)
+    collator = PackedCollator(tok.pad_token_id)
+    opt = torch.optim.AdamW(model.parameters(), lr=3e-3)
+    model.train()
+    done = 0
+    while done < steps:
+        for b in batch_order(ds.lengths(), 4, False, seed=done):
+            loss = model(**collator([ds[i] for i in b]), use_cache=False).loss
+            loss.backward()
+            opt.step()
+            opt.zero_grad()
+            done += 1
+            if done % 50 == 0:
+                print(f"  fit step {done}: loss {loss.item():.3f}")
+            if done >= steps:
+                break
+    model.eval()
+
+@torch.no_grad()
+def serial(model, tok, rows, max_new_tokens: int):
+    """The loop eval_pass_rate ran before: batch of one, no stop condition."""
+    fails, new_tokens = 0, 0
+    for r in rows:
+        ids = tok(render_prompt(r["input"]), return_tensors="pt")
+        out = model.generate(**ids, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tok.pad_token_id)
+        new_tokens += out.shape[1] - ids["input_ids"].shape[1]
+        fails += check_generation(tok.decode(out[0, ids["input_ids"].shape[1]:], skip_special_tokens=True))[0] is not None
+    return fails, new_tokens
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=32)
+    ap.add_argument("--max-new-tokens", type=int, default=512)
+    ap.add_argument("--batch-size", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--fit-steps", type=int, default=0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    train = synthetic_rows(400, args.seed)
+    rows = synthetic_rows(args.rows, args.seed + 1)
+    tok = train_tokenizer([example_text(r) for r in train], 4096)
+    tok.padding_side = "right"
+    model = tiny_model(tok, 4096, "sdpa")
+    if args.fit_steps:
+        fit(model, tok, train, args.fit_steps, 1024)
+    model.eval()
+
+    t = time.perf_counter()
+    fails, new_tokens = serial(model, tok, rows, args.max_new_tokens)
+    dt = time.perf_counter() - t
+    print(f"  serial: {dt:6.1f}s ({len(rows) / dt:.2f} rows/s), {new_tokens / len(rows):.0f} new tokens/row, "
+          f"pass rate {1 - fails / len(rows):.3f}")
+    if args.workers:
+        # the pool outlives eval_pass_rate calls; its start-up is paid once per process
+        t = time.perf_counter()
+        list(_validation_pool(args.workers).map(check_generation, [""] * args.workers))
+        print(f"  validation pool start: {time.perf_counter() - t:.1f}s (once per process)")
+    for bs in sorted({1, args.batch_size}):
+        t = time.perf_counter()
+        rate = eval_pass_rate(model, tok, rows, max_new_tokens=args.max_new_tokens, log_failures=False,
+                              batch_size=bs, workers=args.workers)
+        dt = time.perf_counter() - t
+        print(f" batch={bs}: {dt:6.1f}s ({len(rows) / dt:.2f} rows/s), pass rate {rate:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Workflow hashing cost and id/timestamp invariance:
+  canonical   - sha256(canonical_json(wf)), the previous dedupe key for outputs
+  fingerprint - workflow_fingerprint(wf): orjson sorted dump, ids renumbered, startDate nulled
+
+Each workflow is also re-issued with fresh step ids and a new schedule startDate (what a second
+teacher compile of the same request looks like); the summary counts how many re-issued copies
+each key still recognizes.
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_fingerprint.py --workflows 500 --steps 20
+"""
+import argparse, copy, hashlib, random, time
+
+from synth.utils.json_utils import canonical_json, orjson, workflow_fingerprint
+from synth.utils.wfl_factory import random_workflow
+
+def reissue(wf, rng: random.Random):
+    """Same workflow, new 13-digit ids (references follow) and a new stamped startDate."""
+    out = copy.deepcopy(wf)
+    base = rng.randrange(1_600_000_000_000, 1_800_000_000_000)
+    mapping = {}
+    def walk(x):
+        if isinstance(x, dict):
+            for k, v in x.items():
+                if k in ("id", "workflowStepId") and isinstance(v, int):
+                    x[k] = mapping.setdefault(v, base + len(mapping))
+                elif k == "startDate":
+                    x[k] = f"2025-{rng.randrange(1, 13):02d}-01T00:00:00.000Z"
+                else:
+                    walk(v)
+        elif isinstance(x, list):
+            for v in x:
+                walk(v)
+    walk(out)
+    return out
+
+def scheduled(wf):
+    wf = copy.deepcopy(wf)
+    t = wf["workflowSteps"][0]
+    t.update(triggerType=1, triggerSubType="Scheduled", schedule={"startDate": "2024-01-01T00:00:00.000Z", "timezone": "UTC"})
+    return wf
+
+def bench(fn, wfs, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for wf in wfs:
+            fn(wf)
+        best = min(best, time.perf_counter() - t)
+    return best / len(wfs)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workflows", type=int, default=500)
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    wfs = [scheduled(random_workflow(rng, n_steps=args.steps)) for _ in range(args.workflows)]
+    copies = [reissue(wf, rng) for wf in wfs]
+    print(f"orjson: {'yes' if orjson is not None else 'no (json fallback)'}")
+
+    rows = [("canonical", lambda wf: hashlib.sha256(canonical_json(wf).encode()).digest()),
+            ("fingerprint", workflow_fingerprint)]
+    base = None
+    print(f"{'key':>12} {'us/workflow':>12} {'speedup':>8} {'re-issued recognized':>21}")
+    for name, fn in rows:
+        per = bench(fn, wfs, args.repeat)
+        base = base or per
+        same = sum(fn(a) == fn(b) for a, b in zip(wfs, copies))
+        print(f"{name:>12} {per * 1e6:>12.1f} {base / per:>7.2f}x {same:>10}/{len(wfs)}")
+
+if __name__ == "__main__":
+    main()
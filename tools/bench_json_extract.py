@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+extract_json_block latency on synthetic teacher responses (random workflows wrapped in
+<json> tags, ```json fences or bare prose) against the former regex + brace-counting extractor.
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_json_extract.py --responses 300 --steps 20
+"""
+import argparse, json, random, re, time
+
+from synth.utils.json_utils import extract_json_block
+from synth.utils.wfl_factory import random_workflow
+
+# ---- previous implementation, kept here as the baseline ----
+_fence_re = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL | re.IGNORECASE)
+_tag_re   = re.compile(r"<json>\s*(\{.*?\})\s*</json>", re.DOTALL | re.IGNORECASE)
+
+def _strip_line_comments_outside_strings(s: str) -> str:
+    out, i, in_str, esc = [], 0, False, False
+    while i < len(s):
+        ch = s[i]
+        if in_str:
+            out.append(ch)
+            if esc: esc = False
+            elif ch == "\\": esc = True
+            elif ch == '"': in_str = False
+            i += 1
+        else:
+            if ch == '"':
+                in_str = True
+                out.append(ch); i += 1
+            elif ch == "/" and i+1 < len(s) and s[i+1] == "/":
+                while i < len(s) and s[i] not in "\r\n": i += 1
+            else:
+                out.append(ch); i += 1
+    return "".join(out)
+
+def baseline_extract(text: str):
+    m = _tag_re.search(text) or _fence_re.search(text)
+    if m:
+        return json.loads(_strip_line_comments_outside_strings(m.group(1)))
+    i = text.find("{")
+    depth = 0; end = None
+    for j, ch in enumerate(text[i:], start=i):
+        if ch == "{": depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                end = j + 1; break
+    return json.loads(_strip_line_comments_outside_strings(text[i:end]))
+
+WRAPS = ("Here is the workflow:\n<json>\n%s\n</json>\n", "```json\n%s\n```", "Sure. %s Let me know.")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--responses", type=int, default=300)
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [rng.choice(WRAPS) % json.dumps(random_workflow(rng, n_steps=args.steps), indent=2)
+             for _ in range(args.responses)]
+    kb = sum(map(len, texts)) / len(texts) / 1024
+    print(f"{len(texts)} responses, {kb:.1f} KB avg")
+    for name, fn in (("baseline", baseline_extract), ("single-pass", extract_json_block)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            for s in texts:
+                fn(s)
+            best = min(best, time.perf_counter() - t)
+        per = best / len(texts)
+        print(f"{name:>12} {per * 1e6:>9.1f} us/response {kb / 1024 / per:>8.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
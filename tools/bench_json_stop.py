@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+JSON stop criteria (training/sft/stopping.py):
+  tracker   - JsonBalance cost per generated token, fed the token pieces of real workflow JSON
+  generate  - a tiny Llama fitted on synthetic rows (see bench_eval_pass_rate.py), batched greedy
+              generation with each stop condition; new tokens per example, wall time and how many
+              continuations hold a complete JSON object
+                eos       - eos / max_new_tokens only (eval_pass_rate before)
+                tag       - generate(stop_strings=["</json>"])
+                jsonstop  - JsonStop: object closed or </json>, whichever first
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_json_stop.py --rows 32 --fit-steps 300
+"""
+import argparse, json, random, time
+
+import torch
+from transformers import StoppingCriteriaList
+
+from bench_eval_pass_rate import fit
+from bench_sft_packing import synthetic_rows, tiny_model, train_tokenizer
+from synth.utils.wfl_factory import random_workflow
+from training.sft.eval_wfl import render_prompt
+from training.sft.stopping import JsonBalance, JsonStop, json_end
+from training.sft.token_cache import example_text
+
+def tracker_cost(tok, n: int, seed: int) -> float:
+    rng = random.Random(seed)
+    pieces = []
+    for _ in range(n):
+        text = json.dumps(random_workflow(rng, n_steps=rng.randrange(2, 15)), sort_keys=True) + "\n</json>\n"
+        pieces.append([tok.decode([t]) for t in tok(text)["input_ids"]])
+    total = sum(len(p) for p in pieces)
+    t = time.perf_counter()
+    for p in pieces:
+        b = JsonBalance()
+        for s in p:
+            if b.feed(s):
+                break
+    return (time.perf_counter() - t) / total
+
+@torch.no_grad()
+def run(model, tok, rows, mode: str, batch_size: int, max_new_tokens: int):
+    prompts = sorted((render_prompt(r["input"]) for r in rows), key=len, reverse=True)
+    tok.padding_side = "left"
+    new_tokens, closed = [], 0
+    t = time.perf_counter()
+    for s in range(0, len(prompts), batch_size):
+        enc = tok(prompts[s:s + batch_size], return_tensors="pt", padding=True)
+        kw = {}
+        if mode == "tag":
+            kw = {"stop_strings": ["</json>"], "tokenizer": tok}
+        elif mode == "jsonstop":
+            kw = {"stopping_criteria": StoppingCriteriaList([JsonStop(tok, enc["input_ids"].shape[1])])}
+        out = model.generate(**enc, max_new_tokens=max_new_tokens, do_sample=False,
+                             pad_token_id=tok.pad_token_id, **kw)
+        new = out[:, enc["input_ids"].shape[1]:]
+        new_tokens.extend((new != tok.pad_token_id).sum(dim=1).tolist())
+        for text in tok.batch_decode(new, skip_special_tokens=True):
+            end = json_end(text)
+            try:
+                closed += end != -1 and isinstance(json.loads(text[:end]), dict)
+            except ValueError:
+                pass
+    tok.padding_side = "right"
+    return time.perf_counter() - t, new_tokens, closed
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=32)
+    ap.add_argument("--batch-size", type=int, default=8)
+    ap.add_argument("--max-new-tokens", type=int, default=1024)
+    ap.add_argument("--fit-steps", type=int, default=300)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    train = synthetic_rows(400, args.seed)
+    tok = train_tokenizer([example_text(r) for r in train], 4096)
+    print(f" tracker: {tracker_cost(tok, 200, args.seed) * 1e6:.2f} us/token")
+
+    model = tiny_model(tok, 4096, "sdpa")
+    if args.fit_steps:
+        fit(model, tok, train, args.fit_steps, 1024)
+    model.eval()
+    rows = synthetic_rows(args.rows, args.seed + 1)
+    print(f"{'stop':>9} {'s':>7} {'tokens/example':>15} {'p50':>5} {'max':>5} {'complete JSON':>14}")
+    for mode in ("eos", "tag", "jsonstop"):
+        dt, new_tokens, closed = run(model, tok, rows, mode, args.batch_size, args.max_new_tokens)
+        new_tokens.sort()
+        print(f"{mode:>9} {dt:>7.1f} {sum(new_tokens) / len(new_tokens):>15.1f} {new_tokens[len(new_tokens) // 2]:>5} "
+              f"{new_tokens[-1]:>5} {closed:>8}/{len(rows)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Mutation throughput on random valid workflows, per targeted rule:
+  mutate   - synth.mutate.apply_rule only
+  verify   - apply_rule + semantic check that the mutant fails its rule
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_mutate.py --workflows 200 --steps 20 --mutations 20000
+"""
+import argparse, random, time
+
+from synth.mutate import RULES, apply_rule, violated_rule_message
+from synth.utils.wfl_factory import random_workflow
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workflows", type=int, default=200)
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--mutations", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    wfs = [random_workflow(rng, n_steps=args.steps) for _ in range(args.workflows)]
+    rules = list(RULES)
+
+    t = time.perf_counter()
+    for i in range(args.mutations):
+        apply_rule(wfs[i % len(wfs)], rules[i % len(rules)], rng)
+    dt = time.perf_counter() - t
+    print(f"mutate  {args.mutations} in {dt:.2f}s  {args.mutations / dt:8.0f} mutations/s")
+
+    missed = {r: 0 for r in rules}
+    t = time.perf_counter()
+    for i in range(args.mutations):
+        rule = rules[i % len(rules)]
+        mutant = apply_rule(wfs[i % len(wfs)], rule, rng)
+        if mutant is None or violated_rule_message(mutant, rule) is None:
+            missed[rule] += 1
+    dt = time.perf_counter() - t
+    print(f"verify  {args.mutations} in {dt:.2f}s  {args.mutations / dt:8.0f} mutations/s")
+    for rule, n in missed.items():
+        print(f"  {rule:30s} missed={n}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate filter throughput and agreement with brute force on synthetic data:
+groups of paraphrased prompts (word swaps / drops) paired with one workflow each.
+
+  lsh    - NearDeduper over all rows (MinHash + LSH banding), rows/s
+  brute  - on the first --brute rows: every row compared with every kept row using the exact
+           Jaccard of the shingle sets; recall / precision of the LSH decisions against it
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_near_dedupe.py --rows 100000 --brute 3000
+"""
+import argparse, random, time
+
+from synth.dedupe import NearDeduper, shape_key, shingles
+from synth.utils.wfl_factory import random_workflow
+
+VOCAB = ("create build make a an the workflow automation that which reboots restarts patches installs "
+         "updates cleans checks monitors all every each windows linux macos servers laptops workstations "
+         "devices nightly weekly daily on sunday monday at 3am 2am midnight and then logs writes notifies "
+         "emails it admins result status output if when disk space is low cpu high memory service stopped").split()
+
+def make_rows(n: int, group: int, seed: int):
+    rng = random.Random(seed)
+    wfs = [random_workflow(rng, n_steps=rng.randrange(3, 10)) for _ in range(500)]
+    rows = []
+    while len(rows) < n:
+        base = [rng.choice(VOCAB) for _ in range(rng.randrange(10, 25))]
+        wf = rng.choice(wfs)
+        for _ in range(rng.randrange(1, 2 * group)):
+            words = list(base)
+            for _ in range(rng.randrange(0, 3)):
+                i = rng.randrange(len(words))
+                if rng.random() < 0.7:
+                    words[i] = rng.choice(VOCAB)
+                else:
+                    del words[i]
+            rows.append({"input": " ".join(words), "output": wf})
+    return rows[:n]
+
+def brute(rows, threshold: float, k: int):
+    kept, keep = [], []
+    for ex in rows:
+        s, shape = shingles(ex["input"], k), shape_key(ex["output"])
+        dup = any(shape == sh and len(s & t) / len(s | t) >= threshold for t, sh in kept)
+        keep.append(not dup)
+        if not dup:
+            kept.append((s, shape))
+    return keep
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--group", type=int, default=4, help="mean paraphrases per prompt")
+    ap.add_argument("--threshold", type=float, default=0.8)
+    ap.add_argument("--num-perm", type=int, default=128)
+    ap.add_argument("--brute", type=int, default=3000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rows = make_rows(args.rows, args.group, args.seed)
+    nd = NearDeduper(threshold=args.threshold, num_perm=args.num_perm)
+    print(f"{len(rows)} rows, bands={nd.bands} rows/band={nd.rows}")
+    t = time.perf_counter()
+    keep = [nd.add(ex) for ex in rows]
+    dt = time.perf_counter() - t
+    print(f"   lsh: {dt:.2f}s ({len(rows) / dt:.0f} rows/s), removed {nd.removed} ({nd.removed / len(rows):.1%})")
+
+    m = min(args.brute, len(rows))
+    if m:
+        t = time.perf_counter()
+        ref = brute(rows[:m], args.threshold, nd.shingle)
+        dt = time.perf_counter() - t
+        sub = NearDeduper(threshold=args.threshold, num_perm=args.num_perm)
+        got = [sub.add(ex) for ex in rows[:m]]
+        tp = sum(1 for r, g in zip(ref, got) if not r and not g)
+        ref_dups, got_dups = ref.count(False), got.count(False)
+        print(f" brute: {dt:.2f}s on {m} rows ({m / dt:.0f} rows/s); duplicates brute={ref_dups} lsh={got_dups}, "
+              f"recall {tp / max(ref_dups, 1):.3f}, precision {tp / max(got_dups, 1):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Compare teacher-call throughput against the local mock server (no network):
+  serial  - OpenAIClient.chat, one request at a time (pre-async behaviour)
+  async   - OpenAIClient.achat fanned out through BoundedClient over a pooled connection set
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_providers.py --requests 200 --latency 0.2 --concurrency 16
+"""
+import argparse, asyncio, time
+
+from synth.providers.mock_server import MockServer
+from synth.providers.openai_client import OpenAIClient
+from synth.engine import BoundedClient
+
+def bench_serial(srv: MockServer, n: int, conc: int):
+    client = OpenAIClient(model="mock", api_key="x", base_url=srv.base_url, max_connections=conc)
+    t = time.perf_counter()
+    for i in range(n):
+        client.chat("sys", f"req {i}", temperature=0.0, top_p=1.0)
+    return time.perf_counter() - t
+
+def bench_async(srv: MockServer, n: int, conc: int):
+    client = OpenAIClient(model="mock", api_key="x", base_url=srv.base_url, max_connections=conc)
+    async def run():
+        bounded = BoundedClient(client, conc)
+        try:
+            await asyncio.gather(*(bounded.achat("sys", f"req {i}", temperature=0.0, top_p=1.0) for i in range(n)))
+        finally:
+            await bounded.aclose()
+        return bounded.peak_in_flight
+    t = time.perf_counter()
+    peak = asyncio.run(run())
+    return time.perf_counter() - t, peak
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--concurrency", type=int, default=16)
+    args = ap.parse_args()
+
+    srv = MockServer(latency=args.latency).start()
+    try:
+        n_serial = max(1, args.requests // 10)
+        c0 = srv.connections
+        dt = bench_serial(srv, n_serial, args.concurrency)
+        print(f"serial: {n_serial} req in {dt:.2f}s -> {n_serial/dt:.1f} req/s, "
+              f"connections={srv.connections - c0}")
+
+        c0 = srv.connections
+        dt, peak = bench_async(srv, args.requests, args.concurrency)
+        print(f"async : {args.requests} req in {dt:.2f}s -> {args.requests/dt:.1f} req/s, "
+              f"connections={srv.connections - c0} peak_in_flight={peak}")
+    finally:
+        srv.stop()
+
+if __name__ == "__main__":
+    main()
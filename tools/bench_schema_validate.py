@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Per-workflow JSON Schema validation cost:
+  validate  - jsonschema.validate(instance, schema), i.e. schema check + new validator per call
+  cached    - SchemaValidator without the fast path (jsonschema validator built once)
+  fast      - SchemaValidator with the fastjsonschema code-generated accept path (if installed)
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_schema_validate.py --workflows 50 --steps 20
+"""
+import argparse, json, random, time
+
+from jsonschema import validate
+
+from synth.utils.schema_validator import SchemaValidator
+from synth.utils.wfl_factory import random_workflow
+
+def bench(fn, wfs, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for wf in wfs:
+            fn(wf)
+        best = min(best, time.perf_counter() - t)
+    return best / len(wfs)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--schema", default="../data/schema/wfl.schema.json")
+    ap.add_argument("--workflows", type=int, default=50)
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    schema = json.loads(open(args.schema, encoding="utf-8").read())
+    rng = random.Random(args.seed)
+    wfs = [random_workflow(rng, n_steps=args.steps) for _ in range(args.workflows)]
+
+    t = time.perf_counter()
+    fast = SchemaValidator(schema)
+    print(f"compile (once per process): {(time.perf_counter() - t) * 1e3:.1f} ms")
+    cached = SchemaValidator(schema, fast=False)
+
+    rows = [("validate", lambda wf: validate(instance=wf, schema=schema)), ("cached", cached.validate)]
+    if fast._fast is not None:
+        rows.append(("fast", fast.validate))
+    else:
+        print("fastjsonschema not installed: no fast path")
+
+    base = None
+    print(f"{'mode':>10} {'ms/workflow':>12} {'speedup':>8}")
+    for name, fn in rows:
+        per = bench(fn, wfs, args.repeat)
+        base = base or per
+        print(f"{name:>10} {per * 1e3:>12.3f} {base / per:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
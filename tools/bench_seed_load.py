@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Seed loading cost on a synthetic seed directory (random workflows wrapped in notes, a few broken):
+  serial - every file read and parsed in this process, no cache (pre-cache behaviour)
+  cold   - load_seeds with an empty cache: process pool over all files, index written
+  warm   - load_seeds with every file unchanged since the cold run
+  touch1 - one file modified: only that file is re-parsed
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_seed_load.py --files 2000 --workers 8
+"""
+import argparse, json, os, pathlib, random, tempfile, time
+
+from synth.seeds import load_seeds
+from synth.utils.wfl_factory import random_workflow
+
+def make_seed_dir(root: pathlib.Path, n: int, steps: int, seed: int):
+    rng = random.Random(seed)
+    for i in range(n):
+        wf = random_workflow(rng, n_steps=steps)
+        body = "// exported template\n" + json.dumps(wf, indent=2) + "\n"
+        if i % 100 == 99:
+            body = body[: len(body) // 2]  # truncated export: unbalanced braces
+        (root / f"seed_{i:05d}.wfl").write_text(body, encoding="utf-8")
+
+def timed(fn):
+    t = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t, out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=2000)
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        root = pathlib.Path(d)
+        make_seed_dir(root, args.files, args.steps, args.seed)
+        mb = sum(p.stat().st_size for p in root.glob("*.wfl")) / 1e6
+        print(f"{args.files} seed files, {mb:.1f} MB, workers={args.workers}")
+
+        rows = [
+            ("serial", lambda: load_seeds(d, workers=1, use_cache=False)),
+            ("cold", lambda: load_seeds(d, workers=args.workers)),
+            ("warm", lambda: load_seeds(d, workers=args.workers)),
+        ]
+        for name, fn in rows:
+            dt, res = timed(fn)
+            print(f"{name:>7}: {dt * 1e3:9.1f} ms  seeds={len(res.seeds)} invalid={len(res.errors)} parsed={res.parsed}")
+
+        p = root / "seed_00000.wfl"
+        p.write_text(p.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+        dt, res = timed(lambda: load_seeds(d, workers=args.workers))
+        print(f"{'touch1':>7}: {dt * 1e3:9.1f} ms  seeds={len(res.seeds)} invalid={len(res.errors)} parsed={res.parsed}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+semantic_validate_workflow latency on random valid workflows of growing size.
+Time per step should stay flat as the workflow grows (single linear traversal).
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_semantic_validate.py --sizes 100 1000 10000
+"""
+import argparse, random, time
+
+from synth.utils.semantic_validate import semantic_validate_workflow
+from synth.utils.wfl_factory import random_workflow
+
+def count_steps(seq) -> int:
+    n = 0
+    for s in seq:
+        n += 1
+        if s.get("workflowStepType") == 2:
+            n += count_steps(s.get("positiveOutcome") or []) + count_steps(s.get("negativeOutcome") or [])
+    return n
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'top-level':>10} {'steps':>8} {'best ms':>10} {'us/step':>9}")
+    for size in args.sizes:
+        wf = random_workflow(rng, n_steps=size)
+        steps = count_steps(wf["workflowSteps"])
+        best = float("inf")
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            semantic_validate_workflow(wf)
+            best = min(best, time.perf_counter() - t)
+        print(f"{size:>10} {steps:>8} {best * 1e3:>10.2f} {best * 1e6 / steps:>9.2f}")
+
+if __name__ == "__main__":
+    main()
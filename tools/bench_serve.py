@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Inference server (training/serve.py) on CPU, end to end over HTTP:
+  setup    - a tiny Llama is fitted on synthetic rows prompted with render_prompt (the prompt the
+             server uses), saved as the base model, and a LoRA adapter trained for --lora-steps on
+             top of it is saved like train_sft's output_dir; load_model serves base + merged adapter
+  parity   - the server's completions, all requests at once, against model.generate() + JsonStop
+             one row at a time: same outcome, workflow and token count (greedy, so only float
+             noise in the batched matmuls can make them differ)
+  load     - --requests requests arriving as a Poisson process at --rate per second, served with
+             max_batch=1 (one request at a time) and max_batch=--max-batch (continuous batching);
+             p50/p99 latency and time to first token, completion tokens/s, pass rate
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_serve.py --requests 64 --rate 8
+"""
+import argparse, http.client, json, os, random, tempfile, threading, time
+
+import torch
+from peft import LoraConfig, get_peft_model
+from transformers import AutoModelForCausalLM, StoppingCriteriaList
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("WFL_SCHEMA_PATH", os.path.join(ROOT, "data", "schema", "wfl.schema.json"))
+
+from bench_sft_packing import synthetic_rows, tiny_model, train_tokenizer
+from training.serve import Engine, _pct, check_workflow, load_model, make_server
+from training.sft.eval_wfl import render_prompt
+from training.sft.packing import PackedCollator, batch_order
+from training.sft.stopping import JsonStop
+
+def served_text(row) -> str:
+    return render_prompt(row["input"]) + json.dumps(row["output"], sort_keys=True) + "\n</json>\n"
+
+def fit(model, tok, rows, steps: int, lr: float):
+    """bench_eval_pass_rate.fit on render_prompt rows instead of the format_prompt token cache."""
+    ds = [{"input_ids": tok(served_text(r))["input_ids"] + [tok.eos_token_id]} for r in rows]
+    for d in ds:
+        d["seq_lengths"] = [len(d["input_ids"])]
+    collator = PackedCollator(tok.pad_token_id)
+    opt = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=lr)
+    model.train()
+    done = 0
+    while done < steps:
+        for b in batch_order([len(d["input_ids"]) for d in ds], 4, False, seed=done):
+            loss = model(**collator([ds[i] for i in b]), use_cache=False).loss
+            loss.backward()
+            opt.step()
+            opt.zero_grad()
+            done += 1
+            if done % 100 == 0:
+                print(f"  fit step {done}: loss {loss.item():.3f}")
+            if done >= steps:
+                break
+    model.eval()
+
+def setup(args, workdir: str):
+    train = synthetic_rows(400, args.seed)
+    tok = train_tokenizer([served_text(r) for r in train], 4096)
+    model = tiny_model(tok, 4096, "sdpa", hidden=args.hidden)
+    fit(model, tok, train, args.fit_steps, 3e-3)
+    base = os.path.join(workdir, "base")
+    model.save_pretrained(base)
+    tok.save_pretrained(base)
+    lora = get_peft_model(AutoModelForCausalLM.from_pretrained(base),
+                          LoraConfig(r=8, lora_alpha=16, lora_dropout=0.0, bias="none", task_type="CAUSAL_LM"))
+    fit(lora, tok, train, args.lora_steps, 1e-3)
+    adapter = os.path.join(workdir, "adapter")
+    lora.save_pretrained(adapter)
+    tok.save_pretrained(adapter)
+    return adapter, lora
+
+def post(port: int, path: str, payload=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    if payload is None:
+        conn.request("GET", path)
+    else:
+        conn.request("POST", path, body=json.dumps(payload), headers={"Content-Type": "application/json"})
+    res = json.loads(conn.getresponse().read())
+    conn.close()
+    return res
+
+@torch.no_grad()
+def reference(model, tok, rows, max_new_tokens: int):
+    outs = []
+    for r in rows:
+        enc = tok(render_prompt(r["input"]), return_tensors="pt")
+        n = enc["input_ids"].shape[1]
+        out = model.generate(**enc, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tok.pad_token_id,
+                             stopping_criteria=StoppingCriteriaList([JsonStop(tok, n)]))
+        outs.append((tok.decode(out[0, n:], skip_special_tokens=True), out.shape[1] - n))
+    return outs
+
+def load(model, tok, rows, max_batch: int, rate: float, max_new_tokens: int, constrained: bool, seed: int):
+    engine = Engine(model, tok, max_batch, max_new_tokens, constrained).start()
+    srv = make_server(engine, "127.0.0.1", 0)
+    port = srv.server_address[1]
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    assert post(port, "/health")["status"] == "ok"
+    rng = random.Random(seed)
+    results = [None] * len(rows)
+    def client(i, row):
+        t = time.perf_counter()
+        results[i] = post(port, "/generate", {"input": row["input"]})
+        results[i]["client_s"] = time.perf_counter() - t
+    threads, t0 = [], time.perf_counter()
+    for i, row in enumerate(rows):
+        time.sleep(rng.expovariate(rate))
+        threads.append(threading.Thread(target=client, args=(i, row)))
+        threads[-1].start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    server = post(port, "/metrics")
+    srv.shutdown()
+    srv.server_close()
+    engine.stop()
+    return wall, results, server
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=64)
+    ap.add_argument("--rate", type=float, default=8.0, help="mean arrivals per second")
+    ap.add_argument("--max-batch", type=int, default=8)
+    ap.add_argument("--max-new-tokens", type=int, default=768)
+    ap.add_argument("--parity-rows", type=int, default=8)
+    ap.add_argument("--fit-steps", type=int, default=600)
+    ap.add_argument("--lora-steps", type=int, default=50)
+    ap.add_argument("--hidden", type=int, default=128)
+    ap.add_argument("--constrained", action="store_true")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        t = time.perf_counter()
+        adapter, lora = setup(args, workdir)
+        t_setup = time.perf_counter() - t
+        t = time.perf_counter()
+        model, tok = load_model(adapter)
+        print(f"   setup: fit + save {t_setup:.1f}s, load_model {time.perf_counter() - t:.1f}s")
+        ids = tok(render_prompt("create a workflow with 3 steps"), return_tensors="pt")
+        with torch.no_grad():
+            diff = (model(**ids).logits - lora(**ids).logits).abs().max().item()
+        print(f"          merged vs unmerged adapter: max |logit diff| {diff:.2e}")
+
+    rows = synthetic_rows(args.requests, args.seed + 1)
+    ref = reference(model, tok, rows[:args.parity_rows], args.max_new_tokens)
+    wall, results, _ = load(model, tok, rows[:args.parity_rows], args.max_batch, 1e3, args.max_new_tokens,
+                            False, args.seed)
+    same = 0
+    for (text, n), res in zip(ref, results):
+        c = check_workflow(text)
+        same += (c["reason"], c["workflow"], n) == (res["reason"], res["workflow"], res["completion_tokens"])
+    print(f"  parity: {same}/{len(ref)} workflows identical to generate() + JsonStop")
+
+    for max_batch in sorted({1, args.max_batch}):
+        wall, results, server = load(model, tok, rows, max_batch, args.rate, args.max_new_tokens,
+                                     args.constrained, args.seed)
+        latency = [r["client_s"] for r in results]
+        ttft = [r["ttft_s"] for r in results]
+        tokens = sum(r["completion_tokens"] for r in results)
+        ok = sum(r["ok"] for r in results)
+        print(f"max_batch={max_batch}: {wall:6.1f}s  latency p50 {_pct(latency, 0.5):6.2f}s p99 {_pct(latency, 0.99):6.2f}s  "
+              f"ttft p50 {_pct(ttft, 0.5):6.2f}s  {tokens / wall:7.1f} tokens/s  {tokens / len(rows):.0f} tokens/request  "
+              f"ok {ok}/{len(rows)}")
+        print(f"          /metrics: {json.dumps({k: round(v, 3) if isinstance(v, float) else v for k, v in server.items()})}")
+
+if __name__ == "__main__":
+    main()
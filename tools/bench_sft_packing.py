@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+SFT batching modes (training/sft/packing.py) on CPU:
+  padding   - rows, batches and padding ratio for none / bucket / pack at the training batch size
+  isolation - a tiny random Llama scores a packed row and the same examples one by one; the max
+              logit difference must be ~0 (and is large with plain, non-restarting position_ids)
+  speed     - --steps optimizer steps per mode, real (non-pad) tokens per second
+
+Rows are SFT texts from --data (train.jsonl) or synthetic requests with random workflows; the
+tokenizer is --tokenizer or a small byte-level BPE trained on the rows. --save-tiny DIR writes the
+tiny model and tokenizer, usable as train_sft.py --base_model_id DIR --bnb_4bit false.
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_sft_packing.py --rows 2000 --steps 10
+"""
+import argparse, json, random, time
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+from synth.utils.wfl_factory import random_workflow
+from training.sft.packing import PACKING_MODES, PackedCollator, SFTRows, batch_order, padding_stats
+from training.sft.token_cache import build, example_text
+
+def synthetic_rows(n: int, seed: int):
+    rng = random.Random(seed)
+    # most requests compile to short workflows, a few to long ones
+    return [{"input": f"create a workflow with {k} steps for case {i}",
+             "output": random_workflow(rng, n_steps=k)}
+            for i, k in enumerate(min(1 + int(rng.expovariate(1 / 2)), 12) for _ in range(n))]
+
+def train_tokenizer(texts, vocab_size: int):
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    t = Tokenizer(models.BPE())
+    t.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    t.decoder = decoders.ByteLevel()
+    t.train_from_iterator(texts, trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=["<pad>", "<eos>"],
+                                                     initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    return PreTrainedTokenizerFast(tokenizer_object=t, eos_token="<eos>", pad_token="<pad>",
+                                   model_input_names=["input_ids", "attention_mask"])
+
+def tiny_model(tok, max_length: int, attn: str, hidden: int = 64, layers: int = 2):
+    torch.manual_seed(0)
+    cfg = LlamaConfig(vocab_size=len(tok), hidden_size=hidden, intermediate_size=2 * hidden, num_hidden_layers=layers,
+                      num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=max_length,
+                      bos_token_id=None, eos_token_id=tok.eos_token_id, pad_token_id=tok.pad_token_id,
+                      attn_implementation=attn)
+    return LlamaForCausalLM(cfg)
+
+@torch.no_grad()
+def isolation(model, collator, ids) -> tuple:
+    """Max |logit| difference between a packed row and the same examples run alone."""
+    model.eval()
+    row = {"input_ids": [t for x in ids for t in x], "seq_lengths": [len(x) for x in ids]}
+    batch = collator([row])
+    packed = model(input_ids=batch["input_ids"], position_ids=batch["position_ids"], use_cache=False).logits[0]
+    naive = model(input_ids=batch["input_ids"], use_cache=False).logits[0]
+    alone = torch.cat([model(input_ids=torch.tensor([x]), use_cache=False).logits[0] for x in ids])
+    return (packed - alone).abs().max().item(), (naive - alone).abs().max().item()
+
+def speed(model, collator, ds, batch_size: int, group: bool, steps: int) -> float:
+    model.train()
+    opt = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    batches = batch_order(ds.lengths(), batch_size, group)[:steps]
+    tokens, t = 0, time.perf_counter()
+    for b in batches:
+        batch = collator([ds[i] for i in b])
+        loss = model(**batch, use_cache=False).loss
+        loss.backward()
+        opt.step()
+        opt.zero_grad()
+        tokens += sum(len(ds[i]["input_ids"]) for i in b)
+    return tokens / (time.perf_counter() - t)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", default=None, help="SFT JSONL ({input, output} rows); default synthetic")
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--tokenizer", default=None, help="tokenizer id/path; default a BPE trained on the rows")
+    ap.add_argument("--vocab", type=int, default=4096)
+    ap.add_argument("--max-length", type=int, default=2048)
+    ap.add_argument("--batch-size", type=int, default=4)
+    ap.add_argument("--steps", type=int, default=10, help="training steps per mode for the speed check (0 = skip)")
+    ap.add_argument("--attn", default="sdpa", choices=("sdpa", "eager"))
+    ap.add_argument("--save-tiny", default=None, metavar="DIR")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.data:
+        with open(args.data, "r", encoding="utf-8") as f:
+            rows = [json.loads(l) for l in f if l.strip()][:args.rows]
+    else:
+        rows = synthetic_rows(args.rows, args.seed)
+    texts = [example_text(r) for r in rows]
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tok = AutoTokenizer.from_pretrained(args.tokenizer)
+        if tok.pad_token is None:
+            tok.pad_token = tok.eos_token
+    else:
+        tok = train_tokenizer(texts, args.vocab)
+    cache = build(tok, rows, args.max_length)
+    ids = [cache.example(i)[0].tolist() for i in range(len(cache))]
+    lengths = sorted(len(x) for x in ids)
+    print(f"{len(ids)} examples, tokens median {lengths[len(lengths) // 2]} p90 {lengths[int(len(lengths) * 0.9)]} "
+          f"max {lengths[-1]}, max_length {args.max_length}, batch {args.batch_size}")
+
+    print(f"{'mode':>7} {'rows':>6} {'batches':>8} {'padding':>8} {'slots vs none':>14}")
+    base = None
+    for mode in PACKING_MODES:
+        s = padding_stats([len(x) for x in ids], mode, args.max_length, args.batch_size, args.seed)
+        base = base or s["slots"]
+        print(f"{mode:>7} {s['rows']:>6} {s['batches']:>8} {s['padding']:>7.1%} {s['slots'] / base:>13.2f}x")
+
+    collator = PackedCollator(tok.pad_token_id)
+    model = tiny_model(tok, args.max_length, args.attn)
+    fit = [x for x in ids[:64] if len(x) < args.max_length // 8][:4]
+    diff, naive = isolation(model, collator, fit)
+    print(f"isolation ({args.attn}, {len(fit)} examples in one row): max |logit diff| {diff:.2e} "
+          f"(without position resets {naive:.2e})")
+
+    if args.steps:
+        for mode in PACKING_MODES:
+            ds = SFTRows(cache, mode, args.max_length)
+            tps = speed(tiny_model(tok, args.max_length, args.attn), collator, ds,
+                        args.batch_size, mode == "bucket", args.steps)
+            print(f"{mode:>7}: {tps:,.0f} real tokens/s over {args.steps} steps")
+
+    if args.save_tiny:
+        model.save_pretrained(args.save_tiny)
+        tok.save_pretrained(args.save_tiny)
+        print(f"saved tiny model and tokenizer to {args.save_tiny}")
+
+if __name__ == "__main__":
+    main()
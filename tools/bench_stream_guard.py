@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Teacher time / characters saved by the streaming guard, against the local mock server:
+  full    - BoundedClient.achat: every response is received in full before validation
+  stream  - BoundedClient.astream read to the end, no guard: the transport the guard runs on
+  guarded - aguarded_chat over BoundedClient.astream: cancelled at the first certain violation
+The guard's saving is guarded against stream; full against stream is the cost of streaming itself.
+
+A --bad fraction of the responses are mutants (synth.mutate, all rules); only some rules are
+detectable mid-stream, the rest are caught by the normal validation afterwards.
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_stream_guard.py --requests 64 --bad 0.5 --latency 2.0
+"""
+import argparse, asyncio, json, random, time
+from collections import Counter
+
+from synth.engine import BoundedClient
+from synth.mutate import mutate
+from synth.providers.mock_server import MockServer
+from synth.providers.openai_client import OpenAIClient
+from synth.utils.stream_guard import StreamAbort, aguarded_chat
+from synth.utils.wfl_factory import random_workflow
+
+def make_responses(n: int, bad: float, steps: int, seed: int):
+    rng = random.Random(seed)
+    out, rules = [], []
+    for _ in range(n):
+        wf, rule = random_workflow(rng, n_steps=steps), None
+        if rng.random() < bad:
+            m = mutate(wf, rng)
+            if m is not None:
+                wf, rule = m
+        out.append("<json>\n" + json.dumps(wf, indent=2) + "\n</json>")
+        rules.append(rule)
+    return out, rules
+
+MODES = ("full", "stream", "guarded")
+
+def bench(srv: MockServer, n: int, conc: int, mode: str):
+    client = OpenAIClient(model="mock", api_key="x", base_url=srv.base_url, max_connections=conc)
+    aborts = Counter()
+    async def one(bounded, i):
+        if mode == "full":
+            return await bounded.achat("sys", f"req {i}", temperature=0.0, top_p=1.0)
+        if mode == "stream":
+            return "".join([c async for c in bounded.astream("sys", f"req {i}", temperature=0.0, top_p=1.0)])
+        try:
+            return await aguarded_chat(bounded, "sys", f"req {i}", temperature=0.0, top_p=1.0)
+        except StreamAbort as e:
+            aborts[e.diagnostic.rule] += 1
+    async def run():
+        bounded = BoundedClient(client, conc)
+        try:
+            await asyncio.gather(*(one(bounded, i) for i in range(n)))
+        finally:
+            await bounded.aclose()
+    t = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - t, aborts
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=64)
+    ap.add_argument("--bad", type=float, default=0.5, help="fraction of mutated responses")
+    ap.add_argument("--steps", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=2.0, help="seconds per full response")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--chunk-chars", type=int, default=64, help="characters per streamed event")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    texts, rules = make_responses(args.requests, args.bad, args.steps, args.seed)
+    by_prompt = {f"req {i}": t for i, t in enumerate(texts)}
+    total = sum(map(len, texts))
+    print(f"{args.requests} responses, {total / len(texts):.0f} chars avg, "
+          f"mutated by rule: {dict(Counter(r for r in rules if r))}")
+
+    srv = MockServer(latency=args.latency, responder=lambda system, user: by_prompt[user],
+                     stream_chunk_chars=args.chunk_chars).start()
+    try:
+        times = {}
+        for mode in MODES:
+            c0 = srv.streamed_chars
+            times[mode], aborts = bench(srv, args.requests, args.concurrency, mode)
+            sent = srv.streamed_chars - c0 if mode != "full" else total
+            print(f"{mode:>7}: {times[mode]:.2f}s, chars received {sent} "
+                  f"({sent / total:.0%}), aborted {sum(aborts.values())} {dict(aborts)}")
+        print(f"  guard vs stream: {times['guarded'] / times['stream'] - 1:+.0%} time; "
+              f"stream vs full: {times['stream'] / times['full'] - 1:+.0%} time")
+    finally:
+        srv.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+SFT dataset startup with and without the token cache (training/sft/token_cache.py):
+  tokenize  - parse the JSONL, format and tokenize every row (what each training job did before)
+  build     - the same plus writing the cache entry (first job, or the offline step)
+  hit       - hash the JSONL, map the entry and build the row view (every later job)
+plus the resident memory each leaves behind and the time to fetch one epoch of rows.
+
+Rows are synthetic (see bench_sft_packing.py) unless --data is given; the tokenizer is --tokenizer
+or a small byte-level BPE trained on the rows.
+
+Usage (from src/):  PYTHONPATH=. python ../tools/bench_token_cache.py --rows 20000
+"""
+import argparse, json, os, resource, shutil, tempfile, time
+
+from bench_sft_packing import synthetic_rows, train_tokenizer
+from training.sft.packing import SFTRows
+from training.sft.token_cache import build, example_text, jsonl_files, load_or_build, read_jsonl
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+
+def timed(fn):
+    m, t = rss_mb(), time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t, rss_mb() - m
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", default=None, help="SFT JSONL file or dir; default synthetic")
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--tokenizer", default=None)
+    ap.add_argument("--max-length", type=int, default=2048)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_token_cache_")
+    try:
+        data = args.data
+        if data is None:
+            data = os.path.join(work, "train.jsonl")
+            with open(data, "w", encoding="utf-8") as f:
+                for r in synthetic_rows(args.rows, args.seed):
+                    f.write(json.dumps(r) + "\n")
+        files = jsonl_files(data)
+        if args.tokenizer:
+            from transformers import AutoTokenizer
+            tok = AutoTokenizer.from_pretrained(args.tokenizer)
+        else:
+            tok = train_tokenizer((example_text(r) for r in read_jsonl(files)[:2000]), 4096)
+        size = sum(os.path.getsize(p) for p in files) / 2**20
+        cache_dir = os.path.join(work, "cache")
+
+        def epoch(ds):
+            return sum(len(ds[i]["input_ids"]) for i in range(len(ds)))
+
+        print(f"{size:.1f} MB of JSONL in {len(files)} file(s)")
+        print(f"{'path':>9} {'startup s':>10} {'rss MB':>8} {'epoch fetch s':>14}")
+        for name, fn in (
+            ("tokenize", lambda: SFTRows(build(tok, read_jsonl(files), args.max_length), "none", args.max_length)),
+            ("build", lambda: SFTRows(load_or_build(tok, data, args.max_length, lambda: read_jsonl(files), cache_dir),
+                                      "none", args.max_length)),
+            ("hit", lambda: SFTRows(load_or_build(tok, data, args.max_length, lambda: read_jsonl(files), cache_dir),
+                                    "none", args.max_length)),
+        ):
+            ds, dt, mem = timed(fn)
+            t = time.perf_counter()
+            tokens = epoch(ds)
+            print(f"{name:>9} {dt:>10.2f} {mem:>8.1f} {time.perf_counter() - t:>14.2f}")
+            del ds
+        print(f"{len(read_jsonl(files))} rows, {tokens} tokens")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Cross-split leakage check: indexes the training splits, then streams the eval splits against
+the index and reports every eval row whose request or workflow is already in training
+(exact prompt, exact workflow fingerprint, or near-paraphrase with the same workflow shape;
+see synth/leakage.py).
+
+By default, given a dataset directory: training = train.jsonl + pairs.jsonl, eval = val.jsonl +
+eval_pairs.jsonl (missing files are skipped). One JSONL record per leaked row goes to --report:
+  {"file": ..., "line": ..., "kind": "prompt|workflow|near", "train_file": ..., "train_line": ...}
+With --rewrite, leaked rows are removed from the eval files (rewritten in place, atomically) so
+the splits are disjoint. A per-file summary goes to stderr; the exit status is 1 if leaks remain.
+
+Usage (from the repo root):
+  PYTHONPATH=src python tools/check_leakage.py data/synth_r1 --report leaks.jsonl
+  PYTHONPATH=src python tools/check_leakage.py --train a/train.jsonl --eval a/val.jsonl --rewrite
+"""
+import argparse, json, os, pathlib, sys
+from array import array
+from collections import Counter
+
+from synth.dedupe import NearDeduper
+from synth.leakage import KEY_KINDS, LeakageIndex
+from synth.utils.json_utils import loads
+
+TRAIN_FILES = ("train.jsonl", "pairs.jsonl")
+EVAL_FILES = ("val.jsonl", "eval_pairs.jsonl")
+
+def iter_rows(path: pathlib.Path):
+    """(line number, raw line, row or None) for the non-blank lines of a JSONL file."""
+    with path.open("r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = loads(line)
+            except ValueError:
+                row = None
+            yield lineno, line, row if isinstance(row, dict) else None
+
+def build_index(paths, kinds, threshold: float):
+    index = LeakageIndex(kinds, NearDeduper(threshold=threshold) if "near" in kinds else None)
+    files, lines = array("H"), array("I")  # row index -> training file / line
+    for fi, p in enumerate(paths):
+        for lineno, _, row in iter_rows(p):
+            if row is not None:
+                index.add(row)
+                files.append(fi)
+                lines.append(lineno)
+    return index, files, lines
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("dataset_dir", nargs="?", default=None)
+    ap.add_argument("--train", nargs="+", default=None, help=f"training files (default: {' '.join(TRAIN_FILES)})")
+    ap.add_argument("--eval", nargs="+", default=None, help=f"eval files (default: {' '.join(EVAL_FILES)})")
+    ap.add_argument("--keys", default=",".join(KEY_KINDS), help="key kinds to check")
+    ap.add_argument("--threshold", type=float, default=0.8, help="near-duplicate Jaccard threshold")
+    ap.add_argument("--report", default=None, help="leaks JSONL path, '-' for stdout")
+    ap.add_argument("--rewrite", action="store_true", help="drop leaked rows from the eval files")
+    args = ap.parse_args(argv)
+
+    root = pathlib.Path(args.dataset_dir or ".")
+    def resolve(given, defaults):
+        paths = [pathlib.Path(p) for p in given] if given else [root / n for n in defaults]
+        missing = [p for p in paths if not p.exists()]
+        for p in missing:
+            print(f"skipping missing {p}", file=sys.stderr)
+        return [p for p in paths if p.exists()]
+    train_paths, eval_paths = resolve(args.train, TRAIN_FILES), resolve(args.eval, EVAL_FILES)
+    kinds = [k for k in args.keys.split(",") if k]
+    unknown = set(kinds) - set(KEY_KINDS)
+    if unknown:
+        ap.error(f"unknown key kinds {sorted(unknown)}; choose from {','.join(KEY_KINDS)}")
+    if not train_paths or not eval_paths:
+        ap.error("need at least one training and one eval file")
+
+    index, files, lines = build_index(train_paths, kinds, args.threshold)
+    print(f"indexed {index.size} training rows from {len(train_paths)} files", file=sys.stderr)
+
+    report = None
+    if args.report:
+        report = sys.stdout if args.report == "-" else open(args.report, "w", encoding="utf-8")
+    remaining = 0
+    try:
+        for p in eval_paths:
+            by_kind, rows = Counter(), 0
+            tmp = p.with_name(p.name + ".tmp")
+            out = tmp.open("w", encoding="utf-8") if args.rewrite else None
+            try:
+                for lineno, line, row in iter_rows(p):
+                    rows += 1
+                    leak = index.check(row) if row is not None else None
+                    if leak is None:
+                        if out is not None:
+                            out.write(line if line.endswith("\n") else line + "\n")
+                        continue
+                    by_kind[leak.kind] += 1
+                    if report is not None:
+                        report.write(json.dumps({"file": str(p), "line": lineno, "kind": leak.kind,
+                                                 "train_file": str(train_paths[files[leak.source]]),
+                                                 "train_line": lines[leak.source]}) + "\n")
+                if out is not None:
+                    out.close()
+                    os.replace(tmp, p)
+            finally:
+                if out is not None and not out.closed:
+                    out.close()
+                if tmp.exists():
+                    tmp.unlink()
+            leaked = sum(by_kind.values())
+            if not args.rewrite:
+                remaining += leaked
+            detail = ", ".join(f"{k} {by_kind[k]}" for k in KEY_KINDS if by_kind[k])
+            action = " (removed)" if args.rewrite and leaked else ""
+            print(f"{p}: {leaked}/{rows} rows leak{action}" + (f" - {detail}" if detail else ""), file=sys.stderr)
+    finally:
+        if report is not None and report is not sys.stdout:
+            report.close()
+    return 1 if remaining else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
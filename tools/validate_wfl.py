@@ -1,39 +1,153 @@
-import json, sys, re, pathlib
-from jsonschema import validate
-from jsonschema.exceptions import ValidationError
+#!/usr/bin/env python3
+"""
+Bulk schema + semantic validation of workflows across a process pool.
+
+Inputs may be directories (their *.wfl and *.jsonl files), glob patterns, .wfl/.json files and
+JSONL datasets. In JSONL rows the workflow is taken from the --fields keys (train/val rows keep it
+under "output", DPO pairs under "chosen"/"rejected"); a row with "workflowSteps" is a workflow.
+
+One JSONL result per workflow is streamed to --out (stdout by default), in input order:
+  {"source": ..., "line": ..., "field": ..., "ok": true|false, "errors": [{rule, pointer, message}]}
+A summary with the per-rule failure histogram goes to stderr.
+
+Usage (from the repo root):
+  PYTHONPATH=src python tools/validate_wfl.py seeds/ 'out/**/train.jsonl' out/pairs.jsonl --workers 8
+"""
+import argparse, glob, itertools, json, os, pathlib, sys
+from collections import Counter
+from multiprocessing import Pool
+
+from synth.utils.diagnostics import collect_workflow_errors
+from synth.utils.json_utils import extract_first_json_object, loads
+from synth.utils.schema_validator import load_validator
+from synth.utils.semantic_validate import semantic_validate_workflow
 
 SCHEMA_PATH = pathlib.Path("data/schema/wfl.schema.json")
+DEFAULT_FIELDS = ("output", "chosen")
 
 def load_json_from_wfl(p: pathlib.Path):
     s = p.read_text(encoding="utf-8", errors="replace")
-    i = s.find("{")
-    if i < 0:
-        raise ValueError(f"No JSON object found in {p}")
-    depth = 0; end = None
-    for j, ch in enumerate(s[i:], start=i):
-        if ch == "{": depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                end = j + 1; break
-    if end is None:
-        raise ValueError(f"Unbalanced braces in {p}")
-    return json.loads(s[i:end])
-
-def main(dir_path):
-    schema = json.loads(SCHEMA_PATH.read_text(encoding="utf-8"))
-    ok, fail = 0, 0
-    for p in pathlib.Path(dir_path).glob("*.wfl"):
+    try:
+        return extract_first_json_object(s)
+    except ValueError as e:
+        raise ValueError(f"{e} in {p}") from None
+
+def expand_inputs(inputs):
+    """Yields files in argument order: directories -> *.wfl + *.jsonl, globs expanded."""
+    for arg in inputs:
+        p = pathlib.Path(arg)
+        if p.is_dir():
+            yield from sorted(itertools.chain(p.glob("*.wfl"), p.glob("*.jsonl")))
+        elif any(c in arg for c in "*?["):
+            yield from (pathlib.Path(x) for x in sorted(glob.glob(arg, recursive=True)))
+        else:
+            yield p
+
+def iter_tasks(files):
+    """(source, line, payload) with payload a JSONL row (str) or None for a whole-file workflow."""
+    for p in files:
+        if p.suffix == ".jsonl":
+            with p.open("r", encoding="utf-8", errors="replace") as f:
+                for lineno, line in enumerate(f, 1):
+                    if line.strip():
+                        yield str(p), lineno, line
+        else:
+            yield str(p), None, None
+
+# per-process state, set by _init
+_VALIDATOR = None
+_FIELDS = DEFAULT_FIELDS
+
+def _init(schema_path: str, fields):
+    global _VALIDATOR, _FIELDS
+    _VALIDATOR = load_validator(schema_path)
+    _FIELDS = tuple(fields)
+
+def _result(source, line, field, obj):
+    try:
+        if _VALIDATOR.is_valid(obj):
+            semantic_validate_workflow(obj)
+            return {"source": source, "line": line, "field": field, "ok": True, "errors": []}
+    except Exception:
+        pass
+    # failing workflows only: collect every violation rather than the first
+    errors = [d._asdict() for d in collect_workflow_errors(obj, _VALIDATOR.schema)]
+    return {"source": source, "line": line, "field": field, "ok": not errors, "errors": errors}
+
+def _parse_error(source, line, field, e):
+    return {"source": source, "line": line, "field": field, "ok": False,
+            "errors": [{"rule": "json", "pointer": "", "message": str(e)}]}
+
+def check(task):
+    """Validates one task; returns a list of results (a JSONL row may hold several workflows)."""
+    source, line, payload = task
+    if payload is None:
         try:
-            obj = load_json_from_wfl(p)
-            validate(instance=obj, schema=schema)
-            print(f"[OK]   {p.name}")
-            ok += 1
-        except (ValidationError, ValueError, json.JSONDecodeError) as e:
-            print(f"[FAIL] {p.name}: {e}")
-            fail += 1
-    print(f"\nSummary: {ok} valid, {fail} invalid")
+            obj = load_json_from_wfl(pathlib.Path(source))
+        except (ValueError, OSError) as e:
+            return [_parse_error(source, None, None, e)]
+        return [_result(source, None, None, obj)]
+    try:
+        row = loads(payload)
+    except ValueError as e:
+        return [_parse_error(source, line, None, e)]
+    if isinstance(row, dict) and "workflowSteps" in row:
+        return [_result(source, line, None, row)]
+    if not isinstance(row, dict):
+        return [_parse_error(source, line, None, ValueError("row is not a JSON object"))]
+    return [_result(source, line, f, row[f]) for f in _FIELDS if row.get(f) is not None]
+
+def run(tasks, schema_path: str, fields, workers: int, chunksize: int):
+    """Yields results in input order; at most a bounded window of tasks is queued at once."""
+    if workers <= 1:
+        _init(schema_path, fields)
+        for t in tasks:
+            yield from check(t)
+        return
+    window = workers * chunksize * 4
+    with Pool(workers, initializer=_init, initargs=(schema_path, fields)) as pool:
+        while True:
+            batch = list(itertools.islice(tasks, window))
+            if not batch:
+                break
+            for res in pool.imap(check, batch, chunksize=chunksize):
+                yield from res
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("inputs", nargs="*", default=["."])
+    ap.add_argument("--schema", default=str(SCHEMA_PATH))
+    ap.add_argument("--fields", default=",".join(DEFAULT_FIELDS),
+                    help="JSONL row keys holding workflows (add 'rejected' to audit DPO negatives)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunksize", type=int, default=16)
+    ap.add_argument("--out", default="-", help="results JSONL path, '-' for stdout")
+    args = ap.parse_args(argv)
+
+    fields = [f for f in args.fields.split(",") if f]
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    ok, fail = 0, 0
+    by_rule = Counter()
+    try:
+        tasks = iter_tasks(expand_inputs(args.inputs))
+        for r in run(tasks, args.schema, fields, args.workers, args.chunksize):
+            out.write(json.dumps(r, ensure_ascii=False) + "\n")
+            if r["ok"]:
+                ok += 1
+            else:
+                fail += 1
+                by_rule.update({e["rule"] for e in r["errors"]})
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"\nSummary: {ok} valid, {fail} invalid", file=sys.stderr)
+    if by_rule:
+        width = max(map(len, by_rule))
+        print("Failing workflows per rule:", file=sys.stderr)
+        for rule, n in by_rule.most_common():
+            print(f"  {rule:<{width}}  {n}", file=sys.stderr)
     return 0 if fail == 0 else 1
 
 if __name__ == "__main__":
-    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else "."))
\ No newline at end of file
+    sys.exit(main())